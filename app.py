@@ -6,13 +6,36 @@ from datetime import datetime
 import os
 import tempfile
 import config
-from speech_server import transcribe_audio
+from transcription_jobs import QueueFull, TranscriptionJobQueue
+from transcription_cache import TranscriptionCache
+from speech_server import engine_class, engine_version, to_pcm
+from speaker_verification import (VOICEPRINT_SIZE, NotEnoughSpeech, VoiceprintIndex, load_vector, vector_bytes,
+                                  vector_from_bytes, voiceprint)
+from face_verification import EMBEDDING_SIZE, FaceIndex, NoFaceFound, embedding
+from streaming_transcription import StreamingSession, advance_session, prune_sessions, session_text
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from media_store import create_media_store
+from recording import (AttemptRecording, ChecksumMismatch, ChunkTooLarge, RecordingFinalized, frame_sequence,
+                       read_index_bytes)
+from audit_log import BatchedAuditLogger
+from timeline import build_timeline, to_epoch_ms
+from retention import RetentionManager, RetentionPolicy, disk_usage_fraction
+from recording_profiles import IngestMonitor, RecordingProfileController
 import sqlite3
 import random
+import zipfile
+from werkzeug.http import parse_range_header
 
 app = Flask(__name__)
 app.secret_key = config.SECRET_KEY
 
+# Proctoring media is read and written through the store; raw chunks are staged per attempt
+media_store = create_media_store(
+    config.MEDIA_STORE_BACKEND,
+    config.MEDIA_STORE_PATH or os.path.join(app.root_path, 'uploads', 'media'),
+    config.MEDIA_STAGING_PATH or os.path.join(app.root_path, 'uploads')
+)
+
 # Database connection
 def get_db_connection():
     if config.DATABASE_URL:
@@ -274,6 +297,9 @@ def face_voice_auth():
 
 @app.route('/save_auth', methods=['POST'])
 def save_auth():
+    rejected = _reject_upload_if_disk_full()
+    if rejected:
+        return rejected
     try:
         username = request.form['username']
         face_image = request.files['face']
@@ -307,11 +333,337 @@ def save_auth():
         conn.commit()
         conn.close()
 
-        return jsonify({'success': True})
+        enrolled, message = _enroll_voiceprint(username, voice_sample_path)
+        face_enrolled, face_message = _enroll_face(username, face_image_path)
+        return jsonify({
+            'success': True,
+            'voiceprint': enrolled,
+            'voiceprint_message': message,
+            'face': face_enrolled,
+            'face_message': face_message
+        })
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+# -------------------- Speaker verification --------------------
+
+# Pre-manifest location of an attempt's latest voice check
+VOICE_CHECK_FILE = 'voice_check.npy'
+
+voiceprints = VoiceprintIndex(os.path.join(app.root_path, 'uploads', 'auth_data'))
+
+
+def _enroll_voiceprint(username, voice_sample_path):
+    """Compute and store a user's voiceprint; returns (enrolled, message)."""
+    try:
+        voiceprints.enroll(username, voiceprint(to_pcm(voice_sample_path)))
+        return True, None
+    except NotEnoughSpeech as e:
+        return False, str(e)
+    except Exception as e:
+        print(f"Voiceprint enrollment failed for {username}: {e}")
+        return False, 'Voice sample could not be processed'
+
+
+def _log_identity_event(attempt_id, event_type):
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute(
+        "INSERT INTO proctoring_logs(attempt_id, event_type, timestamp) VALUES(?, ?, ?)",
+        (attempt_id, event_type, datetime.utcnow())
+    )
+    conn.commit()
+    conn.close()
+
+
+def _save_identity_check(attempt_id, key, vector):
+    """Keep an attempt's latest check vector in the media store, named by its manifest."""
+    digest = media_store.put_bytes(vector_bytes(vector))
+    media_store.update_manifest(attempt_id, lambda manifest: manifest.update({key: digest}))
+
+
+def _load_identity_check(attempt_id, key, legacy_file, size, manifest=None):
+    if manifest is None:
+        manifest = media_store.read_manifest(attempt_id) or {}
+    if manifest.get(key):
+        return vector_from_bytes(media_store.get_bytes(manifest[key]), size)
+    return load_vector(os.path.join(media_store.staging_dir(attempt_id), legacy_file), size)
+
+
+def _read_voice_sample():
+    if request.mimetype == 'application/octet-stream':
+        return request.stream.read(config.VOICE_CHECK_MAX_BYTES + 1)
+    sample = request.files.get('voice')
+    return sample.read(config.VOICE_CHECK_MAX_BYTES + 1) if sample else b''
+
+
+@app.route('/voice/verify', methods=['POST'])
+@require_login('student')
+def voice_verify():
+    """
+    Compare a fresh voice sample (raw body or multipart 'voice') with the
+    student's enrolled voiceprint. With an exam_id the sample's print is kept
+    for cohort audits and a mismatch is logged as a proctoring event.
+    """
+    if (request.content_length or 0) > config.VOICE_CHECK_MAX_BYTES:
+        return jsonify({'success': False, 'message': 'Voice sample is too large'}), 413
+    try:
+        exam_id = request.args.get('exam_id', type=int) or request.form.get('exam_id', type=int)
+        data = _read_voice_sample()
+        if not data:
+            return jsonify({'success': False, 'message': 'No voice sample provided'}), 400
+        # Chunked uploads carry no Content-Length, so their size is only known once read
+        if len(data) > config.VOICE_CHECK_MAX_BYTES:
+            return jsonify({'success': False, 'message': 'Voice sample is too large'}), 413
+        try:
+            vector = voiceprint(to_pcm(data))
+        except NotEnoughSpeech as e:
+            return jsonify({'success': False, 'message': str(e)}), 422
+
+        score, calibrated = voiceprints.verify(session['username'], vector)
+        if score is None:
+            return jsonify({'success': False, 'message': 'No enrolled voice sample for this account'}), 404
+        # Scores only mean something once there is a cohort to normalise against
+        verified = score >= config.VOICE_MATCH_THRESHOLD if calibrated else None
+
+        if exam_id:
+            attempt_id = ensure_attempt(session['id'], exam_id)
+            _save_identity_check(attempt_id, 'voice_check', vector)
+            if verified is False:
+                _log_identity_event(attempt_id, 'voice_mismatch')
+
+        return jsonify({
+            'success': True,
+            'verified': verified,
+            'score': round(score, 3),
+            'threshold': config.VOICE_MATCH_THRESHOLD,
+            'calibrated': calibrated
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+
+@app.route('/admin/voiceprints/enroll', methods=['POST'])
+@require_login('teacher')
+def enroll_voiceprints():
+    """Build voiceprints for users who saved a voice sample before verification existed."""
+    force = request.args.get('force') == '1'
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT username, voice_sample_path FROM users WHERE voice_sample_path IS NOT NULL")
+    users = cur.fetchall()
+    conn.close()
+    summary = {'enrolled': 0, 'skipped': 0, 'failed': []}
+    for user in users:
+        if not force and voiceprints.enrolled(user['username']):
+            summary['skipped'] += 1
+            continue
+        if not os.path.exists(user['voice_sample_path']):
+            summary['failed'].append({'username': user['username'], 'message': 'Voice sample file is missing'})
+            continue
+        enrolled, message = _enroll_voiceprint(user['username'], user['voice_sample_path'])
+        if enrolled:
+            summary['enrolled'] += 1
+        else:
+            summary['failed'].append({'username': user['username'], 'message': message})
+    return jsonify({'success': True, **summary})
+
+
+@app.route('/admin/voice_audit/<int:exam_id>')
+@require_login('teacher')
+def voice_audit(exam_id):
+    """Score every attempt's latest voice check against all enrolled voices at once."""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT a.id AS attempt_id, u.username FROM exam_attempts a JOIN users u ON u.id = a.student_id WHERE a.exam_id = ?",
+        [exam_id]
+    )
+    attempts = cur.fetchall()
+    conn.close()
+    checks = []
+    for attempt in attempts:
+        vector = _load_identity_check(attempt['attempt_id'], 'voice_check', VOICE_CHECK_FILE, VOICEPRINT_SIZE)
+        if vector is not None:
+            checks.append((attempt['attempt_id'], attempt['username'], vector))
+    results, calibrated, elapsed_ms = voiceprints.audit(checks, config.VOICE_MATCH_THRESHOLD)
+    for result in results:
+        result['attempt_id'] = result.pop('key')
+    return jsonify({
+        'success': True,
+        'exam_id': exam_id,
+        'checked': len(results),
+        'unchecked': len(attempts) - len(results),
+        'calibrated': calibrated,
+        'threshold': config.VOICE_MATCH_THRESHOLD,
+        'elapsed_ms': elapsed_ms,
+        'results': results
+    })
+
+
+# -------------------- Face verification --------------------
+
+# Pre-manifest location of an attempt's latest face check
+FACE_CHECK_FILE = 'face_check.npy'
+
+faces = FaceIndex(os.path.join(app.root_path, 'uploads', 'face_index'))
+
+
+def _enroll_face(username, face_image_path):
+    """Compute and store a user's face embedding; returns (enrolled, message)."""
+    try:
+        faces.enroll(username, embedding(face_image_path))
+        return True, None
+    except NoFaceFound as e:
+        return False, str(e)
+    except Exception as e:
+        print(f"Face enrollment failed for {username}: {e}")
+        return False, 'Face image could not be processed'
+
+
+def _prune_faces():
+    """Drop indexed faces of users who are gone or whose auth data retention deleted."""
+    auth_root = os.path.join(app.root_path, 'uploads', 'auth_data')
+    keep = {username for username in _retention_usernames() if os.path.isdir(os.path.join(auth_root, username))}
+    return faces.prune(keep)
+
+
+def _read_face_frame():
+    if request.mimetype in ('application/octet-stream', 'image/jpeg', 'image/png'):
+        return request.stream.read(config.FACE_CHECK_MAX_BYTES + 1)
+    frame = request.files.get('frame')
+    return frame.read(config.FACE_CHECK_MAX_BYTES + 1) if frame else b''
+
+
+@app.route('/face/verify', methods=['POST'])
+@require_login('student')
+def face_verify():
+    """
+    Match a webcam frame (raw body or multipart 'frame') against the
+    student's own enrolled face. With an exam_id the frame's embedding is
+    kept for cohort audits and frames without a face are counted for them.
+    Either finding is only logged as a proctoring event when
+    FACE_MISMATCH_EVENTS or FACE_ABSENCE_EVENTS is on.
+    """
+    if (request.content_length or 0) > config.FACE_CHECK_MAX_BYTES:
+        return jsonify({'success': False, 'message': 'Frame is too large'}), 413
+    try:
+        exam_id = request.args.get('exam_id', type=int) or request.form.get('exam_id', type=int)
+        data = _read_face_frame()
+        if not data:
+            return jsonify({'success': False, 'message': 'No frame provided'}), 400
+        if len(data) > config.FACE_CHECK_MAX_BYTES:
+            return jsonify({'success': False, 'message': 'Frame is too large'}), 413
+        attempt_id = ensure_attempt(session['id'], exam_id) if exam_id else None
+        try:
+            vector = embedding(data)
+        except NoFaceFound:
+            if attempt_id:
+                media_store.update_manifest(attempt_id, _count_missing_face)
+                if config.FACE_ABSENCE_EVENTS:
+                    _log_identity_event(attempt_id, 'student_left_frame')
+            return jsonify({'success': True, 'face_found': False, 'verified': False,
+                            'advisory': not config.FACE_ABSENCE_EVENTS})
+        except OSError:
+            return jsonify({'success': False, 'message': 'Frame is not a readable image'}), 400
+
+        score, calibrated = faces.verify(session['username'], vector)
+        if score is None:
+            return jsonify({'success': False, 'message': 'No enrolled face image for this account'}), 404
+        # Scores only mean something once there is a cohort to centre against
+        verified = score >= config.FACE_MATCH_THRESHOLD if calibrated else None
+
+        if attempt_id:
+            _save_identity_check(attempt_id, 'face_check', vector)
+            if verified is False and config.FACE_MISMATCH_EVENTS:
+                _log_identity_event(attempt_id, 'face_mismatch')
+
+        return jsonify({
+            'success': True,
+            'face_found': True,
+            'verified': verified,
+            'score': round(score, 3),
+            'threshold': config.FACE_MATCH_THRESHOLD,
+            'calibrated': calibrated,
+            'advisory': not config.FACE_MISMATCH_EVENTS
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+
+def _count_missing_face(manifest):
+    manifest['face_missing'] = manifest.get('face_missing', 0) + 1
+    manifest['face_missing_at'] = datetime.utcnow().isoformat()
+
+
+@app.route('/admin/faces/enroll', methods=['POST'])
+@require_login('teacher')
+def enroll_faces():
+    """Add users who saved a face image before face checks existed to the face index."""
+    force = request.args.get('force') == '1'
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT username, face_image_path FROM users WHERE face_image_path IS NOT NULL")
+    users = cur.fetchall()
+    conn.close()
+    summary = {'enrolled': 0, 'skipped': 0, 'failed': [], 'pruned': _prune_faces()}
+    for user in users:
+        if not force and faces.enrolled(user['username']):
+            summary['skipped'] += 1
+            continue
+        if not os.path.exists(user['face_image_path']):
+            summary['failed'].append({'username': user['username'], 'message': 'Face image file is missing'})
+            continue
+        enrolled, message = _enroll_face(user['username'], user['face_image_path'])
+        if enrolled:
+            summary['enrolled'] += 1
+        else:
+            summary['failed'].append({'username': user['username'], 'message': message})
+    return jsonify({'success': True, **summary})
+
+
+@app.route('/admin/face_audit/<int:exam_id>')
+@require_login('teacher')
+def face_audit(exam_id):
+    """
+    Find the nearest enrolled face to every attempt's latest frame in one
+    lookup, and list attempts whose frames had no face in them.
+    """
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT a.id AS attempt_id, u.username FROM exam_attempts a JOIN users u ON u.id = a.student_id WHERE a.exam_id = ?",
+        [exam_id]
+    )
+    attempts = cur.fetchall()
+    conn.close()
+    checks, missing = [], []
+    for attempt in attempts:
+        manifest = media_store.read_manifest(attempt['attempt_id']) or {}
+        vector = _load_identity_check(attempt['attempt_id'], 'face_check', FACE_CHECK_FILE, EMBEDDING_SIZE, manifest)
+        if vector is not None:
+            checks.append((attempt['attempt_id'], attempt['username'], vector))
+        if manifest.get('face_missing'):
+            missing.append({'attempt_id': attempt['attempt_id'], 'username': attempt['username'],
+                            'frames': manifest['face_missing'], 'last_at': manifest['face_missing_at']})
+    results, calibrated, elapsed_ms = faces.audit(checks, config.FACE_MATCH_THRESHOLD)
+    for result in results:
+        result['attempt_id'] = result.pop('key')
+    return jsonify({
+        'success': True,
+        'exam_id': exam_id,
+        'checked': len(results),
+        'unchecked': len(attempts) - len(results),
+        'enrolled': len(faces),
+        'calibrated': calibrated,
+        'threshold': config.FACE_MATCH_THRESHOLD,
+        'elapsed_ms': elapsed_ms,
+        'results': results,
+        'face_missing': missing
+    })
+
+
 
 
 # Dedicated signup route rendering signup.html
@@ -504,6 +856,10 @@ def submit_assignment(assignment_id):
         if 'submission_file' in request.files:
             file = request.files['submission_file']
             if file.filename:
+                rejected = _reject_upload_if_disk_full()
+                if rejected:
+                    conn.close()
+                    return rejected
                 upload_dir = os.path.join(app.root_path, 'uploads', 'submissions')
                 os.makedirs(upload_dir, exist_ok=True)
                 filename = f"{session['id']}_{assignment_id}_{int(datetime.now().timestamp())}_{file.filename}"
@@ -884,64 +1240,286 @@ def autosave():
         return jsonify({'success': False, 'message': str(e)}), 500
 
 
+def _client_event_time(value, now):
+    # Clients send epoch milliseconds; fall back to server time for missing or implausible values
+    try:
+        ts = datetime.utcfromtimestamp(float(value) / 1000.0)
+    except (TypeError, ValueError, OverflowError, OSError):
+        return now
+    if (ts - now).total_seconds() > config.PROCTORING_LOG_MAX_CLOCK_SKEW:
+        return now
+    return ts
+
+
 @app.route('/proctoring/log', methods=['POST'])
 @require_login('student')
 def proctoring_log():
     try:
         payload = request.get_json(force=True)
         exam_id = int(payload['exam_id'])
-        event_type = payload['event_type']
-        
+        now = datetime.utcnow()
+
+        # Accept a buffered array of events, or a single legacy event
+        if 'events' in payload:
+            events = payload['events']
+            if not isinstance(events, list):
+                return jsonify({'success': False, 'message': 'events must be a list'}), 400
+        else:
+            events = [{'event_type': payload['event_type'], 'timestamp': payload.get('timestamp')}]
+        if len(events) > config.PROCTORING_LOG_MAX_BATCH:
+            return jsonify({'success': False, 'message': 'Too many events in one request'}), 413
+
+        rows = []
+        for event in events:
+            event_type = event.get('event_type') if isinstance(event, dict) else None
+            if not event_type:
+                continue
+            rows.append((event_type, _client_event_time(event.get('timestamp'), now)))
+        if not rows:
+            return jsonify({'success': True, 'stored': 0})
+
         attempt_id = ensure_attempt(session['id'], exam_id)
         
         conn = get_db_connection()
         cur = conn.cursor()
-        cur.execute(
+        cur.executemany(
             "INSERT INTO proctoring_logs(attempt_id, event_type, timestamp) VALUES(?, ?, ?)",
-            (attempt_id, event_type, datetime.utcnow())
+            [(attempt_id, event_type, ts) for event_type, ts in rows]
         )
         conn.commit()
         conn.close()
         
-        return jsonify({'success': True})
+        return jsonify({'success': True, 'stored': len(rows)})
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
 import threading
 
+import itertools
 import shutil
 
+audit_logger = BatchedAuditLogger(
+    get_db_connection,
+    batch_size=config.AUDIT_BATCH_SIZE,
+    flush_interval_ms=config.AUDIT_FLUSH_INTERVAL_MS,
+    max_queue=config.AUDIT_QUEUE_SIZE,
+    overflow=config.AUDIT_OVERFLOW,
+    block_timeout_ms=config.AUDIT_BLOCK_TIMEOUT_MS
+)
+
+
 def record_audit_event(event_name, status, related_id=None, related_type=None, details=None):
+    # Queued and written in batches by the audit logger's background thread
+    audit_logger.log(event_name, status, related_id, related_type, details)
 
-    try:
 
-        conn = get_db_connection()
-        cur = conn.cursor()
+# Peak memory while assembling or storing a video is bounded by this buffer
+VIDEO_COPY_BUFFER_SIZE = 256 * 1024
 
-        cur.execute(
 
-            """
+def _copy_range(src_fd, dest_fd, offset, count):
+    return os.copy_file_range(src_fd, dest_fd, count, offset)
 
-            INSERT INTO audit_events(event_name, status, related_id, related_type, details)
 
-            VALUES (?, ?, ?, ?, ?)
+def _sendfile(src_fd, dest_fd, offset, count):
+    return os.sendfile(dest_fd, src_fd, offset, count)
 
-            """,
 
-            (event_name, status, related_id, related_type, details)
+def _pread_write(src_fd, dest_fd, offset, count):
+    data = os.pread(src_fd, min(count, VIDEO_COPY_BUFFER_SIZE), offset)
+    view = memoryview(data)
+    while view:
+        written = os.write(dest_fd, view)
+        view = view[written:]
+    return len(data)
 
-        )
 
+def _write_stream(stream, path, prefix=b'', max_length=None):
+    """
+    Copy a request body to a new file in fixed-size blocks, straight to the
+    descriptor. `prefix` is bytes already read from the stream. A body longer
+    than `max_length` raises ChunkTooLarge and leaves no file behind.
+    """
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    written = 0
+    try:
+        for block in itertools.chain([prefix], iter(lambda: stream.read(VIDEO_COPY_BUFFER_SIZE), b'')):
+            written += len(block)
+            if max_length is not None and written > max_length:
+                raise ChunkTooLarge(f'Chunk is larger than {max_length} bytes')
+            view = memoryview(block)
+            while view:
+                view = view[os.write(fd, view):]
+    except ChunkTooLarge:
+        os.remove(path)
+        raise
+    finally:
+        os.close(fd)
+
+
+def _append_file(dest_fd, src_path):
+    """Append a file to dest_fd, copying in the kernel when the platform allows."""
+    with open(src_path, 'rb') as src:
+        src_fd = src.fileno()
+        size = os.fstat(src_fd).st_size
+        offset = 0
+        for copier in (_copy_range, _sendfile, _pread_write):
+            try:
+                while offset < size:
+                    copied = copier(src_fd, dest_fd, offset, size - offset)
+                    if copied == 0:
+                        break
+                    offset += copied
+            except (AttributeError, OSError):
+                # Not supported here (e.g. cross-device, non-Linux); try the next one
+                continue
+            if offset >= size:
+                return offset
+        raise IOError(f"Short copy from {src_path}: {offset} of {size} bytes")
+
+
+def _store_video_in_db(attempt_id, video_path):
+    """Write an assembled video into proctoring_videos without loading it in memory."""
+    size = os.path.getsize(video_path)
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor()
+        with open(video_path, 'rb') as f:
+            if config.DATABASE_URL:
+                # Postgres large object, referenced from proctoring_videos.video_oid
+                lobj = conn.lobject(0, 'wb')
+                for block in iter(lambda: f.read(VIDEO_COPY_BUFFER_SIZE), b''):
+                    lobj.write(block)
+                oid = lobj.oid
+                lobj.close()
+                cur.execute(
+                    "INSERT INTO proctoring_videos(attempt_id, video_oid) VALUES (%s, %s)",
+                    (attempt_id, oid)
+                )
+            else:
+                # Reserve the BLOB with zeroblob() and fill it through incremental I/O
+                cur.execute(
+                    "INSERT INTO proctoring_videos(attempt_id, video_blob) VALUES (?, zeroblob(?))",
+                    (attempt_id, size)
+                )
+                with conn.blobopen('proctoring_videos', 'video_blob', cur.lastrowid) as blob:
+                    for block in iter(lambda: f.read(VIDEO_COPY_BUFFER_SIZE), b''):
+                        blob.write(block)
         conn.commit()
+    finally:
         conn.close()
 
-    except Exception as e:
 
-        print(f"Failed to record audit event: {e}")
+def _commit_assembled_video(attempt_id, video_path, extra=None, move=True):
+    """Store a finished recording (optionally in the DB) and write the attempt manifest."""
+    if config.PROCTORING_STORE_IN_DB:
+        _store_video_in_db(attempt_id, video_path)
+        record_audit_event('video_stored_in_db', 'success', attempt_id, 'exam_attempt')
+
+    video_size = os.path.getsize(video_path)
+    video_digest = media_store.put_file(video_path, move=move)
+    changes = {
+        'video': {'digest': video_digest, 'size': video_size, 'content_type': 'video/webm'},
+        'assembled_at': datetime.utcnow().isoformat(),
+        **(extra or {})
+    }
+    return media_store.update_manifest(attempt_id, lambda manifest: manifest.update(changes))
+
+
+def _build_attempt_timeline(attempt_id, entries=()):
+    """Precompute event buckets and event-to-chunk offsets for the results page."""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT id, event_type, timestamp FROM proctoring_logs WHERE attempt_id = ?", [attempt_id])
+    rows = cur.fetchall()
+    events = [(to_epoch_ms(row['timestamp']), row['event_type']) for row in rows]
+    cur.execute("SELECT started_at FROM exam_attempts WHERE id = ?", [attempt_id])
+    attempt = cur.fetchone()
+    conn.close()
+
+    chunks = [(e.chunk_order, e.started_ms, e.offset, e.length) for e in entries]
+    start_ms = None
+    if not any(e.started_ms for e in entries) and attempt:
+        start_ms = to_epoch_ms(attempt['started_at'])
+    timeline = build_timeline(chunks, events, config.PROCTORING_TIMELINE_BUCKET_SECONDS, start_ms)
+    # Which logs the timeline covers, so events flushed after assembly trigger a rebuild
+    timeline['log_count'] = len(rows)
+    timeline['last_log_id'] = max((row['id'] for row in rows), default=0)
+    return media_store.put_bytes(json.dumps(timeline, separators=(',', ':')).encode('utf-8'))
+
+
+def _attempt_timeline(attempt_id, manifest, logs):
+    """
+    Return the attempt's precomputed timeline, rebuilding it first if
+    proctoring logs were written after it was built (events are flushed
+    by the client and can land after the recording is assembled).
+    """
+    if not manifest or not manifest.get('timeline'):
+        return None
+    data = media_store.get_bytes(manifest['timeline'])
+    timeline = json.loads(data.decode('utf-8')) if data else None
+    last_log_id = max((log['id'] for log in logs), default=0)
+    if timeline is not None and timeline.get('log_count') == len(logs) and timeline.get('last_log_id') == last_log_id:
+        return timeline
+    if manifest.get('index'):
+        entries = read_index_bytes(media_store.get_bytes(manifest['index']) or b'')
+    elif manifest.get('frame_index'):
+        entries = read_index_bytes(media_store.get_bytes(manifest['frame_index']) or b'')
+    else:
+        entries = ()
+    manifest['timeline'] = timeline_digest = _build_attempt_timeline(attempt_id, entries)
+    media_store.update_manifest(attempt_id, lambda stored: stored.update({'timeline': timeline_digest}))
+    data = media_store.get_bytes(manifest['timeline'])
+    return json.loads(data.decode('utf-8')) if data else timeline
+
+
+def _finalize_frames(attempt_id, frames):
+    """Copy snapshot frames into the media store and record them in the manifest."""
+    entries, gap_fills = frames.seal()
+    if gap_fills:
+        record_audit_event('snapshot_frame_gaps', 'warning', attempt_id, 'exam_attempt',
+                           f'Appended across missing frames: {gap_fills}')
+    changes = {
+        'frames': {'digest': media_store.put_file(frames.data_path), 'size': os.path.getsize(frames.data_path),
+                   'content_type': 'image/jpeg'},
+        'frame_index': media_store.put_file(frames.index_path),
+        'frame_count': len(entries)
+    }
+    media_store.update_manifest(attempt_id, lambda manifest: manifest.update(changes))
+    # Only now may staging forget the frames; a failure above leaves them for the retry
+    frames.mark_finalized()
+
+
+def _finalize_snapshot_attempt(attempt_id, manifest):
+    # Snapshot mode has no video, so the timeline points events at frames instead of chunks
+    entries = read_index_bytes(media_store.get_bytes(manifest['frame_index']) or b'')
+    changes = {'timeline': _build_attempt_timeline(attempt_id, entries), 'assembled_at': datetime.utcnow().isoformat()}
+    media_store.update_manifest(attempt_id, lambda stored: stored.update(changes))
+    record_audit_event('snapshot_frames_stored', 'success', attempt_id, 'exam_attempt', f'{len(entries)} frames')
+    return True
+
+
+def _finalize_recording(attempt_id, recording):
+    # Chunks were appended in order at ingest time, so there is nothing to concatenate.
+    # The recording is copied, not moved, out of staging and only dropped there once
+    # the manifest names it, so a failure at any step leaves it for the retry
+    entries, gap_fills = recording.seal()
+    if gap_fills:
+        record_audit_event('video_recording_gaps', 'warning', attempt_id, 'exam_attempt',
+                           f'Appended across missing chunks: {gap_fills}')
+    index_digest = media_store.put_file(recording.index_path)
+    timeline_digest = _build_attempt_timeline(attempt_id, entries)
+    _commit_assembled_video(attempt_id, recording.data_path, {
+        'chunk_count': len(entries), 'index': index_digest, 'timeline': timeline_digest
+    }, move=False)
+    recording.mark_finalized()
+    record_audit_event('video_assembly_completed', 'success', attempt_id, 'exam_attempt')
+    return True
+
 
 def assemble_video_chunks(attempt_id):
 
-    upload_folder = os.path.join(app.root_path, 'uploads', str(attempt_id))
+    upload_folder = media_store.staging_dir(attempt_id)
 
     
 
@@ -957,10 +1535,28 @@ def assemble_video_chunks(attempt_id):
 
             record_audit_event('video_assembly_failed', 'error', attempt_id, 'exam_attempt', 'Upload folder not found')
 
-            return
+            return False
+
+
+
+        frames = frame_sequence(upload_folder)
+
+        if frames.exists():
+
+            _finalize_frames(attempt_id, frames)
 
 
 
+        recording = AttemptRecording(upload_folder)
+
+        if recording.exists():
+
+            return _finalize_recording(attempt_id, recording)
+
+
+
+        # Legacy layout: one chunk_<order>.webm file per MediaRecorder slice
+
         chunks = sorted(
 
             [f for f in os.listdir(upload_folder) if f.startswith('chunk_')],
@@ -973,190 +1569,826 @@ def assemble_video_chunks(attempt_id):
 
         if not chunks:
 
+            manifest = media_store.read_manifest(attempt_id)
+
+            if manifest and manifest.get('frames'):
+
+                return _finalize_snapshot_attempt(attempt_id, manifest)
+
             print(f"Assembly failed: No chunks found for attempt {attempt_id}")
 
             record_audit_event('video_assembly_failed', 'error', attempt_id, 'exam_attempt', 'No video chunks found')
 
-            return
+            return False
 
 
 
-        assembled_video_path = os.path.join(upload_folder, 'assembled.webm')
+        assembled_video_path = media_store.new_temp_path(suffix='.webm')
 
         with open(assembled_video_path, 'wb') as assembled_file:
 
             for chunk_name in chunks:
 
-                chunk_path = os.path.join(upload_folder, chunk_name)
+                _append_file(assembled_file.fileno(), os.path.join(upload_folder, chunk_name))
+
+        
+
+        _commit_assembled_video(attempt_id, assembled_video_path, {
+
+            'chunk_count': len(chunks), 'timeline': _build_attempt_timeline(attempt_id)
+
+        })
 
-                with open(chunk_path, 'rb') as chunk_file:
 
-                    assembled_file.write(chunk_file.read())
+
+        # Clean up chunk files
+
+        for chunk_name in chunks:
+
+            os.remove(os.path.join(upload_folder, chunk_name))
 
         
 
-        if config.PROCTORING_STORE_IN_DB:
+        record_audit_event('video_assembly_completed', 'success', attempt_id, 'exam_attempt')
 
-            with open(assembled_video_path, 'rb') as f:
+        return True
 
-                video_blob = f.read()
 
-            
 
-            conn = get_db_connection()
-            cur = conn.cursor()
+    except Exception as e:
 
-            cur.execute(
+        print(f"Error during video assembly for attempt {attempt_id}: {e}")
 
-                "INSERT INTO proctoring_videos(attempt_id, video_blob) VALUES (?, ?)",
+        record_audit_event('video_assembly_failed', 'error', attempt_id, 'exam_attempt', str(e))
 
-                (attempt_id, video_blob)
+        raise
 
-            )
 
-            conn.commit()
-            conn.close()
+# -------------------- Background video assembly --------------------
 
-            record_audit_event('video_stored_in_db', 'success', attempt_id, 'exam_attempt')
+try:
+    import fcntl
+except ImportError:  # Windows development servers
+    fcntl = None
 
+import queue
+import time
 
+_assembly_queue = queue.Queue(maxsize=config.VIDEO_ASSEMBLY_QUEUE_SIZE)
+_assembly_pending = set()
+_assembly_abandoned = set()
+_assembly_lock = threading.Lock()
+_assembly_workers_started = False
 
-        # Clean up chunk files
 
-        for chunk_name in chunks:
+def _open_assembly_lock(attempt_id):
+    # Cross-process guard so two gunicorn workers never assemble the same attempt
+    upload_folder = media_store.staging_dir(attempt_id)
+    if fcntl is None or not os.path.isdir(upload_folder):
+        return None, True
+    lock_file = open(os.path.join(upload_folder, '.assembly.lock'), 'w')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return None, False
+    return lock_file, True
 
-            os.remove(os.path.join(upload_folder, chunk_name))
 
-        
+def _has_pending_chunks(attempt_id):
+    upload_folder = media_store.staging_dir(attempt_id)
+    if AttemptRecording(upload_folder).exists() or frame_sequence(upload_folder).exists():
+        return True
+    try:
+        return any(name.startswith('chunk_') for name in os.listdir(upload_folder))
+    except OSError:
+        return False
+
+
+def enqueue_video_assembly(attempt_id, reason='submitted', retry=0):
+    """Queue an attempt for background assembly; duplicates are ignored."""
+    start_video_assembly_workers()
+    with _assembly_lock:
+        if retry == 0 and attempt_id in _assembly_pending:
+            return False
+        _assembly_pending.add(attempt_id)
+    try:
+        _assembly_queue.put_nowait((attempt_id, retry))
+    except queue.Full:
+        with _assembly_lock:
+            _assembly_pending.discard(attempt_id)
+        record_audit_event('video_assembly_dropped', 'error', attempt_id, 'exam_attempt', 'Assembly queue is full')
+        return False
+    if retry == 0:
+        record_audit_event('video_assembly_queued', 'pending', attempt_id, 'exam_attempt', f'Queued ({reason})')
+    return True
+
+
+def _schedule_assembly_retry(attempt_id, retry):
+    delay = config.VIDEO_ASSEMBLY_RETRY_BACKOFF * (2 ** (retry - 1))
+    record_audit_event(
+        'video_assembly_retry_scheduled', 'pending', attempt_id, 'exam_attempt',
+        f'Retry {retry}/{config.VIDEO_ASSEMBLY_MAX_RETRIES} in {delay:.0f}s'
+    )
+    timer = threading.Timer(delay, enqueue_video_assembly, args=(attempt_id,), kwargs={'reason': 'retry', 'retry': retry})
+    timer.daemon = True
+    timer.start()
 
-        record_audit_event('video_assembly_completed', 'success', attempt_id, 'exam_attempt')
 
+def _video_assembly_worker():
+    while True:
+        attempt_id, retry = _assembly_queue.get()
+        requeued = False
+        try:
+            lock_file, acquired = _open_assembly_lock(attempt_id)
+            if not acquired:
+                continue
+            try:
+                assemble_video_chunks(attempt_id)
+            except Exception:
+                if retry < config.VIDEO_ASSEMBLY_MAX_RETRIES:
+                    _schedule_assembly_retry(attempt_id, retry + 1)
+                    requeued = True
+                else:
+                    with _assembly_lock:
+                        _assembly_abandoned.add(attempt_id)
+                    record_audit_event('video_assembly_abandoned', 'error', attempt_id, 'exam_attempt',
+                                       f'Gave up after {retry + 1} attempts')
+            finally:
+                if lock_file is not None:
+                    lock_file.close()
+        except Exception as e:
+            # Nothing may take the worker down; the attempt is left for the next submit or sweep
+            print(f"Video assembly worker error for attempt {attempt_id}: {e}")
+        finally:
+            if not requeued:
+                with _assembly_lock:
+                    _assembly_pending.discard(attempt_id)
+            _assembly_queue.task_done()
+
+
+def _parse_db_timestamp(value):
+    if isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(str(value))
+    except (TypeError, ValueError):
+        return None
 
 
-    except Exception as e:
+def _abandoned_assembly_ids():
+    """Attempts whose assembly was given up on, in this process or (from the audit log) any other."""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT DISTINCT related_id FROM audit_events WHERE event_name = ? AND related_type = ?",
+        ('video_assembly_abandoned', 'exam_attempt')
+    )
+    ids = {row['related_id'] for row in cur.fetchall()}
+    conn.close()
+    with _assembly_lock:
+        ids |= _assembly_abandoned
+    return ids
 
-        print(f"Error during video assembly for attempt {attempt_id}: {e}")
 
-        record_audit_event('video_assembly_failed', 'error', attempt_id, 'exam_attempt', str(e))
+def enqueue_timed_out_attempts():
+    """Queue assembly for in-progress attempts that ran past the exam duration."""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT a.id, a.started_at, e.duration
+        FROM exam_attempts a
+        JOIN exams e ON e.id=a.exam_id
+        WHERE a.status='in_progress'
+        """
+    )
+    rows = cur.fetchall()
+    conn.close()
+    # Abandoned assemblies are terminal for the sweeper; a new submit can still queue them
+    abandoned = _abandoned_assembly_ids()
+
+    now = datetime.utcnow()
+    for row in rows:
+        started_at = _parse_db_timestamp(row['started_at'])
+        if started_at is None:
+            continue
+        elapsed_minutes = (now - started_at).total_seconds() / 60
+        if elapsed_minutes < (row['duration'] or 0) + config.VIDEO_ASSEMBLY_TIMEOUT_GRACE:
+            continue
+        if row['id'] in abandoned:
+            continue
+        if _has_pending_chunks(row['id']):
+            enqueue_video_assembly(row['id'], reason='timed_out')
+
+
+def _timed_out_attempt_sweeper():
+    while True:
+        time.sleep(config.VIDEO_ASSEMBLY_SWEEP_INTERVAL)
+        try:
+            enqueue_timed_out_attempts()
+        except Exception as e:
+            print(f"Timed-out attempt sweep failed: {e}")
 
-@app.route('/proctoring/chunk', methods=['POST'])
 
-@require_login('student')
+def start_video_assembly_workers():
+    # Threads are started lazily so each gunicorn worker gets its own pool after fork
+    global _assembly_workers_started
+    if _assembly_workers_started:
+        return
+    with _assembly_lock:
+        if _assembly_workers_started:
+            return
+        for i in range(max(1, config.VIDEO_ASSEMBLY_WORKERS)):
+            threading.Thread(target=_video_assembly_worker, name=f'video-assembly-{i}', daemon=True).start()
+        if config.VIDEO_ASSEMBLY_SWEEP_INTERVAL > 0:
+            threading.Thread(target=_timed_out_attempt_sweeper, name='video-assembly-sweeper', daemon=True).start()
+        _assembly_workers_started = True
 
-def proctoring_chunk():
 
-    try:
+@app.before_request
+def _video_assembly_bootstrap():
+    start_video_assembly_workers()
+    start_retention_worker()
 
-        exam_id = int(request.form['exam_id'])
 
-        chunk_order = int(request.form['chunk_order'])
+# -------------------- Upload retention and disk protection --------------------
 
-        video_chunk = request.files['video_chunk']
+PROCTOR_CHUNKS_DIR = 'proctor_chunks'
 
-        
+_disk_check = {'checked_at': 0.0, 'fraction': 0.0}
+_retention_started = False
 
-        attempt_id = ensure_attempt(session['id'], exam_id)
 
-        
+def _retention_attempt_ids():
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT id FROM exam_attempts")
+    ids = {str(row['id']) for row in cur.fetchall()}
+    conn.close()
+    return ids
 
-        upload_folder = os.path.join(app.root_path, 'uploads', str(attempt_id))
 
-        os.makedirs(upload_folder, exist_ok=True)
+def _retention_attempt_keys():
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT exam_id, student_id FROM exam_attempts")
+    keys = {(str(row['exam_id']), str(row['student_id'])) for row in cur.fetchall()}
+    conn.close()
+    return keys
 
-        chunk_path = os.path.join(upload_folder, f'chunk_{chunk_order}.webm')
 
-        video_chunk.save(chunk_path)
+def _retention_usernames():
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT username FROM users")
+    names = {row['username'] for row in cur.fetchall()}
+    conn.close()
+    return names
+
+
+retention_manager = RetentionManager(
+    media_store.staging_root,
+    os.path.abspath(PROCTOR_CHUNKS_DIR),
+    media_store,
+    {
+        'attempt_uploads': RetentionPolicy(config.RETENTION_ATTEMPT_UPLOADS_DAYS, config.RETENTION_REMOVE_ORPHANS),
+        'proctor_chunks': RetentionPolicy(config.RETENTION_PROCTOR_CHUNKS_DAYS, config.RETENTION_REMOVE_ORPHANS),
+        'auth_data': RetentionPolicy(config.RETENTION_AUTH_DATA_DAYS, config.RETENTION_REMOVE_ORPHANS),
+        'media': RetentionPolicy(config.RETENTION_MEDIA_DAYS, config.RETENTION_REMOVE_ORPHANS)
+    },
+    {
+        'attempt_ids': _retention_attempt_ids,
+        'attempt_keys': _retention_attempt_keys,
+        'usernames': _retention_usernames
+    },
+    batch_size=config.RETENTION_BATCH_SIZE,
+    batch_pause_ms=config.RETENTION_BATCH_PAUSE_MS,
+    orphan_grace_seconds=config.RETENTION_ORPHAN_GRACE_SECONDS
+)
+
+
+def current_disk_usage():
+    # statvfs is cheap, but there is no need to call it on every chunk upload
+    now = time.monotonic()
+    if now - _disk_check['checked_at'] > 5:
+        try:
+            _disk_check['fraction'] = disk_usage_fraction(media_store.staging_root)
+        except OSError:
+            _disk_check['fraction'] = 0.0
+        _disk_check['checked_at'] = now
+    return _disk_check['fraction']
 
-        
 
-        record_audit_event('video_chunk_uploaded', 'success', attempt_id, 'exam_attempt', f'Chunk {chunk_order} saved')
+def disk_above_watermark():
+    return current_disk_usage() >= config.DISK_HIGH_WATERMARK
 
-        
 
-        return jsonify({'success': True})
+def _reject_upload_if_disk_full():
+    if disk_above_watermark():
+        return jsonify({'success': False, 'message': 'Server storage is full, please retry later'}), 507
+    return None
 
-    except Exception as e:
 
-        return jsonify({'success': False, 'message': str(e)}), 500
+def _run_retention(dry_run=False):
+    summary = retention_manager.run(dry_run=dry_run)
+    if not dry_run and 'auth_data' in summary.get('by_category', {}):
+        # Deleted users' voiceprints must drop out of every process's cohort
+        voiceprints.changed()
+    if not dry_run:
+        _prune_faces()
+    return summary
+
 
+def _retention_worker():
+    while True:
+        try:
+            summary = _run_retention()
+            if summary.get('removed'):
+                record_audit_event('upload_retention_gc', 'success', None, 'storage', json.dumps(summary))
+        except Exception as e:
+            print(f"Upload retention run failed: {e}")
+        time.sleep(config.RETENTION_INTERVAL)
 
 
-@app.route('/proctoring/video/<int:attempt_id>')
+def start_retention_worker():
+    global _retention_started
+    if _retention_started or config.RETENTION_INTERVAL <= 0:
+        return
+    with _assembly_lock:
+        if _retention_started:
+            return
+        threading.Thread(target=_retention_worker, name='upload-retention', daemon=True).start()
+        _retention_started = True
+
 
+@app.route('/admin/storage_usage')
 @require_login('teacher')
+def storage_usage():
+    usage = retention_manager.usage()
+    usage['high_watermark'] = config.DISK_HIGH_WATERMARK
+    usage['uploads_rejected'] = disk_above_watermark()
+    return jsonify({'success': True, 'usage': usage})
 
-def proctoring_video(attempt_id):
 
-    if not config.PROCTORING_STORE_IN_DB:
+@app.route('/admin/storage_gc', methods=['POST'])
+@require_login('teacher')
+def storage_gc():
+    dry_run = request.args.get('dry_run', 'false').lower() == 'true'
+    summary = _run_retention(dry_run=dry_run)
+    return jsonify({'success': True, 'dry_run': dry_run, 'summary': summary})
+
+# -------------------- Adaptive recording settings --------------------
+
+ingest_monitor = IngestMonitor(config.PROCTORING_INGEST_WINDOW_SECONDS)
+recording_profiles = RecordingProfileController(
+    ingest_monitor,
+    config.PROCTORING_INGEST_CAPACITY_BPS,
+    current_disk_usage,
+    disk_soft_watermark=config.DISK_SOFT_WATERMARK,
+    max_profile=config.PROCTORING_MAX_PROFILE,
+    min_profile=config.PROCTORING_MIN_PROFILE,
+    refresh_seconds=config.PROCTORING_PROFILE_REFRESH_SECONDS
+)
+
+
+def proctoring_client_settings():
+    settings = recording_profiles.current()
+    settings['mode'] = config.PROCTORING_MODE
+    if config.VOICE_CHECK_ENABLED:
+        settings['voice_check_seconds'] = config.VOICE_CHECK_SECONDS
+        settings['voice_check_interval_ms'] = config.VOICE_CHECK_INTERVAL * 1000
+    if config.FACE_CHECK_ENABLED:
+        settings['face_check_interval_ms'] = config.FACE_CHECK_INTERVAL * 1000
+    if config.PROCTORING_MODE == 'snapshot':
+        settings.update({
+            'snapshot_interval_ms': config.PROCTORING_SNAPSHOT_INTERVAL * 1000,
+            'snapshot_width': config.PROCTORING_SNAPSHOT_WIDTH,
+            'snapshot_quality': config.PROCTORING_SNAPSHOT_QUALITY
+        })
+    return settings
+
+
+@app.route('/proctoring/settings')
+@require_login('student')
+def proctoring_settings():
+    return jsonify({'success': True, 'settings': proctoring_client_settings()})
 
-        return "Video streaming is disabled.", 404
 
+@app.route('/admin/proctoring_load')
+@require_login('teacher')
+def proctoring_load():
+    return jsonify({'success': True, 'load': recording_profiles.status()})
 
 
-    conn = get_db_connection()
-    cur = conn.cursor()
+@app.route('/proctoring/chunk', methods=['POST'])
+
+@require_login('student')
 
-    cur.execute("SELECT video_blob FROM proctoring_videos WHERE attempt_id = ?", [attempt_id])
+def proctoring_chunk():
 
-    video = cur.fetchone()
+    rejected = _reject_upload_if_disk_full()
 
-    conn.close()
+    if rejected:
 
+        return rejected
 
 
-    if not video or not video['video_blob']:
 
-        return "Video not found.", 404
+    try:
 
+        exam_id = int(request.form['exam_id'])
 
+        chunk_order = int(request.form['chunk_order'])
 
-    video_blob = video['video_blob']
+        started_ms = int(request.form.get('started_at') or datetime.utcnow().timestamp() * 1000)
 
-    video_size = len(video_blob)
+        video_chunk = request.files['video_chunk']
 
+        checksum = int(request.form['checksum'], 16) if request.form.get('checksum') else None
 
+        return _ingest_video_chunk(exam_id, chunk_order, started_ms, checksum, video_chunk.stream)
 
-    range_header = request.headers.get('Range', None)
+    except Exception as e:
 
-    if not range_header:
+        return jsonify({'success': False, 'message': str(e)}), 500
 
-        resp = Response(video_blob, mimetype='video/webm')
 
-        resp.headers.add('Content-Length', str(video_size))
 
-        return resp
+def _chunk_too_large(chunk_order=None):
+    return jsonify({'success': False, 'status': 'too_large', 'chunk_order': chunk_order,
+                    'message': f'Chunks may not exceed {config.PROCTORING_CHUNK_MAX_BYTES} bytes'}), 413
 
 
+def _upload_param(name, header):
+    """Metadata for raw-body uploads comes from the query string or an X- header."""
+    return request.args.get(name) or request.headers.get(header)
 
-    byte1, byte2 = 0, None
 
-    import re
-    m = re.search(r'(\d+)-(\d*)', range_header)
+@app.route('/proctoring/chunk/raw', methods=['POST'])
+@require_login('student')
+def proctoring_chunk_raw():
+    """
+    Same protocol as /proctoring/chunk with an application/octet-stream body.
+    The body is streamed straight into the recording, skipping the multipart
+    parser and its spooled temporary file; duplicates are acknowledged
+    without reading the body at all.
+    """
+    rejected = _reject_upload_if_disk_full()
+    if rejected:
+        return rejected
+    if request.mimetype != 'application/octet-stream':
+        return jsonify({'success': False, 'message': 'Expected an application/octet-stream body'}), 415
 
-    g = m.groups()
+    try:
+        exam_id = int(_upload_param('exam_id', 'X-Exam-Id'))
+        chunk_order = int(_upload_param('chunk_order', 'X-Chunk-Order'))
+        started_ms = int(_upload_param('started_at', 'X-Chunk-Started-At') or datetime.utcnow().timestamp() * 1000)
+        checksum = _upload_param('checksum', 'X-Chunk-Checksum')
+        checksum = int(checksum, 16) if checksum else None
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'Missing or invalid chunk metadata'}), 400
 
+    try:
+        return _ingest_video_chunk(exam_id, chunk_order, started_ms, checksum, request.stream)
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
 
 
-    if g[0]: byte1 = int(g[0])
+def _ingest_video_chunk(exam_id, chunk_order, started_ms, checksum, stream):
+    if (request.content_length or 0) > config.PROCTORING_CHUNK_MAX_BYTES:
+        return _chunk_too_large(chunk_order)
+    attempt_id = ensure_attempt(session['id'], exam_id)
 
-    if g[1]: byte2 = int(g[1])
+    recording = AttemptRecording(media_store.staging_dir(attempt_id, create=True))
+    try:
+        status, entry = recording.append_chunk(chunk_order, stream, started_ms, checksum,
+                                               config.PROCTORING_CHUNK_MAX_BYTES)
+    except ChunkTooLarge:
+        # Chunked bodies carry no Content-Length, so the limit is also enforced while reading
+        return _chunk_too_large(chunk_order)
+    except ChecksumMismatch as e:
+        record_audit_event('video_chunk_corrupt', 'warning', attempt_id, 'exam_attempt', str(e))
+        return jsonify({'success': False, 'status': 'corrupt', 'chunk_order': chunk_order, 'message': str(e)}), 422
+    except RecordingFinalized:
+        record_audit_event('video_chunk_after_finalize', 'warning', attempt_id, 'exam_attempt',
+                           f'Chunk {chunk_order} arrived after the recording was assembled')
+        return jsonify({'success': False, 'status': 'finalized', 'chunk_order': chunk_order,
+                        'message': 'The recording for this attempt is already closed'}), 410
+    ingest_monitor.record(attempt_id, request.content_length or 0)
+
+    if status == 'conflict':
+        record_audit_event('video_chunk_conflict', 'warning', attempt_id, 'exam_attempt',
+                           f'Chunk {chunk_order} re-sent with different content; kept the original')
+        return jsonify({'success': False, 'status': status, 'chunk_order': chunk_order,
+                        'message': 'A different chunk with this order was already stored'}), 409
+    if status != 'duplicate':
+        record_audit_event('video_chunk_uploaded', 'success', attempt_id, 'exam_attempt', f'Chunk {chunk_order} {status}')
+
+    # Running recorders pick up tier changes from here without polling
+    return jsonify({'success': True, 'status': status, 'chunk_order': chunk_order,
+                    'settings': proctoring_client_settings()})
+
+
+@app.route('/proctoring/chunks/status')
+@require_login('student')
+def proctoring_chunk_status():
+    """
+    List the chunk orders the server still needs, so clients can re-send only
+    the gaps and carry on numbering after a page reload. `stream=frames`
+    reports on the snapshot frame sequence instead of the video.
+    """
+    try:
+        exam_id = int(request.args['exam_id'])
+        last_order = request.args.get('last_order', type=int)
+        attempt_id = ensure_attempt(session['id'], exam_id)
+        if request.args.get('stream') == 'frames':
+            recording = frame_sequence(media_store.staging_dir(attempt_id))
+        else:
+            recording = AttemptRecording(media_store.staging_dir(attempt_id))
+        status = recording.upload_status(last_order)
+        return jsonify({'success': True, **status})
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
 
 
+@app.route('/proctoring/frame', methods=['POST'])
+@require_login('student')
+def proctoring_frame():
+    """Snapshot mode: append one JPEG still to the attempt's frame sequence."""
+    rejected = _reject_upload_if_disk_full()
+    if rejected:
+        return rejected
+    if (request.content_length or 0) > config.PROCTORING_SNAPSHOT_MAX_BYTES:
+        return jsonify({'success': False, 'message': 'Frame is too large'}), 413
 
-    length = video_size - byte1
+    try:
+        exam_id = int(request.form['exam_id'])
+        frame_order = int(request.form['frame_order'])
+        captured_ms = int(request.form.get('captured_at') or datetime.utcnow().timestamp() * 1000)
+        frame = request.files['frame']
 
-    if byte2 is not None:
+        attempt_id = ensure_attempt(session['id'], exam_id)
+        frames = frame_sequence(media_store.staging_dir(attempt_id, create=True))
+        try:
+            status, entry = frames.append_chunk(frame_order, frame.stream, captured_ms)
+        except RecordingFinalized:
+            return jsonify({'success': False, 'status': 'finalized',
+                            'message': 'The recording for this attempt is already closed'}), 410
+        ingest_monitor.record(attempt_id, request.content_length or 0)
 
-        length = byte2 - byte1
+        return jsonify({'success': True, 'status': status, 'settings': proctoring_client_settings()})
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
 
 
 
-    data = video_blob[byte1:byte1 + length]
+class _VideoSource:
+    """Random-access reader over a stored proctoring video."""
 
-    resp = Response(data, 206, mimetype='video/webm', direct_passthrough=True)
+    def __init__(self, size, etag, last_modified, read, close):
+        self.size = size
+        self.etag = etag
+        self.last_modified = last_modified
+        self.read = read
+        self.close = close
 
-    resp.headers.add('Content-Range', f'bytes {byte1}-{byte1 + length - 1}/{video_size}')
 
+def _open_db_video(attempt_id):
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor()
+        if config.DATABASE_URL:
+            cur.execute(
+                "SELECT id, video_oid, created_at FROM proctoring_videos WHERE attempt_id = %s ORDER BY id DESC LIMIT 1",
+                [attempt_id]
+            )
+            row = cur.fetchone()
+            if not row or not row[1]:
+                conn.close()
+                return None
+            row_id, oid, created_at = row
+            lobj = conn.lobject(oid, 'rb')
+            size = lobj.seek(0, 2)
+
+            def read(offset, length):
+                lobj.seek(offset)
+                return lobj.read(length)
+
+            def close():
+                lobj.close()
+                conn.close()
+        else:
+            cur.execute(
+                "SELECT id, created_at FROM proctoring_videos WHERE attempt_id = ? AND video_blob IS NOT NULL ORDER BY id DESC LIMIT 1",
+                [attempt_id]
+            )
+            row = cur.fetchone()
+            if not row:
+                conn.close()
+                return None
+            row_id, created_at = row['id'], row['created_at']
+            blob = conn.blobopen('proctoring_videos', 'video_blob', row_id, readonly=True)
+            size = len(blob)
+
+            def read(offset, length):
+                blob.seek(offset)
+                return blob.read(length)
+
+            def close():
+                blob.close()
+                conn.close()
+    except Exception:
+        conn.close()
+        raise
+
+    if size == 0:
+        close()
+        return None
+    return _VideoSource(size, f'video-{attempt_id}-{row_id}-{size}', _parse_db_timestamp(created_at), read, close)
+
+
+def _open_stored_video(attempt_id):
+    manifest = media_store.read_manifest(attempt_id)
+    if not manifest or not manifest.get('video'):
+        return None
+    video = manifest['video']
+    reader = media_store.open(video['digest'])
+    if reader is None or reader.size == 0:
+        return None
+    return _VideoSource(
+        reader.size, video['digest'], _parse_db_timestamp(manifest.get('assembled_at')),
+        reader.read_at, reader.close
+    )
+
+
+def _open_live_recording(attempt_id):
+    # The exam is still running: serve what has been appended so far
+    recording = AttemptRecording(media_store.staging_dir(attempt_id))
+    size = recording.committed_size()
+    if size == 0:
+        return None
+    try:
+        f = open(recording.data_path, 'rb')
+    except OSError:
+        return None
+    fd = f.fileno()
+    return _VideoSource(
+        size, f'live-{attempt_id}-{size}', None,
+        lambda offset, length: os.pread(fd, length, offset), f.close
+    )
+
+
+def _open_frames(attempt_id):
+    """Return (index entries, read_at, close) for stored or still-uploading snapshot frames."""
+    manifest = media_store.read_manifest(attempt_id)
+    if manifest and manifest.get('frames'):
+        reader = media_store.open(manifest['frames']['digest'])
+        if reader is None:
+            return None
+        entries = read_index_bytes(media_store.get_bytes(manifest['frame_index']) or b'')
+        return entries, reader.read_at, reader.close
+    frames = frame_sequence(media_store.staging_dir(attempt_id))
+    entries = frames.entries()
+    if not entries:
+        return None
+    try:
+        f = open(frames.data_path, 'rb')
+    except OSError:
+        return None
+    fd = f.fileno()
+    return entries, lambda offset, length: os.pread(fd, length, offset), f.close
+
+
+@app.route('/proctoring/frames/<int:attempt_id>/<int:frame_number>')
+@require_login('teacher')
+def proctoring_frame_image(attempt_id, frame_number):
+    opened = _open_frames(attempt_id)
+    if opened is None:
+        return "Frames not found", 404
+    entries, read_at, close = opened
+    try:
+        if frame_number >= len(entries):
+            return "Frame not found", 404
+        entry = entries[frame_number]
+        data = read_at(entry.offset, entry.length)
+    finally:
+        close()
+    response = Response(data, mimetype='image/jpeg')
+    # A frame never changes once it has been appended
+    response.headers['Cache-Control'] = 'private, max-age=86400'
+    return response
+
+
+def _iter_video_range(source, start, stop):
+    offset = start
+    while offset < stop:
+        data = source.read(offset, min(VIDEO_COPY_BUFFER_SIZE, stop - offset))
+        if not data:
+            break
+        offset += len(data)
+        yield data
+
+
+def _resolve_byte_ranges(range_header, size):
+    """Return satisfiable (start, stop) pairs, [] if none are, or None to ignore the header."""
+    parsed = parse_range_header(range_header)
+    if parsed is None or parsed.units != 'bytes':
+        return None
+    ranges = []
+    for start, stop in parsed.ranges:
+        if start < 0:
+            start, stop = max(size + start, 0), size
+        else:
+            stop = size if stop is None else min(stop, size)
+        if start < stop:
+            ranges.append((start, stop))
+    return ranges
+
+
+@app.route('/proctoring/video/<int:attempt_id>')
+@require_login('teacher')
+def proctoring_video(attempt_id):
+    source = _open_stored_video(attempt_id)
+    if source is None:
+        # Attempts assembled before the media store only have the DB copy
+        source = _open_db_video(attempt_id)
+    if source is None:
+        source = _open_live_recording(attempt_id)
+    if source is None:
+        return "Video not found.", 404
+
+    size = source.size
+    headers = {'Accept-Ranges': 'bytes', 'Cache-Control': 'private, max-age=0'}
+
+    if request.if_none_match.contains(source.etag):
+        source.close()
+        resp = Response(status=304, headers=headers)
+        resp.set_etag(source.etag)
+        return resp
+
+    ranges = None
+    range_header = request.headers.get('Range')
+    if range_header and request.headers.get('If-Range') and request.if_range.etag != source.etag:
+        # The client's copy is stale, so send the whole representation
+        range_header = None
+    if range_header:
+        ranges = _resolve_byte_ranges(range_header, size)
+
+    if ranges == []:
+        source.close()
+        headers['Content-Range'] = f'bytes */{size}'
+        return Response("Requested range not satisfiable.", 416, headers=headers)
+
+    if not ranges:
+        status = 200
+        headers['Content-Length'] = str(size)
+        mimetype = 'video/webm'
+
+        def generate():
+            try:
+                yield from _iter_video_range(source, 0, size)
+            finally:
+                source.close()
+    elif len(ranges) == 1:
+        start, stop = ranges[0]
+        status = 206
+        headers['Content-Length'] = str(stop - start)
+        headers['Content-Range'] = f'bytes {start}-{stop - 1}/{size}'
+        mimetype = 'video/webm'
+
+        def generate():
+            try:
+                yield from _iter_video_range(source, start, stop)
+            finally:
+                source.close()
+    else:
+        status = 206
+        boundary = f'voxiscribe-{attempt_id}-{random.getrandbits(64):016x}'
+        mimetype = f'multipart/byteranges; boundary={boundary}'
+        part_headers = [
+            (f'\r\n--{boundary}\r\nContent-Type: video/webm\r\n'
+             f'Content-Range: bytes {start}-{stop - 1}/{size}\r\n\r\n').encode('ascii')
+            for start, stop in ranges
+        ]
+        closing = f'\r\n--{boundary}--\r\n'.encode('ascii')
+        headers['Content-Length'] = str(
+            sum(len(h) for h in part_headers) + sum(stop - start for start, stop in ranges) + len(closing)
+        )
+
+        def generate():
+            try:
+                for part_header, (start, stop) in zip(part_headers, ranges):
+                    yield part_header
+                    yield from _iter_video_range(source, start, stop)
+                yield closing
+            finally:
+                source.close()
+
+    resp = Response(generate(), status, headers=headers, mimetype=mimetype, direct_passthrough=True)
+    resp.set_etag(source.etag)
+    if source.last_modified:
+        resp.last_modified = source.last_modified
     return resp
 
 @app.route('/submit_exam/<int:exam_id>', methods=['POST'])
@@ -1177,6 +2409,10 @@ def submit_exam(exam_id):
         conn.commit()
         conn.close()
 
+        # Assemble the proctoring recording off the request thread
+        attempt_id = ensure_attempt(session['id'], exam_id)
+        enqueue_video_assembly(attempt_id, reason='submitted')
+
         return jsonify({'success': True, 'redirect': url_for('student_dashboard'), 'total': total})
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
@@ -1512,81 +2748,190 @@ def download_results(exam_id):
 
 
 
+@app.route('/download_answer_matrix/<int:exam_id>')
+@require_login('teacher')
+def download_answer_matrix(exam_id):
+    # Export CSV with one row per student and answer/option/score columns per question.
+    # Rows are pivoted while streaming a single ordered scan, so only the current
+    # student's answers are held in memory.
+    questions = fetch_questions(exam_id)
+    question_ids = [q['id'] for q in questions]
+
+    header = ['Username', 'Status', 'Total Score']
+    for idx, q in enumerate(questions, start=1):
+        header.extend([f'Q{idx} Answer', f'Q{idx} Option', f'Q{idx} Score'])
+
+    def csv_line(values):
+        si = StringIO()
+        csv.writer(si).writerow(values)
+        return si.getvalue()
+
+    def student_row(student, answers):
+        values = [student['username'], student['status'], student['total_score']]
+        for qid in question_ids:
+            ans = answers.get(qid)
+            if ans:
+                values.extend([ans['answer_text'], ans['selected_option'], ans['score']])
+            else:
+                values.extend(['', '', ''])
+        return csv_line(values)
+
+    def generate():
+        yield csv_line(header)
+        conn = get_db_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute(
+                """
+                SELECT at.student_id, u.username, at.status, at.total_score,
+                       ans.question_id, ans.answer_text, ans.selected_option, ans.score
+                FROM exam_attempts at
+                JOIN users u ON u.id=at.student_id
+                LEFT JOIN answers ans ON ans.student_id=at.student_id AND ans.exam_id=at.exam_id
+                WHERE at.exam_id=?
+                ORDER BY u.username ASC, at.student_id ASC, ans.question_id ASC
+                """,
+                [exam_id]
+            )
+            current = None
+            answers = {}
+            for row in cur:
+                if current is None or row['student_id'] != current['student_id']:
+                    if current is not None:
+                        yield student_row(current, answers)
+                    current = dict(row)
+                    answers = {}
+                if row['question_id'] is not None:
+                    answers[row['question_id']] = row
+            if current is not None:
+                yield student_row(current, answers)
+        finally:
+            conn.close()
+
+    return Response(
+        generate(),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename=exam_{exam_id}_answer_matrix.csv'}
+    )
+
+
 # -------- Whisper transcription endpoint --------
 
+transcription_cache = TranscriptionCache(
+    engine_version(),
+    max_entries=config.TRANSCRIPTION_CACHE_ENTRIES,
+    max_bytes=config.TRANSCRIPTION_CACHE_MAX_BYTES,
+    directory=config.TRANSCRIPTION_CACHE_PATH,
+    disk_max_bytes=config.TRANSCRIPTION_CACHE_DISK_MAX_BYTES
+) if config.TRANSCRIPTION_CACHE_ENABLED else None
+
+transcription_jobs = TranscriptionJobQueue(
+    config.TRANSCRIPTION_JOBS_PATH or os.path.join(app.root_path, 'uploads', 'transcription_jobs'),
+    workers=config.TRANSCRIPTION_WORKERS,
+    max_queue=config.TRANSCRIPTION_QUEUE_SIZE,
+    job_ttl_seconds=config.TRANSCRIPTION_JOB_TTL,
+    start_method=config.TRANSCRIPTION_START_METHOD,
+    cache=transcription_cache,
+    batch_size=config.TRANSCRIPTION_BATCH_SIZE if engine_class().batched else 1,
+    batch_wait_ms=config.TRANSCRIPTION_BATCH_WAIT_MS
+)
+
+
 @app.route('/transcribe', methods=['POST'])
 
 def transcribe():
 
-    print("Transcribe endpoint called")
-
     try:
 
-        audio_file = request.files.get('audio')
+        language = request.args.get('language') or request.form.get('language', 'en')
+
+        if request.mimetype == 'application/octet-stream':
+
+            # Raw body: no multipart parsing and no spooled temporary file
 
-        language = request.form.get('language', 'en')
+            audio = request.stream
 
-        if not audio_file:
+        else:
+
+            audio = request.files.get('audio')
 
-            print("No audio file provided")
+        if not audio:
 
             return jsonify({'success': False, 'message': 'No audio provided'}), 400
 
 
 
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.webm') as tmp:
+        # Typical dictations are handed to the pool as bytes; only very large
 
-            audio_path = tmp.name
+        # uploads are spooled to a file, which the pool process deletes.
 
-            audio_file.save(audio_path)
+        # A chunked upload has no Content-Length, so its size is only known once read
 
-        
+        head = b''
+
+        if (request.content_length or 0) <= config.TRANSCRIPTION_INMEMORY_MAX_BYTES:
 
-        print(f"Audio saved to temporary file: {audio_path}")
+            head = audio.read(config.TRANSCRIPTION_INMEMORY_MAX_BYTES + 1)
 
-        print(f"Saved file size: {os.path.getsize(audio_path)} bytes")  # <-- Added file size logging
+            if not head:
 
+                return jsonify({'success': False, 'message': 'No audio provided'}), 400
+
+        if len(head) <= config.TRANSCRIPTION_INMEMORY_MAX_BYTES and head:
+
+            audio = head
+
+        else:
+
+            audio_path = transcription_jobs.new_audio_path(suffix='.webm')
+
+            _write_stream(audio, audio_path, prefix=head)
+
+            audio = audio_path
 
 
-        text = None
 
         try:
 
-            text = transcribe_audio(audio_path, language=language)
+            job_id = transcription_jobs.submit(audio, language)
 
-            print(f"speech_server transcription successful: {text}")
+        except QueueFull:
 
-        except Exception as e:
+            if isinstance(audio, str):
 
-            print(f"speech_server transcription failed: {e}")
+                os.unlink(audio)
 
-            text = None
+            response = jsonify({'success': False, 'message': 'Transcription is busy, please retry shortly',
 
+                                'queue': transcription_jobs.stats()})
 
+            response.headers['Retry-After'] = str(config.TRANSCRIPTION_RETRY_AFTER)
 
-        try:
+            return response, 429
 
-            os.unlink(audio_path)
 
-            print(f"Temporary file {audio_path} deleted.")
 
-        except Exception as e:
+        # Audio transcribed before is answered straight from the cache
+
+        job = transcription_jobs.get(job_id)
 
-            print(f"Error deleting temporary file {audio_path}: {e}")
+        if job and job.get('cached'):
 
+            return jsonify({'success': True, 'job_id': job_id, 'cached': True, 'state': 'done', 'text': job['text']})
 
 
-        if not text:
 
-            print("Transcription engine unavailable.")
+        return jsonify({
 
-            return jsonify({'success': False, 'message': 'Transcription engine unavailable'}), 500
+            'success': True,
 
+            'job_id': job_id,
 
+            'status_url': url_for('transcription_job_status', job_id=job_id),
 
-        print(f"Transcription result: {text.strip()}")
+            'queue_depth': transcription_jobs.stats()['queue_depth']
 
-        return jsonify({'success': True, 'text': text.strip()})
+        }), 202
 
     except Exception as e:
 
@@ -1596,6 +2941,153 @@ def transcribe():
 
 
 
+@app.route('/transcribe/jobs/<job_id>')
+def transcription_job_status(job_id):
+    """Poll a transcription job; 'text' and 'latency' appear once it is done."""
+    job = transcription_jobs.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'message': 'Unknown or expired transcription job'}), 404
+    if job['state'] == 'failed':
+        return jsonify({'success': False, 'message': 'Transcription engine unavailable', 'job': job})
+    return jsonify({'success': True, 'job': job})
+
+
+@app.route('/admin/audit/stats')
+@require_login('teacher')
+def audit_log_stats():
+    """Counters of this worker process's batched audit writer, including lost events."""
+    return jsonify({'success': True, 'pid': os.getpid(), 'overflow': config.AUDIT_OVERFLOW, **audit_logger.stats()})
+
+
+@app.route('/transcribe/stats')
+@require_login('teacher')
+def transcription_stats():
+    return jsonify({'success': True, 'queue': transcription_jobs.stats()})
+
+
+# -------------------- Streaming dictation --------------------
+
+TRANSCRIPTION_SESSIONS_DIR = config.TRANSCRIPTION_SESSIONS_PATH or os.path.join(app.root_path, 'uploads', 'transcription_sessions')
+
+
+def _open_dictation_session(session_id):
+    dictation = StreamingSession.open(TRANSCRIPTION_SESSIONS_DIR, session_id)
+    if dictation is None or dictation.state()['owner_id'] != session.get('id'):
+        return None
+    return dictation
+
+
+# Session id -> the step running for it in the pool, so chunks never queue a second one
+_dictation_steps = {}
+_dictation_steps_lock = threading.Lock()
+
+
+def _start_dictation_step(dictation):
+    """Queue a transcription step for the session unless one is already running."""
+    session_id = dictation.session_id
+    with _dictation_steps_lock:
+        running = _dictation_steps.get(session_id)
+        if running is not None and not running.done():
+            return
+        try:
+            future = transcription_jobs.call_async(
+                advance_session, TRANSCRIPTION_SESSIONS_DIR, session_id, False,
+                config.TRANSCRIPTION_STREAM_MAX_TAIL_SECONDS
+            )
+        except QueueFull:
+            return
+        _dictation_steps[session_id] = future
+    future.add_done_callback(
+        lambda done: _dictation_steps.pop(session_id, None) if _dictation_steps.get(session_id) is done else None
+    )
+
+
+def _advance_dictation(dictation, final=False):
+    """Run one transcription step on the pool; on overload the last known state is returned."""
+    try:
+        state = transcription_jobs.call(
+            advance_session, TRANSCRIPTION_SESSIONS_DIR, dictation.session_id, final,
+            config.TRANSCRIPTION_STREAM_MAX_TAIL_SECONDS,
+            timeout=config.TRANSCRIPTION_STREAM_STEP_TIMEOUT
+        )
+        return state, True
+    except (QueueFull, FutureTimeoutError):
+        return dictation.state(), False
+
+
+def _dictation_response(state, up_to_date, **extra):
+    return jsonify({
+        'success': True,
+        'session_id': state['session_id'],
+        'final_text': state['committed_text'],
+        'partial': state['partial'],
+        'text': session_text(state),
+        'up_to_date': up_to_date,
+        **extra
+    })
+
+
+@app.route('/transcribe/stream', methods=['POST'])
+@require_login()
+def start_dictation():
+    """Open a streaming dictation session; chunks are then posted to it in order."""
+    rejected = _reject_upload_if_disk_full()
+    if rejected:
+        return rejected
+    prune_sessions(TRANSCRIPTION_SESSIONS_DIR, config.TRANSCRIPTION_JOB_TTL)
+    os.makedirs(TRANSCRIPTION_SESSIONS_DIR, exist_ok=True)
+    language = (request.get_json(silent=True) or {}).get('language') or request.form.get('language', 'en')
+    dictation = StreamingSession.create(TRANSCRIPTION_SESSIONS_DIR, session.get('id'), language)
+    return jsonify({'success': True, 'session_id': dictation.session_id}), 201
+
+
+@app.route('/transcribe/stream/<session_id>/chunk', methods=['POST'])
+@require_login()
+def dictation_chunk(session_id):
+    """
+    Append one raw audio chunk (?order=N) and return the partial and committed
+    text as of the last finished step. The next step runs in the background,
+    so its text arrives with a later chunk or with /finish.
+    """
+    rejected = _reject_upload_if_disk_full()
+    if rejected:
+        return rejected
+    dictation = _open_dictation_session(session_id)
+    if dictation is None:
+        return jsonify({'success': False, 'message': 'Unknown dictation session'}), 404
+    try:
+        chunk_order = int(_upload_param('order', 'X-Chunk-Order'))
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'Missing chunk order'}), 400
+    try:
+        if (request.content_length or 0) > config.TRANSCRIPTION_INMEMORY_MAX_BYTES:
+            raise ChunkTooLarge()
+        status = dictation.append(chunk_order, request.stream, config.TRANSCRIPTION_INMEMORY_MAX_BYTES)
+    except ChunkTooLarge:
+        return jsonify({'success': False, 'message': 'Audio chunk is too large'}), 413
+
+    _start_dictation_step(dictation)
+    state = dictation.state()
+    up_to_date = state['transcribed_bytes'] == dictation.recording.committed_size()
+    return _dictation_response(state, up_to_date, status=status)
+
+
+@app.route('/transcribe/stream/<session_id>/finish', methods=['POST'])
+@require_login()
+def finish_dictation(session_id):
+    dictation = _open_dictation_session(session_id)
+    if dictation is None:
+        return jsonify({'success': False, 'message': 'Unknown dictation session'}), 404
+    state, up_to_date = _advance_dictation(dictation, final=True)
+    if not up_to_date:
+        response = _dictation_response(state, False, message='Transcription is busy, please retry shortly')
+        response.headers['Retry-After'] = str(config.TRANSCRIPTION_RETRY_AFTER)
+        return response, 429
+    dictation.delete()
+    return _dictation_response(state, True)
+
+
+
 
 
 @app.route('/exam_instructions')
@@ -1624,27 +3116,78 @@ def exam_instructions():
 
 def upload_chunk():
 
-    exam_id = request.form.get('exam_id')
+    rejected = _reject_upload_if_disk_full()
+
+    if rejected:
+
+        return rejected
+
+    raw_body = request.mimetype == 'application/octet-stream'
+
+    if raw_body:
+
+        # Raw uploads carry their metadata in the query string or X- headers
+
+        exam_id = _upload_param('exam_id', 'X-Exam-Id')
+
+        student_id = _upload_param('student_id', 'X-Student-Id')
+
+        chunk_index = _upload_param('chunk_index', 'X-Chunk-Index')
+
+        timestamp = _upload_param('timestamp', 'X-Chunk-Timestamp')
+
+        video_chunk = request.stream
 
-    student_id = request.form.get('student_id')
+    else:
+
+        exam_id = request.form.get('exam_id')
 
-    chunk_index = request.form.get('chunk_index')
+        student_id = request.form.get('student_id')
 
-    timestamp = request.form.get('timestamp')
+        chunk_index = request.form.get('chunk_index')
 
-    video_chunk = request.files.get('video_chunk')
+        timestamp = request.form.get('timestamp')
+
+        video_chunk = request.files.get('video_chunk')
 
     if not (exam_id and student_id and video_chunk):
 
         return jsonify({'success': False, 'message': 'Missing data'}), 400
 
-    chunk_dir = os.path.join('proctor_chunks', f'exam_{exam_id}', f'student_{student_id}')
+    # These end up in a file path, so only plain integers are accepted
+    try:
+
+        exam_id, student_id, chunk_index = int(exam_id), int(student_id), int(chunk_index)
+
+        timestamp = int(timestamp or datetime.utcnow().timestamp() * 1000)
+
+    except (TypeError, ValueError):
+
+        return jsonify({'success': False, 'message': 'Invalid chunk metadata'}), 400
+
+    if (request.content_length or 0) > config.PROCTORING_CHUNK_MAX_BYTES:
+
+        return _chunk_too_large(chunk_index)
+
+    chunk_dir = os.path.join(PROCTOR_CHUNKS_DIR, f'exam_{exam_id}', f'student_{student_id}')
 
     os.makedirs(chunk_dir, exist_ok=True)
 
     chunk_path = os.path.join(chunk_dir, f'chunk_{chunk_index}_{timestamp}.webm')
 
-    video_chunk.save(chunk_path)
+    if raw_body:
+
+        try:
+
+            _write_stream(request.stream, chunk_path, max_length=config.PROCTORING_CHUNK_MAX_BYTES)
+
+        except ChunkTooLarge:
+
+            return _chunk_too_large(chunk_index)
+
+    else:
+
+        video_chunk.save(chunk_path)
 
     return jsonify({'success': True, 'path': chunk_path})
 
@@ -1688,25 +3231,26 @@ def proctoring_results(attempt_id):
 
     
 
-    # Fetch proctoring logs
-
+    # Raw logs are always shown; the timeline adds the heatmap and video seeking
     cur.execute(
-
-        "SELECT event_type, timestamp, screenshot_path FROM proctoring_logs WHERE attempt_id = ? ORDER BY timestamp ASC",
-
+        "SELECT id, event_type, timestamp, screenshot_path FROM proctoring_logs WHERE attempt_id = ? ORDER BY timestamp ASC",
         [attempt_id]
-
     )
-
     logs = [dict(row) for row in cur.fetchall()]
-
-    
-
     conn.close()
 
-    
+    timeline = _attempt_timeline(attempt_id, media_store.read_manifest(attempt_id), logs)
+
+    frame_times = []
+    opened = _open_frames(attempt_id)
+    if opened:
+        entries, _read_at, close = opened
+        close()
+        first_ms = entries[0].started_ms
+        frame_times = [max(entry.started_ms - first_ms, 0) for entry in entries]
 
-    return render_template('proctoring_results.html', attempt=attempt, logs=logs, attempt_id=attempt_id)
+    return render_template('proctoring_results.html', attempt=attempt, logs=logs, timeline=timeline,
+                           frame_times=frame_times, attempt_id=attempt_id)
 
 
 
@@ -1831,6 +3375,91 @@ def view_submission_file(assignment_id, student_id):
     file_path = result['submission_file_path']
     return send_from_directory(os.path.dirname(file_path), os.path.basename(file_path))
 
+# Formats that are already compressed are stored as-is instead of deflated again
+ZIP_STORED_EXTENSIONS = {
+    '.zip', '.gz', '.tgz', '.bz2', '.xz', '.7z', '.rar',
+    '.jpg', '.jpeg', '.png', '.gif', '.webp',
+    '.mp3', '.mp4', '.m4a', '.ogg', '.webm',
+    '.docx', '.xlsx', '.pptx', '.odt', '.ods', '.odp', '.pdf'
+}
+ZIP_STREAM_CHUNK_SIZE = 64 * 1024
+
+
+class _ZipStreamSink:
+    """Write-only file object that collects ZIP output until it is drained."""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def write(self, data):
+        self.buffer.extend(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+
+@app.route('/download_submissions/<int:assignment_id>')
+@require_login('teacher')
+def download_submissions(assignment_id):
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT id FROM assignments WHERE id=? AND created_by=?", (assignment_id, session['id']))
+    if not cur.fetchone():
+        conn.close()
+        return "Assignment not found", 404
+
+    cur.execute(
+        """
+        SELECT u.username, s.submission_file_path
+        FROM assignment_submissions s
+        JOIN users u ON u.id=s.student_id
+        WHERE s.assignment_id=? AND s.submission_file_path IS NOT NULL
+        ORDER BY u.username ASC
+        """,
+        [assignment_id]
+    )
+    submissions = [dict(row) for row in cur.fetchall()]
+    conn.close()
+
+    def generate():
+        # The archive is written to a non-seekable sink, so zipfile emits data
+        # descriptors and every file is copied through in fixed-size pieces.
+        sink = _ZipStreamSink()
+        with zipfile.ZipFile(sink, 'w') as zf:
+            for sub in submissions:
+                file_path = sub['submission_file_path']
+                if not os.path.isfile(file_path):
+                    continue
+                arcname = f"{sub['username']}/{os.path.basename(file_path)}"
+                zinfo = zipfile.ZipInfo.from_file(file_path, arcname)
+                if os.path.splitext(file_path)[1].lower() in ZIP_STORED_EXTENSIONS:
+                    zinfo.compress_type = zipfile.ZIP_STORED
+                else:
+                    zinfo.compress_type = zipfile.ZIP_DEFLATED
+                with open(file_path, 'rb') as src, zf.open(zinfo, 'w', force_zip64=True) as dest:
+                    while True:
+                        block = src.read(ZIP_STREAM_CHUNK_SIZE)
+                        if not block:
+                            break
+                        dest.write(block)
+                        if sink.buffer:
+                            yield sink.drain()
+                if sink.buffer:
+                    yield sink.drain()
+        yield sink.drain()
+
+    return Response(
+        generate(),
+        mimetype='application/zip',
+        headers={'Content-Disposition': f'attachment; filename=assignment_{assignment_id}_submissions.zip'}
+    )
+
 @app.route('/add_assignment_feedback', methods=['POST'])
 @require_login('teacher')
 def add_assignment_feedback():
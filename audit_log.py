@@ -0,0 +1,152 @@
+"""
+Batched audit logging for Voxiscribe.
+Audit events are queued in memory and written by a background thread with a
+single executemany per batch, instead of one connection and commit per event.
+"""
+import atexit
+import queue
+import threading
+import time
+from datetime import datetime
+
+INSERT_AUDIT_EVENTS = (
+    "INSERT INTO audit_events(event_name, status, related_id, related_type, details, created_at) "
+    "VALUES (?, ?, ?, ?, ?, ?)"
+)
+
+_STOP = object()
+
+
+class BatchedAuditLogger:
+    """
+    Bounded queue of audit events flushed every `batch_size` events or
+    `flush_interval_ms` milliseconds, whichever comes first.
+    On overflow, 'block' waits up to `block_timeout_ms` for room (backpressure)
+    and 'drop' discards immediately; both count what they could not queue.
+    Lost events (dropped or failed writes) are reported on stdout at most once
+    every `report_interval_s` seconds.
+    """
+
+    def __init__(self, connect, batch_size=100, flush_interval_ms=500, max_queue=10000,
+                 overflow='drop', block_timeout_ms=1000, report_interval_s=60):
+        self.connect = connect
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.overflow = overflow
+        self.block_timeout = block_timeout_ms / 1000.0
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+        self.report_interval = report_interval_s
+        self._reported = (0, 0)
+        self._reported_at = 0.0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='audit-log-writer', daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def log(self, event_name, status, related_id=None, related_type=None, details=None):
+        self.start()
+        row = (event_name, status, related_id, related_type, details,
+               datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'))
+        try:
+            if self.overflow == 'block':
+                self.queue.put(row, timeout=self.block_timeout)
+            else:
+                self.queue.put_nowait(row)
+            return True
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+
+    def stats(self):
+        return {
+            'queued': self.queue.qsize(),
+            'written': self.written,
+            'dropped': self.dropped,
+            'failed': self.failed
+        }
+
+    def report_losses(self, force=False):
+        """Print the dropped/failed counters if they grew since the last report."""
+        now = time.monotonic()
+        lost = (self.dropped, self.failed)
+        if lost == self._reported or (not force and now - self._reported_at < self.report_interval):
+            return False
+        print(f"Audit log lost events: {lost[0] - self._reported[0]} dropped, {lost[1] - self._reported[1]} failed "
+              f"since last report (totals: {lost[0]} dropped, {lost[1]} failed, {self.written} written)")
+        self._reported = lost
+        self._reported_at = now
+        return True
+
+    def stop(self, timeout=5.0):
+        """Flush everything queued so far and stop the writer thread."""
+        thread = self._thread
+        if thread is None or not thread.is_alive():
+            return
+        try:
+            self.queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            pass
+        thread.join(timeout)
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is _STOP:
+                return
+            batch = [item]
+            stop = False
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+            if stop:
+                batch.extend(self._drain())
+            self._write(batch)
+            self.report_losses(force=stop)
+            if stop:
+                return
+
+    def _drain(self):
+        rows = []
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                return rows
+            if item is not _STOP:
+                rows.append(item)
+
+    def _write(self, batch):
+        try:
+            conn = self.connect()
+            try:
+                cur = conn.cursor()
+                cur.executemany(INSERT_AUDIT_EVENTS, batch)
+                conn.commit()
+            finally:
+                conn.close()
+            self.written += len(batch)
+        except Exception as e:
+            self.failed += len(batch)
+            print(f"Failed to record {len(batch)} audit events: {e}")
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Compare transcription throughput with and without dynamic batching.
+The same synthetic clips are pushed through a TranscriptionJobQueue once per
+batch size, using the engine configured by SPEECH_ENGINE, and jobs per
+second and job latency are printed for each run. Batching only changes the
+engine work for engines that batch natively, e.g.
+
+    SPEECH_ENGINE=whisper SPEECH_MODEL_SIZE=tiny python benchmark_batching.py --jobs 64 --batch-sizes 1,4,8
+
+With --parity the clips (plus one longer than a 30 second window) are also
+transcribed in this process by engine.transcribe_batch() and one at a time
+by engine.transcribe(), and any clip whose texts differ is listed; the exit
+status is 1 if there is one.
+"""
+import argparse
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import config
+from speech_server import get_engine, to_pcm
+from synthetic_audio import speech_like, to_wav
+from transcription_jobs import TranscriptionJobQueue
+
+
+def wait_for(queue, job_ids, timeout):
+    deadline = time.monotonic() + timeout
+    states = {}
+    while len(states) < len(job_ids):
+        if time.monotonic() > deadline:
+            raise TimeoutError(f'{len(job_ids) - len(states)} jobs still running')
+        for job_id in job_ids:
+            if job_id not in states:
+                state = queue.get(job_id)
+                if state and state['state'] in ('done', 'failed'):
+                    states[job_id] = state
+        time.sleep(0.01)
+    return [states[job_id] for job_id in job_ids]
+
+
+def run(clips, batch_size, workers, batch_wait_ms, timeout):
+    jobs_dir = tempfile.mkdtemp(prefix='voxiscribe-batching-')
+    queue = TranscriptionJobQueue(jobs_dir, workers=workers, max_queue=len(clips) + workers,
+                                  start_method=config.TRANSCRIPTION_START_METHOD,
+                                  batch_size=batch_size, batch_wait_ms=batch_wait_ms)
+    try:
+        # Start every pool process and load the model before timing anything
+        wait_for(queue, [queue.submit(clips[0]) for _ in range(workers * batch_size)], timeout)
+        started = time.time()
+        states = wait_for(queue, [queue.submit(clip) for clip in clips], timeout)
+        elapsed = max(state.get('finished_at', started) for state in states) - started
+        latencies = sorted((state['finished_at'] - state['enqueued_at']) * 1000 for state in states if 'finished_at' in state)
+        return {
+            'batch_size': batch_size,
+            'jobs': len(clips),
+            'failed': sum(state['state'] != 'done' for state in states),
+            'jobs_per_second': round(len(clips) / elapsed, 2) if elapsed else None,
+            'p50_ms': round(float(np.percentile(latencies, 50)), 1) if latencies else None,
+            'p95_ms': round(float(np.percentile(latencies, 95)), 1) if latencies else None,
+            'avg_batch': queue.stats()['avg_batch']
+        }
+    finally:
+        queue.close()
+        shutil.rmtree(jobs_dir, ignore_errors=True)
+
+
+def check_parity(clips, language='en'):
+    """Return (index, batched text, unbatched text) for every clip the two paths disagree on."""
+    engine, _load_ms = get_engine()
+    pcms = [to_pcm(clip, engine) for clip in clips]
+    batched = engine.transcribe_batch(pcms, language)
+    single = [engine.transcribe(pcm, language) for pcm in pcms]
+    return [(index, a, b) for index, (a, b) in enumerate(zip(batched, single))
+            if ' '.join(a.lower().split()) != ' '.join(b.lower().split())]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--jobs', type=int, default=32)
+    parser.add_argument('--seconds', type=float, default=6.0, help='length of each clip')
+    parser.add_argument('--batch-sizes', default='1,4,8')
+    parser.add_argument('--workers', type=int, default=config.TRANSCRIPTION_WORKERS)
+    parser.add_argument('--batch-wait-ms', type=int, default=config.TRANSCRIPTION_BATCH_WAIT_MS)
+    parser.add_argument('--timeout', type=float, default=600)
+    parser.add_argument('--parity', action='store_true', help='compare batched and unbatched output first')
+    args = parser.parse_args()
+
+    clips = [to_wav(speech_like(args.seconds, seed)) for seed in range(args.jobs)]
+    print(f"engine={config.SPEECH_ENGINE} model={config.SPEECH_MODEL_SIZE} workers={args.workers} "
+          f"jobs={args.jobs} clip={args.seconds}s wait={args.batch_wait_ms}ms")
+    if args.parity:
+        mismatches = check_parity(clips + [to_wav(speech_like(45.0, args.jobs))])
+        for index, batched, single in mismatches:
+            print(f"clip {index}: batched={batched!r} unbatched={single!r}")
+        print(f"parity: {len(clips) + 1 - len(mismatches)}/{len(clips) + 1} clips match")
+        if mismatches:
+            sys.exit(1)
+    baseline = None
+    for batch_size in [int(size) for size in args.batch_sizes.split(',')]:
+        result = run(clips, batch_size, args.workers, args.batch_wait_ms, args.timeout)
+        baseline = baseline or result['jobs_per_second']
+        speedup = round(result['jobs_per_second'] / baseline, 2) if baseline and result['jobs_per_second'] else None
+        print(f"batch={batch_size:<3} {result['jobs_per_second']} jobs/s  x{speedup}  p50={result['p50_ms']}ms "
+              f"p95={result['p95_ms']}ms  avg_batch={result['avg_batch']}  failed={result['failed']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Transcription benchmark for Voxiscribe.
+Builds the deterministic synthetic corpus from synthetic_audio and measures
+the configured SPEECH_ENGINE at several concurrency levels, both directly
+through speech_server and end to end through /transcribe with the Flask
+test client (upload, job queue, polling). For every level it reports the
+real-time factor, p50/p95/p99 latency, throughput and the memory high-water
+mark, and writes everything to a JSON file that can be compared with a
+previous run:
+
+    python benchmark_transcription.py --concurrency 1,2,4,8 --output before.json
+    python benchmark_transcription.py --concurrency 1,2,4,8 --output after.json --baseline before.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+
+import synthetic_audio
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+MODES = ('direct', 'http')
+
+
+def max_rss_mb(children=False):
+    """Peak resident set size of this process (or its reaped children), in MB."""
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return round(usage.ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def percentile(values, q):
+    return round(float(np.percentile(values, q)), 1) if len(values) else None
+
+
+def summarize(samples, elapsed, concurrency):
+    done = [sample for sample in samples if sample['ok']]
+    latencies = np.array([sample['latency_ms'] for sample in done])
+    audio = sum(sample['audio_seconds'] for sample in done)
+    # Real-time factor: seconds spent per second of audio, lower is better
+    rtfs = np.array([sample['latency_ms'] / 1000 / sample['audio_seconds'] for sample in done])
+    return {
+        'concurrency': concurrency,
+        'requests': len(samples),
+        'failed': len(samples) - len(done),
+        'rejected': sum(sample.get('rejected', 0) for sample in samples),
+        'elapsed_seconds': round(elapsed, 3),
+        'throughput_rps': round(len(done) / elapsed, 3) if elapsed else None,
+        'audio_seconds_per_second': round(audio / elapsed, 3) if elapsed else None,
+        'rtf': {
+            'aggregate': round(float(latencies.sum()) / 1000 / audio, 4) if audio else None,
+            'p50': round(float(np.percentile(rtfs, 50)), 4) if len(rtfs) else None,
+            'p95': round(float(np.percentile(rtfs, 95)), 4) if len(rtfs) else None
+        },
+        'latency_ms': {
+            'p50': percentile(latencies, 50),
+            'p95': percentile(latencies, 95),
+            'p99': percentile(latencies, 99),
+            'max': round(float(latencies.max()), 1) if len(latencies) else None
+        },
+        'max_rss_mb': max_rss_mb()
+    }
+
+
+def run_level(request, corpus, concurrency, rounds):
+    work = [clip for _ in range(rounds) for clip in corpus]
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        started = time.perf_counter()
+        samples = list(pool.map(request, work))
+        elapsed = time.perf_counter() - started
+    return summarize(samples, elapsed, concurrency)
+
+
+def direct_request(clip):
+    from speech_server import transcribe_with_stats
+    started = time.perf_counter()
+    try:
+        transcribe_with_stats(clip['wav'], 'en')
+        ok = True
+    except Exception as e:
+        print(f"{clip['name']}: {e}")
+        ok = False
+    return {'latency_ms': (time.perf_counter() - started) * 1000, 'audio_seconds': clip['seconds'], 'ok': ok}
+
+
+class HttpRequest:
+    """POSTs a clip to /transcribe and polls its job until it finishes."""
+
+    def __init__(self, flask_app, poll_interval):
+        self.app = flask_app
+        self.poll_interval = poll_interval
+
+    def __call__(self, clip):
+        client = self.app.test_client()
+        started = time.perf_counter()
+        rejected = 0
+        while True:
+            response = client.post('/transcribe?language=en', data=clip['wav'], content_type='application/octet-stream')
+            if response.status_code != 429:
+                break
+            rejected += 1
+            time.sleep(self.poll_interval)
+        body = response.get_json() or {}
+        ok = response.status_code in (200, 202) and body.get('success', False)
+        if ok and body.get('state') != 'done':
+            while True:
+                job = (client.get(f"/transcribe/jobs/{body['job_id']}").get_json() or {}).get('job') or {}
+                if job.get('state') in ('done', 'failed'):
+                    ok = job['state'] == 'done'
+                    break
+                time.sleep(self.poll_interval)
+        return {'latency_ms': (time.perf_counter() - started) * 1000, 'audio_seconds': clip['seconds'],
+                'ok': ok, 'rejected': rejected}
+
+
+def prepare_environment(workdir, keep_cache):
+    # Must run before config is imported. Throwaway database, jobs and upload
+    # tree, even when the shell points at real ones; no retention sweeps over
+    # real uploads
+    os.environ.pop('DATABASE_URL', None)
+    os.environ['DATABASE_PATH'] = os.path.join(workdir, 'benchmark.db')
+    os.environ['TRANSCRIPTION_JOBS_PATH'] = os.path.join(workdir, 'jobs')
+    os.environ['RETENTION_INTERVAL'] = '0'
+    if not keep_cache:
+        os.environ['TRANSCRIPTION_CACHE_ENABLED'] = 'false'
+
+
+def load_web_app(workdir):
+    import app as webapp
+    webapp.app.root_path = workdir
+    webapp.app.config['TESTING'] = True
+    return webapp
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def compare(baseline, results):
+    """Print throughput, p95 latency and RTF of this run relative to a baseline run."""
+    if baseline['meta'].get('corpus_digest') != results['meta']['corpus_digest']:
+        print('warning: the baseline used a different corpus')
+    for mode in MODES:
+        before = {level['concurrency']: level for level in baseline.get(mode, [])}
+        for level in results.get(mode, []):
+            old = before.get(level['concurrency'])
+            if not old:
+                continue
+            ratios = []
+            for label, new_value, old_value in (
+                ('throughput', level['throughput_rps'], old['throughput_rps']),
+                ('p95', level['latency_ms']['p95'], old['latency_ms']['p95']),
+                ('rtf', level['rtf']['aggregate'], old['rtf']['aggregate']),
+            ):
+                ratios.append(f"{label} x{round(new_value / old_value, 2)}" if new_value and old_value else f"{label} n/a")
+            print(f"{mode:<6} c={level['concurrency']:<3} " + '  '.join(ratios))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark transcription on a synthetic audio corpus.')
+    parser.add_argument('--concurrency', default='1,2,4,8', help='comma-separated concurrency levels')
+    parser.add_argument('--lengths', default=','.join(str(n) for n in synthetic_audio.DEFAULT_LENGTHS),
+                        help='clip lengths in seconds')
+    parser.add_argument('--rounds', type=int, default=1, help='passes over the corpus per level')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--modes', default=','.join(MODES))
+    parser.add_argument('--poll-interval', type=float, default=0.01)
+    parser.add_argument('--keep-cache', action='store_true',
+                        help='leave the transcription cache on (repeated clips are then answered from it)')
+    parser.add_argument('--corpus-dir', help='also write the corpus there as WAV files')
+    parser.add_argument('--output', default=f"transcription-benchmark-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    parser.add_argument('--baseline', help='earlier results file to compare against')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='voxiscribe-benchmark-')
+    prepare_environment(workdir, args.keep_cache)
+    levels = [int(level) for level in args.concurrency.split(',')]
+    modes = [mode for mode in args.modes.split(',') if mode in MODES]
+
+    corpus = synthetic_audio.build_corpus([float(n) for n in args.lengths.split(',')], seed=args.seed)
+    if args.corpus_dir:
+        os.makedirs(args.corpus_dir, exist_ok=True)
+        for clip in corpus:
+            with open(os.path.join(args.corpus_dir, f"{clip['name']}.wav"), 'wb') as f:
+                f.write(clip['wav'])
+
+    import config
+    from speech_server import engine_class
+    results = {'meta': {
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'git_commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'engine': config.SPEECH_ENGINE,
+        'model': config.SPEECH_MODEL_SIZE,
+        'settings': {
+            'vad_enabled': config.VAD_ENABLED,
+            'transcription_workers': config.TRANSCRIPTION_WORKERS,
+            'batch_size': config.TRANSCRIPTION_BATCH_SIZE if engine_class().batched else 1,
+            'batch_wait_ms': config.TRANSCRIPTION_BATCH_WAIT_MS,
+            'segment_workers': config.SPEECH_SEGMENT_WORKERS,
+            'cache_enabled': config.TRANSCRIPTION_CACHE_ENABLED
+        },
+        'corpus_digest': synthetic_audio.corpus_digest(corpus),
+        'corpus_clips': len(corpus),
+        'corpus_audio_seconds': sum(clip['seconds'] for clip in corpus),
+        'rounds': args.rounds
+    }}
+
+    for mode in modes:
+        if mode == 'direct':
+            request = direct_request
+        else:
+            webapp = load_web_app(workdir)
+            request = HttpRequest(webapp.app, args.poll_interval)
+        request(corpus[0])  # warm-up: model load and pool start-up are not measured
+        results[mode] = []
+        for level in levels:
+            summary = run_level(request, corpus, level, args.rounds)
+            results[mode].append(summary)
+            print(f"{mode:<6} c={level:<3} {summary['throughput_rps']} req/s  rtf={summary['rtf']['aggregate']}  "
+                  f"p50={summary['latency_ms']['p50']}ms p95={summary['latency_ms']['p95']}ms "
+                  f"p99={summary['latency_ms']['p99']}ms  rss={summary['max_rss_mb']}MB  failed={summary['failed']}")
+        if mode == 'http':
+            # Pool processes only count towards RUSAGE_CHILDREN once they have exited
+            webapp.transcription_jobs.close()
+            results['meta']['pool_max_rss_mb'] = max_rss_mb(children=True)
+
+    shutil.rmtree(workdir, ignore_errors=True)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(json.load(f), results)
+
+
+if __name__ == '__main__':
+    main()
@@ -12,4 +12,112 @@ SECRET_KEY = os.getenv('SECRET_KEY', 'dev-secret-key')
 FLASK_ENV = os.getenv('FLASK_ENV', 'development')
 
 # Proctoring configuration
-PROCTORING_STORE_IN_DB = os.getenv('PROCTORING_STORE_IN_DB', 'True').lower() == 'true'
\ No newline at end of file
+# Videos are served from the media store; this also keeps a copy in the database
+PROCTORING_STORE_IN_DB = os.getenv('PROCTORING_STORE_IN_DB', 'False').lower() == 'true'
+# Background video assembly
+VIDEO_ASSEMBLY_WORKERS = int(os.getenv('VIDEO_ASSEMBLY_WORKERS', '2'))
+VIDEO_ASSEMBLY_QUEUE_SIZE = int(os.getenv('VIDEO_ASSEMBLY_QUEUE_SIZE', '256'))
+VIDEO_ASSEMBLY_MAX_RETRIES = int(os.getenv('VIDEO_ASSEMBLY_MAX_RETRIES', '3'))
+VIDEO_ASSEMBLY_RETRY_BACKOFF = float(os.getenv('VIDEO_ASSEMBLY_RETRY_BACKOFF', '5'))
+VIDEO_ASSEMBLY_SWEEP_INTERVAL = int(os.getenv('VIDEO_ASSEMBLY_SWEEP_INTERVAL', '60'))
+VIDEO_ASSEMBLY_TIMEOUT_GRACE = int(os.getenv('VIDEO_ASSEMBLY_TIMEOUT_GRACE', '5'))
+
+# Proctoring media store ('local' directory or 'object' store stand-in)
+MEDIA_STORE_BACKEND = os.getenv('MEDIA_STORE_BACKEND', 'local')
+MEDIA_STORE_PATH = os.getenv('MEDIA_STORE_PATH')
+MEDIA_STAGING_PATH = os.getenv('MEDIA_STAGING_PATH')
+
+# Audit logging
+AUDIT_BATCH_SIZE = int(os.getenv('AUDIT_BATCH_SIZE', '100'))
+AUDIT_FLUSH_INTERVAL_MS = int(os.getenv('AUDIT_FLUSH_INTERVAL_MS', '500'))
+AUDIT_QUEUE_SIZE = int(os.getenv('AUDIT_QUEUE_SIZE', '10000'))
+AUDIT_OVERFLOW = os.getenv('AUDIT_OVERFLOW', 'drop')  # 'drop' or 'block'
+AUDIT_BLOCK_TIMEOUT_MS = int(os.getenv('AUDIT_BLOCK_TIMEOUT_MS', '1000'))
+
+# Proctoring event ingestion
+PROCTORING_LOG_MAX_BATCH = int(os.getenv('PROCTORING_LOG_MAX_BATCH', '500'))
+PROCTORING_LOG_MAX_CLOCK_SKEW = int(os.getenv('PROCTORING_LOG_MAX_CLOCK_SKEW', '300'))
+PROCTORING_TIMELINE_BUCKET_SECONDS = int(os.getenv('PROCTORING_TIMELINE_BUCKET_SECONDS', '10'))
+
+# Upload retention and disk protection
+RETENTION_ATTEMPT_UPLOADS_DAYS = int(os.getenv('RETENTION_ATTEMPT_UPLOADS_DAYS', '30'))
+RETENTION_PROCTOR_CHUNKS_DAYS = int(os.getenv('RETENTION_PROCTOR_CHUNKS_DAYS', '14'))
+RETENTION_AUTH_DATA_DAYS = int(os.getenv('RETENTION_AUTH_DATA_DAYS', '0'))
+RETENTION_MEDIA_DAYS = int(os.getenv('RETENTION_MEDIA_DAYS', '0'))
+RETENTION_REMOVE_ORPHANS = os.getenv('RETENTION_REMOVE_ORPHANS', 'True').lower() == 'true'
+RETENTION_ORPHAN_GRACE_SECONDS = int(os.getenv('RETENTION_ORPHAN_GRACE_SECONDS', '3600'))
+RETENTION_BATCH_SIZE = int(os.getenv('RETENTION_BATCH_SIZE', '50'))
+RETENTION_BATCH_PAUSE_MS = int(os.getenv('RETENTION_BATCH_PAUSE_MS', '200'))
+RETENTION_INTERVAL = int(os.getenv('RETENTION_INTERVAL', '3600'))
+DISK_HIGH_WATERMARK = float(os.getenv('DISK_HIGH_WATERMARK', '0.9'))
+
+# Adaptive proctoring recording settings (ingest figures are per worker process)
+PROCTORING_INGEST_CAPACITY_BPS = int(os.getenv('PROCTORING_INGEST_CAPACITY_BPS', str(8 * 1024 * 1024)))
+PROCTORING_INGEST_WINDOW_SECONDS = int(os.getenv('PROCTORING_INGEST_WINDOW_SECONDS', '60'))
+PROCTORING_PROFILE_REFRESH_SECONDS = int(os.getenv('PROCTORING_PROFILE_REFRESH_SECONDS', '15'))
+PROCTORING_MAX_PROFILE = os.getenv('PROCTORING_MAX_PROFILE', 'high')  # high, medium, low or minimal
+PROCTORING_MIN_PROFILE = os.getenv('PROCTORING_MIN_PROFILE', 'minimal')
+PROCTORING_CHUNK_MAX_BYTES = int(os.getenv('PROCTORING_CHUNK_MAX_BYTES', str(16 * 1024 * 1024)))
+DISK_SOFT_WATERMARK = float(os.getenv('DISK_SOFT_WATERMARK', '0.75'))
+
+# Snapshot proctoring: still JPEG frames instead of a video stream
+PROCTORING_MODE = os.getenv('PROCTORING_MODE', 'video')  # 'video' or 'snapshot'
+PROCTORING_SNAPSHOT_INTERVAL = int(os.getenv('PROCTORING_SNAPSHOT_INTERVAL', '10'))
+PROCTORING_SNAPSHOT_WIDTH = int(os.getenv('PROCTORING_SNAPSHOT_WIDTH', '320'))
+PROCTORING_SNAPSHOT_QUALITY = float(os.getenv('PROCTORING_SNAPSHOT_QUALITY', '0.6'))
+PROCTORING_SNAPSHOT_MAX_BYTES = int(os.getenv('PROCTORING_SNAPSHOT_MAX_BYTES', str(256 * 1024)))
+
+# Speech transcription ('placeholder', or 'whisper' with faster-whisper installed)
+SPEECH_ENGINE = os.getenv('SPEECH_ENGINE', 'placeholder')
+SPEECH_MODEL_SIZE = os.getenv('SPEECH_MODEL_SIZE', 'base')  # tiny, base, small, medium...
+SPEECH_MODEL_DIR = os.getenv('SPEECH_MODEL_DIR')
+SPEECH_COMPUTE_TYPE = os.getenv('SPEECH_COMPUTE_TYPE', 'int8')
+SPEECH_CPU_THREADS = int(os.getenv('SPEECH_CPU_THREADS', '0'))  # 0 lets the engine decide
+SPEECH_BEAM_SIZE = int(os.getenv('SPEECH_BEAM_SIZE', '1'))
+SPEECH_SEGMENT_WORKERS = int(os.getenv('SPEECH_SEGMENT_WORKERS', '1'))  # concurrent segments per job
+
+# Voice-activity detection: silence is trimmed and long clips split at pauses
+VAD_ENABLED = os.getenv('VAD_ENABLED', 'true').lower() == 'true'
+VAD_MIN_SILENCE_MS = int(os.getenv('VAD_MIN_SILENCE_MS', '500'))  # shorter pauses are kept
+VAD_PAD_MS = int(os.getenv('VAD_PAD_MS', '200'))
+VAD_MAX_SEGMENT_SECONDS = int(os.getenv('VAD_MAX_SEGMENT_SECONDS', '30'))
+
+# Transcription job queue (per web worker process)
+TRANSCRIPTION_WORKERS = int(os.getenv('TRANSCRIPTION_WORKERS', '2'))
+TRANSCRIPTION_QUEUE_SIZE = int(os.getenv('TRANSCRIPTION_QUEUE_SIZE', '16'))
+TRANSCRIPTION_JOB_TTL = int(os.getenv('TRANSCRIPTION_JOB_TTL', '3600'))
+TRANSCRIPTION_JOBS_PATH = os.getenv('TRANSCRIPTION_JOBS_PATH')
+TRANSCRIPTION_START_METHOD = os.getenv('TRANSCRIPTION_START_METHOD', 'spawn')
+TRANSCRIPTION_RETRY_AFTER = int(os.getenv('TRANSCRIPTION_RETRY_AFTER', '5'))
+# Dynamic batching; only used with engines that batch natively (whisper)
+TRANSCRIPTION_BATCH_SIZE = int(os.getenv('TRANSCRIPTION_BATCH_SIZE', '8'))
+TRANSCRIPTION_BATCH_WAIT_MS = int(os.getenv('TRANSCRIPTION_BATCH_WAIT_MS', '20'))
+TRANSCRIPTION_SESSIONS_PATH = os.getenv('TRANSCRIPTION_SESSIONS_PATH')
+TRANSCRIPTION_STREAM_MAX_TAIL_SECONDS = int(os.getenv('TRANSCRIPTION_STREAM_MAX_TAIL_SECONDS', '20'))
+TRANSCRIPTION_STREAM_STEP_TIMEOUT = int(os.getenv('TRANSCRIPTION_STREAM_STEP_TIMEOUT', '10'))
+TRANSCRIPTION_INMEMORY_MAX_BYTES = int(os.getenv('TRANSCRIPTION_INMEMORY_MAX_BYTES', str(16 * 1024 * 1024)))
+
+# Transcription result cache keyed by audio hash, language and engine version
+TRANSCRIPTION_CACHE_ENABLED = os.getenv('TRANSCRIPTION_CACHE_ENABLED', 'true').lower() == 'true'
+TRANSCRIPTION_CACHE_ENTRIES = int(os.getenv('TRANSCRIPTION_CACHE_ENTRIES', '1000'))
+TRANSCRIPTION_CACHE_MAX_BYTES = int(os.getenv('TRANSCRIPTION_CACHE_MAX_BYTES', str(8 * 1024 * 1024)))
+TRANSCRIPTION_CACHE_PATH = os.getenv('TRANSCRIPTION_CACHE_PATH')  # unset keeps the cache in memory only
+TRANSCRIPTION_CACHE_DISK_MAX_BYTES = int(os.getenv('TRANSCRIPTION_CACHE_DISK_MAX_BYTES', str(64 * 1024 * 1024)))
+
+# Speaker verification against the voice sample enrolled at registration
+VOICE_CHECK_ENABLED = os.getenv('VOICE_CHECK_ENABLED', 'true').lower() == 'true'
+VOICE_CHECK_INTERVAL = int(os.getenv('VOICE_CHECK_INTERVAL', '0'))  # seconds between re-checks; 0 checks at exam start only
+VOICE_CHECK_SECONDS = int(os.getenv('VOICE_CHECK_SECONDS', '5'))
+VOICE_CHECK_MAX_BYTES = int(os.getenv('VOICE_CHECK_MAX_BYTES', str(2 * 1024 * 1024)))
+VOICE_MATCH_THRESHOLD = float(os.getenv('VOICE_MATCH_THRESHOLD', '0.6'))
+
+# Face checks against the face image enrolled at registration
+FACE_CHECK_ENABLED = os.getenv('FACE_CHECK_ENABLED', 'true').lower() == 'true'
+FACE_CHECK_INTERVAL = int(os.getenv('FACE_CHECK_INTERVAL', '30'))  # seconds between frames sent for a face check
+FACE_CHECK_MAX_BYTES = int(os.getenv('FACE_CHECK_MAX_BYTES', str(1024 * 1024)))
+FACE_MATCH_THRESHOLD = float(os.getenv('FACE_MATCH_THRESHOLD', '0.45'))
+# The threshold is not calibrated on real webcams yet, so by default a mismatch is
+# only reported (response and /admin/face_audit) and not logged as a proctoring event
+FACE_MISMATCH_EVENTS = os.getenv('FACE_MISMATCH_EVENTS', 'false').lower() == 'true'
+# Same for frames the detector finds no face in (logged as student_left_frame when on)
+FACE_ABSENCE_EVENTS = os.getenv('FACE_ABSENCE_EVENTS', 'false').lower() == 'true'
@@ -83,6 +83,7 @@ CREATE TABLE IF NOT EXISTS proctoring_videos (
     id SERIAL PRIMARY KEY,
     attempt_id INTEGER NOT NULL,
     video_blob BYTEA,
+    video_oid OID,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (attempt_id) REFERENCES exam_attempts(id)
 );
@@ -0,0 +1,339 @@
+"""
+Face verification for Voxiscribe.
+An enrolled face.jpg or a frame captured during an exam is reduced to a
+compact float32 embedding on the CPU with Pillow and NumPy: the face is
+located from its skin-coloured pixels, cropped, smoothed and described by
+histograms of gradient orientations, which a fixed random projection shrinks
+to EMBEDDING_SIZE values. Every enrolled embedding lives in one
+memory-mapped array file, so processes share the index through the page
+cache instead of each loading it, and scoring a batch of frames against
+the whole cohort is a single matrix product.
+"""
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from functools import lru_cache
+
+import numpy as np
+
+try:
+    from PIL import Image, ImageFilter, ImageOps
+except ImportError:  # face checks are unavailable without Pillow
+    Image = ImageFilter = ImageOps = None
+
+try:
+    import fcntl
+except ImportError:  # Windows development servers
+    fcntl = None
+
+# Frames are decoded at most this large; faces are described at FACE_SIZE square
+DECODE_SIZE = 320
+FACE_SIZE = 64
+CELL_SIZE = 8
+ORIENTATIONS = 9
+EMBEDDING_SIZE = 128
+PROJECTION_SEED = 20240501
+# Share of the frame that must be skin-coloured before it is taken to contain a face;
+# above the maximum it is a skin-toned wall or backdrop rather than a face
+MIN_SKIN_FRACTION = 0.02
+MAX_SKIN_FRACTION = 0.6
+MIN_FACE_PIXELS = 24
+# A face (with some neck) is one solid blob, about as tall as it is wide,
+# that does not span the whole frame
+MIN_BLOB_FILL = 0.2
+MIN_ASPECT, MAX_ASPECT = 0.7, 2.5
+MAX_FRAME_WIDTH = 0.85
+# Below this many enrolled faces there is no cohort to centre against
+MIN_COHORT = 5
+
+EMBEDDINGS_FILE = 'faces.f32'
+USERNAMES_FILE = 'faces.json'
+LOCK_FILE = '.faces.lock'
+ROW_BYTES = EMBEDDING_SIZE * 4
+
+
+class NoFaceFound(ValueError):
+    """Raised when an image has nothing that looks like a face."""
+
+
+def load_image(source):
+    """Decode a path, bytes or file-like JPEG/PNG into an RGB uint8 array of at most DECODE_SIZE."""
+    if Image is None:
+        raise RuntimeError('Face checks require the Pillow package')
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    with Image.open(source) as image:
+        # JPEGs are scaled down while decoding, which skips most of the IDCT work
+        image.draft('RGB', (DECODE_SIZE, DECODE_SIZE))
+        image = ImageOps.exif_transpose(image).convert('RGB')
+        image.thumbnail((DECODE_SIZE, DECODE_SIZE))
+        return np.asarray(image)
+
+
+def face_box(rgb):
+    """
+    Return (left, top, right, bottom) around the skin-coloured region; raises
+    NoFaceFound when there is too little or too much skin, or when it is not
+    one compact, roughly face-shaped blob.
+    """
+    rgb = rgb.astype(np.float32)
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    # Skin occupies a compact range of chroma whatever the brightness (ITU-R BT.601 YCbCr)
+    cb = 128 - 0.168736 * r - 0.331264 * g + 0.5 * b
+    cr = 128 + 0.5 * r - 0.418688 * g - 0.081312 * b
+    ys, xs = np.nonzero((cb >= 77) & (cb <= 127) & (cr >= 133) & (cr <= 173))
+    if not MIN_SKIN_FRACTION * r.size <= len(xs) <= MAX_SKIN_FRACTION * r.size:
+        raise NoFaceFound('No face found in the image')
+    left, right = np.percentile(xs, [5, 95]).astype(int)
+    top, lowest = np.percentile(ys, [5, 95]).astype(int)
+    width, height = right - left, lowest - top
+    if width < MIN_FACE_PIXELS or width > MAX_FRAME_WIDTH * r.shape[1]:
+        raise NoFaceFound('No face found in the image')
+    # Scattered skin-toned pixels (wood, beige textures) fill little of their box
+    inside = np.count_nonzero((xs >= left) & (xs <= right) & (ys >= top) & (ys <= lowest))
+    if not MIN_ASPECT <= height / width <= MAX_ASPECT or inside < MIN_BLOB_FILL * width * max(height, 1):
+        raise NoFaceFound('No face found in the image')
+    # Faces are a little taller than wide; anything further down is neck and shoulders
+    bottom = min(rgb.shape[0], top + int(width * 1.25))
+    return int(left), top, int(right), bottom
+
+
+@lru_cache(maxsize=1)
+def _projection():
+    cells = FACE_SIZE // CELL_SIZE
+    features = (cells - 1) ** 2 * 4 * ORIENTATIONS
+    rng = np.random.default_rng(PROJECTION_SEED)
+    return (rng.standard_normal((features, EMBEDDING_SIZE)) / np.sqrt(EMBEDDING_SIZE)).astype(np.float32)
+
+
+def _orientation_histograms(gray):
+    """HOG: per-cell orientation histograms, L2-normalised over overlapping 2x2 cell blocks."""
+    gy, gx = np.gradient(gray)
+    magnitude = np.hypot(gx, gy)
+    # Unsigned orientation: a dark-to-light edge matches the light-to-dark one
+    bins = (np.mod(np.arctan2(gy, gx), np.pi) / np.pi * ORIENTATIONS).astype(int) % ORIENTATIONS
+    cells = FACE_SIZE // CELL_SIZE
+    cell_index = np.arange(FACE_SIZE) // CELL_SIZE
+    flat = (cell_index[:, None] * cells + cell_index[None, :]) * ORIENTATIONS + bins
+    histograms = np.bincount(flat.ravel(), weights=magnitude.ravel(), minlength=cells * cells * ORIENTATIONS)
+    histograms = histograms.reshape(cells, cells, ORIENTATIONS)
+    blocks = np.concatenate([histograms[:-1, :-1], histograms[1:, :-1], histograms[:-1, 1:], histograms[1:, 1:]], axis=2)
+    blocks /= np.linalg.norm(blocks, axis=2, keepdims=True) + 1e-6
+    return blocks.ravel()
+
+
+def embedding(source):
+    """Return the unit-length float32 embedding of the face in an image; raises NoFaceFound."""
+    rgb = load_image(source) if not isinstance(source, np.ndarray) else source
+    left, top, right, bottom = face_box(rgb)
+    face = Image.fromarray(rgb[top:bottom, left:right]).convert('L')
+    # Smooth away sensor noise before taking gradients; flat skin would otherwise fill every bin
+    face = face.filter(ImageFilter.GaussianBlur(face.width / FACE_SIZE)).resize((FACE_SIZE, FACE_SIZE), Image.BOX)
+    gray = np.asarray(ImageOps.autocontrast(face, cutoff=2), dtype=np.float32) / 255.0
+    # Square root of the histograms (Hellinger) keeps strong edges from dominating
+    vector = np.sqrt(_orientation_histograms(gray)) @ _projection()
+    return (vector / (np.linalg.norm(vector) + 1e-9)).astype(np.float32)
+
+
+class _IndexLock:
+    def __init__(self, directory):
+        self.thread_lock = threading.Lock()
+        self.lock_path = os.path.join(directory, LOCK_FILE)
+        self.lock_file = None
+
+    def __enter__(self):
+        self.thread_lock.acquire()
+        if fcntl is not None:
+            self.lock_file = open(self.lock_path, 'w')
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.lock_file is not None:
+            self.lock_file.close()
+            self.lock_file = None
+        self.thread_lock.release()
+        return False
+
+
+class _Snapshot:
+    """One consistent view of the index: usernames, the mapped rows and their cohort statistics."""
+
+    def __init__(self, usernames, matrix):
+        self.usernames = usernames
+        self.rows = {username: row for row, username in enumerate(usernames)}
+        self.matrix = matrix
+        self.calibrated = len(usernames) >= MIN_COHORT
+        # Scores are cosines about the cohort mean. Expanding (q - mean).(e - mean)
+        # keeps the product on the mapped rows rather than on a centred copy
+        self.mean = matrix.mean(axis=0) if self.calibrated else np.zeros(EMBEDDING_SIZE, dtype=np.float32)
+        self.row_dot_mean = matrix @ self.mean
+        self.mean_norm_sq = float(self.mean @ self.mean)
+        self.row_norms = np.sqrt(np.maximum(np.einsum('ij,ij->i', matrix, matrix) - 2 * self.row_dot_mean
+                                            + self.mean_norm_sq, 1e-12))
+
+    def scores(self, vectors, rows=None):
+        matrix = self.matrix if rows is None else self.matrix[rows]
+        row_dot_mean = self.row_dot_mean if rows is None else self.row_dot_mean[rows]
+        row_norms = self.row_norms if rows is None else self.row_norms[rows]
+        dot_mean = vectors @ self.mean
+        query_norms = np.sqrt(np.maximum(np.einsum('ij,ij->i', vectors, vectors) - 2 * dot_mean + self.mean_norm_sq, 1e-12))
+        centred = vectors @ matrix.T - dot_mean[:, None] - row_dot_mean[None, :] + self.mean_norm_sq
+        return centred / query_norms[:, None] / row_norms[None, :]
+
+
+class FaceIndex:
+    """
+    Enrolled face embeddings in `directory`: faces.f32 holds one float32 row
+    per user and faces.json the usernames in row order. Re-enrolling a user
+    rewrites their row in place; new users are appended; prune() compacts
+    both files. Readers map the file and re-map it, under the index lock,
+    when faces.json is replaced.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = _IndexLock(directory)
+        self._snapshot_lock = threading.Lock()
+        self._signature = None
+        self._snapshot = _Snapshot([], np.empty((0, EMBEDDING_SIZE), dtype=np.float32))
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _read_usernames(self):
+        try:
+            with open(self._path(USERNAMES_FILE)) as f:
+                return json.load(f)['usernames']
+        except FileNotFoundError:
+            return []
+
+    def _usernames_signature(self):
+        try:
+            stat = os.stat(self._path(USERNAMES_FILE))
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def snapshot(self):
+        signature = self._usernames_signature()
+        with self._snapshot_lock:
+            if signature != self._signature:
+                if signature is None:
+                    usernames, matrix = [], np.empty((0, EMBEDDING_SIZE), dtype=np.float32)
+                else:
+                    # prune() replaces both files; the lock keeps them from changing between the two reads
+                    with self._lock:
+                        signature = self._usernames_signature()
+                        usernames = self._read_usernames()
+                        matrix = np.empty((0, EMBEDDING_SIZE), dtype=np.float32)
+                        if usernames:
+                            matrix = np.memmap(self._path(EMBEDDINGS_FILE), dtype=np.float32, mode='r',
+                                               shape=(len(usernames), EMBEDDING_SIZE))
+                self._snapshot = _Snapshot(usernames, matrix)
+                self._signature = signature
+            return self._snapshot
+
+    def enrolled(self, username):
+        return username in self.snapshot().rows
+
+    def __len__(self):
+        return len(self.snapshot().usernames)
+
+    def enroll(self, username, vector):
+        vector = np.asarray(vector, dtype=np.float32).reshape(EMBEDDING_SIZE)
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock:
+            usernames = self._read_usernames()
+            row = usernames.index(username) if username in usernames else len(usernames)
+            path = self._path(EMBEDDINGS_FILE)
+            with open(path, 'r+b' if os.path.exists(path) else 'w+b') as f:
+                if row == len(usernames):
+                    # Drop anything an interrupted append left past the last listed row
+                    f.truncate(row * ROW_BYTES)
+                f.seek(row * ROW_BYTES)
+                f.write(vector.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            if row == len(usernames):
+                usernames.append(username)
+            # The row is on disk before the list that exposes it; re-enrolment
+            # rewrites the list too so readers drop their cached statistics
+            self._write_usernames(usernames)
+
+    def prune(self, keep):
+        """Drop the rows of usernames not in `keep` (e.g. deleted users); returns how many went."""
+        if not os.path.exists(self._path(USERNAMES_FILE)):
+            return 0
+        with self._lock:
+            usernames = self._read_usernames()
+            rows = [row for row, username in enumerate(usernames) if username in keep]
+            if len(rows) == len(usernames):
+                return 0
+            matrix = np.fromfile(self._path(EMBEDDINGS_FILE), dtype=np.float32,
+                                 count=len(usernames) * EMBEDDING_SIZE).reshape(-1, EMBEDDING_SIZE)
+            # A new file rather than a rewrite, so mapped snapshots keep their rows
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.f32')
+            with os.fdopen(fd, 'wb') as f:
+                matrix[rows].tofile(f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self._path(EMBEDDINGS_FILE))
+            self._write_usernames([usernames[row] for row in rows])
+            return len(usernames) - len(rows)
+
+    def _write_usernames(self, usernames):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.json')
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'size': EMBEDDING_SIZE, 'usernames': usernames, 'updated_at': time.time()}, f)
+        os.replace(tmp_path, self._path(USERNAMES_FILE))
+
+    def verify(self, username, vector):
+        """Return (score, calibrated) of `vector` against `username`'s own row, or (None, calibrated)."""
+        snapshot = self.snapshot()
+        row = snapshot.rows.get(username)
+        if row is None:
+            return None, snapshot.calibrated
+        return float(snapshot.scores(np.atleast_2d(vector), [row])[0, 0]), snapshot.calibrated
+
+    def nearest(self, vectors):
+        """
+        Nearest enrolled face for each row of `vectors`, found with one
+        product over the whole index. Returns (snapshot, scores, best rows).
+        """
+        snapshot = self.snapshot()
+        scores = snapshot.scores(np.atleast_2d(vectors).astype(np.float32))
+        best = scores.argmax(axis=1) if snapshot.usernames else None
+        return snapshot, scores, best
+
+    def audit(self, checks, threshold):
+        """
+        Match many frames against the cohort at once. `checks` is
+        [(key, username, vector), ...]; each result gives the score against
+        the claimed user and the nearest enrolled face.
+        Returns (results, calibrated, elapsed_ms).
+        """
+        started = time.perf_counter()
+        if not checks:
+            return [], self.snapshot().calibrated, 0.0
+        snapshot, scores, best = self.nearest(np.vstack([vector for _key, _username, vector in checks]))
+        results = []
+        for index, (key, username, _vector) in enumerate(checks):
+            row = snapshot.rows.get(username)
+            own = float(scores[index, row]) if row is not None else None
+            best_match = snapshot.usernames[best[index]] if best is not None else None
+            best_score = float(scores[index, best[index]]) if best is not None else None
+            results.append({
+                'key': key,
+                'username': username,
+                'score': round(own, 3) if own is not None else None,
+                'verified': (own >= threshold) if snapshot.calibrated and own is not None else None,
+                'best_match': best_match,
+                'best_score': round(best_score, 3) if best_score is not None else None,
+                # Someone else's enrolled face is closer to the frame than the student's own
+                'flagged': bool(snapshot.calibrated and best_match != username and best_score >= threshold)
+            })
+        return results, snapshot.calibrated, round((time.perf_counter() - started) * 1000, 2)
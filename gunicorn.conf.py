@@ -0,0 +1,10 @@
+"""
+Gunicorn settings for Voxiscribe.
+Loaded automatically by `gunicorn app:app` from the working directory.
+"""
+
+
+def post_worker_init(worker):
+    # Only the transcription pool loads the speech model; web workers never need it
+    from app import transcription_jobs
+    transcription_jobs.warm()
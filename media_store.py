@@ -0,0 +1,436 @@
+"""
+Content-addressed media storage for Voxiscribe proctoring recordings.
+Media is kept under its SHA-256 digest so identical uploads are stored once,
+and every exam attempt gets a small JSON manifest pointing at its media.
+"""
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+try:
+    import fcntl
+except ImportError:  # Windows development servers
+    fcntl = None
+
+HASH_BUFFER_SIZE = 256 * 1024
+MANIFEST_LOCK_FILE = '.manifest.lock'
+
+
+class MediaReader:
+    """Random-access handle on a stored media object."""
+
+    def __init__(self, size, read_at, close):
+        self.size = size
+        self.read_at = read_at
+        self.close = close
+
+
+class MediaStore:
+    """
+    Base class for media backends.
+    Backends implement the _object primitives; hashing, deduplication,
+    manifests and per-attempt staging are shared.
+    """
+
+    def __init__(self, staging_root, temp_dir):
+        self.staging_root = staging_root
+        self.temp_dir = temp_dir
+        os.makedirs(self.temp_dir, exist_ok=True)
+
+    # ---- per-attempt staging (node-local working files such as raw chunks) ----
+
+    def staging_dir(self, attempt_id, create=False):
+        path = os.path.join(self.staging_root, str(attempt_id))
+        if create:
+            os.makedirs(path, exist_ok=True)
+        return path
+
+    def new_temp_path(self, suffix=''):
+        """Return a fresh path on the same filesystem the store commits from."""
+        os.makedirs(self.temp_dir, exist_ok=True)
+        fd, path = tempfile.mkstemp(suffix=suffix, dir=self.temp_dir)
+        os.close(fd)
+        return path
+
+    # ---- content-addressed objects ----
+
+    @staticmethod
+    def object_key(digest):
+        return f'objects/{digest[:2]}/{digest}'
+
+    @staticmethod
+    def hash_file(path):
+        sha = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(HASH_BUFFER_SIZE), b''):
+                sha.update(block)
+        return sha.hexdigest()
+
+    def put_file(self, path, move=False):
+        """Store a file and return its digest; an existing copy is reused."""
+        digest = self.hash_file(path)
+        key = self.object_key(digest)
+        if self._object_size(key) is not None:
+            # A re-used object is new to its next manifest; keep retention's grace period from running out under it
+            self._touch_object(key)
+            if move:
+                os.remove(path)
+            return digest
+        self._put_object_from_file(key, path, move)
+        return digest
+
+    def put_bytes(self, data):
+        """Store a small in-memory object and return its digest."""
+        digest = hashlib.sha256(data).hexdigest()
+        key = self.object_key(digest)
+        if self._object_size(key) is None:
+            self._put_object_bytes(key, data)
+        else:
+            self._touch_object(key)
+        return digest
+
+    def get_bytes(self, digest):
+        return self._get_object_bytes(self.object_key(digest))
+
+    def exists(self, digest):
+        return self._object_size(self.object_key(digest)) is not None
+
+    def size(self, digest):
+        return self._object_size(self.object_key(digest))
+
+    def mtime(self, digest):
+        """Last time the object was stored or re-used, or None if it is gone."""
+        return self._object_mtime(self.object_key(digest))
+
+    def open(self, digest):
+        return self._open_object(self.object_key(digest))
+
+    def delete(self, digest):
+        self._delete_object(self.object_key(digest))
+
+    # ---- manifests ----
+
+    @staticmethod
+    def manifest_key(attempt_id):
+        return f'manifests/{attempt_id}.json'
+
+    def write_manifest(self, attempt_id, manifest):
+        self._put_object_bytes(self.manifest_key(attempt_id), json.dumps(manifest, sort_keys=True).encode('utf-8'))
+
+    def read_manifest(self, attempt_id):
+        data = self._get_object_bytes(self.manifest_key(attempt_id))
+        if data is None:
+            return None
+        return json.loads(data.decode('utf-8'))
+
+    def update_manifest(self, attempt_id, update):
+        """
+        Read the attempt's manifest, let update(manifest) change it in place
+        and write it back, holding a per-attempt lock throughout so writers in
+        other threads and processes never drop each other's keys.
+        Returns the written manifest.
+        """
+        with self._manifest_lock(attempt_id):
+            manifest = self.read_manifest(attempt_id) or {'attempt_id': attempt_id}
+            update(manifest)
+            self.write_manifest(attempt_id, manifest)
+            return manifest
+
+    @contextlib.contextmanager
+    def _manifest_lock(self, attempt_id):
+        if fcntl is None:
+            yield
+            return
+        # Every open() is its own flock, so this also serialises threads of one process
+        with open(os.path.join(self.staging_dir(attempt_id, create=True), MANIFEST_LOCK_FILE), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+    def delete_manifest(self, attempt_id):
+        self._delete_object(self.manifest_key(attempt_id))
+
+    # ---- listing (used by retention) ----
+
+    def iter_objects(self):
+        """Yield (digest, size, mtime) for every stored object."""
+        for key, size, mtime in self._list_objects('objects/'):
+            yield key.rsplit('/', 1)[-1], size, mtime
+
+    def iter_manifests(self):
+        """Yield (attempt_id, mtime) for every manifest."""
+        for key, _size, mtime in self._list_objects('manifests/'):
+            name = key.rsplit('/', 1)[-1]
+            if name.endswith('.json'):
+                yield name[:-len('.json')], mtime
+
+    # ---- backend primitives ----
+
+    def _object_size(self, key):
+        raise NotImplementedError
+
+    def _object_mtime(self, key):
+        raise NotImplementedError
+
+    def _touch_object(self, key):
+        raise NotImplementedError
+
+    def _put_object_from_file(self, key, path, move):
+        raise NotImplementedError
+
+    def _put_object_bytes(self, key, data):
+        raise NotImplementedError
+
+    def _get_object_bytes(self, key):
+        raise NotImplementedError
+
+    def _open_object(self, key):
+        raise NotImplementedError
+
+    def _delete_object(self, key):
+        raise NotImplementedError
+
+    def _list_objects(self, prefix):
+        raise NotImplementedError
+
+
+def _atomic_write_bytes(path, data, temp_dir):
+    fd, tmp_path = tempfile.mkstemp(dir=temp_dir)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _atomic_place_file(path, src_path, move, temp_dir):
+    # Commit by rename so readers never observe a partially written object
+    if move:
+        try:
+            os.replace(src_path, path)
+            return
+        except OSError:
+            # Different filesystem; fall back to copy-then-rename below
+            pass
+    fd, tmp_path = tempfile.mkstemp(dir=temp_dir)
+    try:
+        with os.fdopen(fd, 'wb') as dest, open(src_path, 'rb') as src:
+            shutil.copyfileobj(src, dest, HASH_BUFFER_SIZE)
+            dest.flush()
+            os.fsync(dest.fileno())
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    if move:
+        os.remove(src_path)
+
+
+class LocalMediaStore(MediaStore):
+    """Stores objects in a local directory; commits are same-filesystem renames."""
+
+    def __init__(self, root, staging_root):
+        self.root = root
+        super().__init__(staging_root, os.path.join(root, 'tmp'))
+
+    def _path(self, key):
+        return os.path.join(self.root, *key.split('/'))
+
+    def _object_size(self, key):
+        try:
+            return os.path.getsize(self._path(key))
+        except OSError:
+            return None
+
+    def _object_mtime(self, key):
+        try:
+            return os.path.getmtime(self._path(key))
+        except OSError:
+            return None
+
+    def _touch_object(self, key):
+        try:
+            os.utime(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def _put_object_from_file(self, key, path, move):
+        dest = self._path(key)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        _atomic_place_file(dest, path, move, self.temp_dir)
+
+    def _put_object_bytes(self, key, data):
+        dest = self._path(key)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        _atomic_write_bytes(dest, data, self.temp_dir)
+
+    def _get_object_bytes(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _open_object(self, key):
+        try:
+            f = open(self._path(key), 'rb')
+        except FileNotFoundError:
+            return None
+        fd = f.fileno()
+        return MediaReader(os.fstat(fd).st_size, lambda offset, length: os.pread(fd, length, offset), f.close)
+
+    def _delete_object(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def _list_objects(self, prefix):
+        base = self._path(prefix.rstrip('/'))
+        for dirpath, _dirnames, filenames in os.walk(base):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                key = os.path.relpath(path, self.root).replace(os.sep, '/')
+                yield key, st.st_size, st.st_mtime
+
+
+class LocalObjectStoreClient:
+    """
+    Minimal stand-in for an S3-style object store, backed by a shared directory.
+    Mirrors the put/get/head/delete calls a real client would make so several
+    app nodes can share media (e.g. over a network mount) during development.
+    """
+
+    def __init__(self, bucket_root):
+        self.bucket_root = bucket_root
+        self.temp_dir = os.path.join(bucket_root, '.uploads')
+        os.makedirs(self.temp_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.bucket_root, key.replace('/', '%2F'))
+
+    def head_object(self, key):
+        try:
+            st = os.stat(self._path(key))
+        except OSError:
+            return None
+        return {'ContentLength': st.st_size, 'LastModified': st.st_mtime}
+
+    def copy_object(self, key, source_key):
+        # Copying an object onto itself refreshes LastModified, as on S3
+        if key == source_key:
+            try:
+                os.utime(self._path(key))
+            except FileNotFoundError:
+                pass
+            return
+        with open(self._path(source_key), 'rb') as f:
+            self.put_object(key, f)
+
+    def put_object(self, key, body):
+        fd, tmp_path = tempfile.mkstemp(dir=self.temp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as dest:
+                if isinstance(body, (bytes, bytearray)):
+                    dest.write(body)
+                else:
+                    shutil.copyfileobj(body, dest, HASH_BUFFER_SIZE)
+                dest.flush()
+                os.fsync(dest.fileno())
+            os.replace(tmp_path, self._path(key))
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def get_object(self, key, start=None, stop=None):
+        try:
+            with open(self._path(key), 'rb') as f:
+                if start is None:
+                    return f.read()
+                f.seek(start)
+                return f.read(stop - start)
+        except FileNotFoundError:
+            return None
+
+    def delete_object(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def list_objects(self, prefix):
+        encoded = prefix.replace('/', '%2F')
+        with os.scandir(self.bucket_root) as it:
+            for entry in it:
+                if entry.is_file() and entry.name.startswith(encoded):
+                    st = entry.stat()
+                    yield {'Key': entry.name.replace('%2F', '/'), 'Size': st.st_size, 'LastModified': st.st_mtime}
+
+
+class ObjectStoreMediaStore(MediaStore):
+    """Stores objects through an S3-style client; reads are ranged GETs."""
+
+    def __init__(self, client, staging_root):
+        self.client = client
+        super().__init__(staging_root, os.path.join(staging_root, 'tmp'))
+
+    def _object_size(self, key):
+        head = self.client.head_object(key)
+        return head['ContentLength'] if head else None
+
+    def _object_mtime(self, key):
+        head = self.client.head_object(key)
+        return head['LastModified'] if head else None
+
+    def _touch_object(self, key):
+        self.client.copy_object(key, key)
+
+    def _put_object_from_file(self, key, path, move):
+        with open(path, 'rb') as f:
+            self.client.put_object(key, f)
+        if move:
+            os.remove(path)
+
+    def _put_object_bytes(self, key, data):
+        self.client.put_object(key, data)
+
+    def _get_object_bytes(self, key):
+        return self.client.get_object(key)
+
+    def _open_object(self, key):
+        size = self._object_size(key)
+        if size is None:
+            return None
+
+        def read_at(offset, length):
+            return self.client.get_object(key, offset, min(offset + length, size)) or b''
+
+        return MediaReader(size, read_at, lambda: None)
+
+    def _delete_object(self, key):
+        self.client.delete_object(key)
+
+    def _list_objects(self, prefix):
+        for obj in self.client.list_objects(prefix):
+            yield obj['Key'], obj['Size'], obj['LastModified']
+
+
+def create_media_store(backend, root, staging_root):
+    if backend == 'local':
+        return LocalMediaStore(root, staging_root)
+    if backend == 'object':
+        return ObjectStoreMediaStore(LocalObjectStoreClient(root), staging_root)
+    raise ValueError(f"Unknown media store backend: {backend}")
@@ -117,6 +117,7 @@ CREATE TABLE IF NOT EXISTS proctoring_videos (
     id SERIAL PRIMARY KEY,
     attempt_id INTEGER REFERENCES exam_attempts(id) ON DELETE CASCADE,
     video_blob BYTEA,
+    video_oid OID,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
@@ -0,0 +1,323 @@
+"""
+Append-only proctoring recordings for Voxiscribe.
+Each attempt's MediaRecorder chunks are appended in order to one growing
+file, with a compact binary index of (chunk_order, offset, length, crc32,
+started_ms) where started_ms is the wall-clock start of the recorder slice.
+Out-of-order chunks are held back until the gap is filled and duplicates
+are detected from the index, so no separate assembly pass is needed.
+Snapshot-mode still frames use the same format: JPEGs appended back to back
+in a frame sequence file, indexed by frame order and capture time.
+"""
+import os
+import struct
+import threading
+import weakref
+import zlib
+
+try:
+    import fcntl
+except ImportError:  # Windows development servers
+    fcntl = None
+
+RECORDING_FILE = 'recording.webm'
+INDEX_FILE = 'recording.idx'
+LOCK_FILE = '.ingest.lock'
+PENDING_PREFIX = 'pending_'
+FRAMES_FILE = 'frames.seq'
+FRAMES_INDEX_FILE = 'frames.idx'
+FRAME_PENDING_PREFIX = 'frame_pending_'
+
+# chunk_order (uint32), offset (uint64), length (uint32), crc32 (uint32), started_ms (uint64)
+INDEX_RECORD = struct.Struct('<IQIIQ')
+COPY_BUFFER_SIZE = 256 * 1024
+
+# Held only while some _RecordingLock uses it, so finished attempts do not pin a lock each
+_thread_locks = weakref.WeakValueDictionary()
+_thread_locks_guard = threading.Lock()
+
+
+class ChecksumMismatch(ValueError):
+    """The received bytes do not match the CRC-32 the client computed."""
+
+
+class ChunkTooLarge(ValueError):
+    """The chunk body ran past the size limit; nothing of it was kept."""
+
+
+class RecordingFinalized(Exception):
+    """The recording was sealed for assembly; late chunks have nowhere to go."""
+
+
+class IndexEntry:
+    __slots__ = ('chunk_order', 'offset', 'length', 'checksum', 'started_ms')
+
+    def __init__(self, chunk_order, offset, length, checksum, started_ms=0):
+        self.chunk_order = chunk_order
+        self.offset = offset
+        self.length = length
+        self.checksum = checksum
+        self.started_ms = started_ms
+
+    def to_dict(self):
+        return {'chunk_order': self.chunk_order, 'offset': self.offset,
+                'length': self.length, 'checksum': f'{self.checksum:08x}',
+                'started_ms': self.started_ms}
+
+
+def read_index_bytes(data):
+    """Decode a raw index into IndexEntry records, ignoring a torn trailing record."""
+    usable = len(data) - len(data) % INDEX_RECORD.size
+    return [IndexEntry(*fields) for fields in INDEX_RECORD.iter_unpack(data[:usable])]
+
+
+class AttemptRecording:
+    """Single-file recording plus offset index inside an attempt's staging directory."""
+
+    def __init__(self, directory, data_file=RECORDING_FILE, index_file=INDEX_FILE, pending_prefix=PENDING_PREFIX):
+        self.directory = directory
+        self.data_path = os.path.join(directory, data_file)
+        self.index_path = os.path.join(directory, index_file)
+        self.sealed_path = self.index_path + '.sealed'
+        self.finalized_path = self.index_path + '.finalized'
+        self.pending_prefix = pending_prefix
+
+    # ---- locking (threads in this process, and other processes via flock) ----
+
+    def _lock(self):
+        return _RecordingLock(self.directory)
+
+    # ---- reading ----
+
+    def exists(self):
+        """True while there is anything to assemble, even chunks held behind a lost first one."""
+        return os.path.exists(self.index_path) or bool(self.pending_chunks())
+
+    def sealed(self):
+        """True once assembly has started; no more chunks are accepted."""
+        return os.path.exists(self.sealed_path) or self.finalized()
+
+    def finalized(self):
+        """True once the recording is stored elsewhere and gone from staging."""
+        return os.path.exists(self.finalized_path)
+
+    def entries(self):
+        try:
+            with open(self.index_path, 'rb') as f:
+                return read_index_bytes(f.read())
+        except FileNotFoundError:
+            return []
+
+    def committed_size(self, entries=None):
+        entries = self.entries() if entries is None else entries
+        if not entries:
+            return 0
+        last = entries[-1]
+        return last.offset + last.length
+
+    def pending_chunks(self):
+        """Return sorted (chunk_order, started_ms) pairs held back behind a gap."""
+        pending = []
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return pending
+        for name in names:
+            if name.startswith(self.pending_prefix) and name.endswith('.part'):
+                try:
+                    order, started_ms = name[len(self.pending_prefix):-len('.part')].split('_')
+                    pending.append((int(order), int(started_ms)))
+                except ValueError:
+                    continue
+        return sorted(pending)
+
+    def _pending_path(self, chunk_order, started_ms):
+        return os.path.join(self.directory, f'{self.pending_prefix}{chunk_order}_{started_ms}.part')
+
+    def upload_status(self, last_order=None, limit=1000):
+        """
+        Describe what has arrived: the last order appended contiguously, the
+        orders held back behind a gap, and the orders still missing up to the
+        highest one seen (or `last_order` if the client reports a later one).
+        """
+        entries = self.entries()
+        committed_through = entries[-1].chunk_order if entries else -1
+        buffered = [order for order, _started_ms in self.pending_chunks()]
+        highest = max([committed_through, -1 if last_order is None else last_order] + buffered)
+        held = set(buffered)
+        missing = [order for order in range(committed_through + 1, highest + 1) if order not in held]
+        return {'committed_through': committed_through, 'buffered': buffered, 'missing': missing[:limit],
+                'finalized': self.sealed()}
+
+    def _find_pending(self, chunk_order):
+        for order, started_ms in self.pending_chunks():
+            if order == chunk_order:
+                return started_ms
+        return None
+
+    # ---- writing ----
+
+    def append_chunk(self, chunk_order, stream, started_ms=0, checksum=None, max_length=None):
+        """
+        Ingest one chunk from a file-like stream.
+        Returns (status, entry) where status is 'appended', 'buffered',
+        'duplicate' or 'conflict' (same order, different checksum; nothing is
+        overwritten). With `checksum`, a corrupt body raises ChecksumMismatch
+        and leaves the recording untouched; with `max_length`, so does a body
+        longer than that, raising ChunkTooLarge. Once the recording is sealed
+        every chunk raises RecordingFinalized.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock():
+            if self.sealed():
+                raise RecordingFinalized(f'Recording in {self.directory} was already finalized')
+            entries = self.entries()
+            next_order = entries[-1].chunk_order + 1 if entries else 0
+            if chunk_order < next_order:
+                entry = next((e for e in entries if e.chunk_order == chunk_order), None)
+                if checksum is not None and entry is not None and entry.checksum != checksum:
+                    return 'conflict', entry
+                return 'duplicate', entry
+            if chunk_order > next_order:
+                if self._find_pending(chunk_order) is not None:
+                    return 'duplicate', None
+                pending_path = self._pending_path(chunk_order, started_ms)
+                tmp_path = pending_path + '.tmp'
+                try:
+                    with open(tmp_path, 'wb') as f:
+                        _length, received = _copy_stream(stream, f.fileno(), max_length)
+                except ChunkTooLarge:
+                    os.remove(tmp_path)
+                    raise
+                if checksum is not None and received != checksum:
+                    os.remove(tmp_path)
+                    raise ChecksumMismatch(f'Chunk {chunk_order} checksum {received:08x} != {checksum:08x}')
+                os.replace(tmp_path, pending_path)
+                return 'buffered', None
+
+            entry = self._append_locked(chunk_order, stream, self.committed_size(entries), started_ms, checksum,
+                                        max_length)
+            self._drain_pending_locked(entry)
+            return 'appended', entry
+
+    def seal(self):
+        """
+        Stop accepting chunks and flush held-back ones across their gaps.
+        The recording stays in staging until mark_finalized(), so assembly
+        that fails after sealing can simply run again.
+        Returns (entries, orders appended across gaps).
+        """
+        with self._lock():
+            if not os.path.exists(self.sealed_path):
+                with open(self.sealed_path, 'w'):
+                    pass
+            flushed = self._flush_pending_locked()
+            return self.entries(), flushed
+
+    def mark_finalized(self):
+        """Record that the sealed recording is stored elsewhere and drop it from staging."""
+        with self._lock():
+            # Without the marker a late chunk would start a new recording at order 0
+            # and sit in pending forever
+            with open(self.finalized_path, 'w'):
+                pass
+            for path in (self.data_path, self.index_path, self.sealed_path):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def _flush_pending_locked(self):
+        appended = []
+        entries = self.entries()
+        offset = self.committed_size(entries)
+        for order, started_ms in self.pending_chunks():
+            path = self._pending_path(order, started_ms)
+            if entries and order <= entries[-1].chunk_order:
+                os.remove(path)
+                continue
+            with open(path, 'rb') as f:
+                entry = self._append_locked(order, f, offset, started_ms)
+            os.remove(path)
+            offset = entry.offset + entry.length
+            entries.append(entry)
+            appended.append(order)
+        return appended
+
+    def _append_locked(self, chunk_order, stream, offset, started_ms, expected_checksum=None, max_length=None):
+        # Anything past the last indexed byte is a torn write from an earlier crash
+        fd = os.open(self.data_path, os.O_WRONLY | os.O_CREAT, 0o644)
+        try:
+            os.ftruncate(fd, offset)
+            os.lseek(fd, offset, os.SEEK_SET)
+            try:
+                length, checksum = _copy_stream(stream, fd, max_length)
+            except ChunkTooLarge:
+                os.ftruncate(fd, offset)
+                raise
+            if expected_checksum is not None and checksum != expected_checksum:
+                os.ftruncate(fd, offset)
+                raise ChecksumMismatch(f'Chunk {chunk_order} checksum {checksum:08x} != {expected_checksum:08x}')
+        finally:
+            os.close(fd)
+        entry = IndexEntry(chunk_order, offset, length, checksum, started_ms)
+        with open(self.index_path, 'ab') as f:
+            f.write(INDEX_RECORD.pack(entry.chunk_order, entry.offset, entry.length, entry.checksum, entry.started_ms))
+        return entry
+
+    def _drain_pending_locked(self, last_entry):
+        while True:
+            next_order = last_entry.chunk_order + 1
+            started_ms = self._find_pending(next_order)
+            if started_ms is None:
+                return
+            path = self._pending_path(next_order, started_ms)
+            with open(path, 'rb') as f:
+                last_entry = self._append_locked(next_order, f, last_entry.offset + last_entry.length, started_ms)
+            os.remove(path)
+
+
+def frame_sequence(directory):
+    """Snapshot frames of an attempt; started_ms is the capture time of each frame."""
+    return AttemptRecording(directory, FRAMES_FILE, FRAMES_INDEX_FILE, FRAME_PENDING_PREFIX)
+
+
+class _RecordingLock:
+    def __init__(self, directory):
+        with _thread_locks_guard:
+            self.thread_lock = _thread_locks.get(directory)
+            if self.thread_lock is None:
+                self.thread_lock = _thread_locks[directory] = threading.Lock()
+        self.lock_path = os.path.join(directory, LOCK_FILE)
+        self.lock_file = None
+
+    def __enter__(self):
+        self.thread_lock.acquire()
+        if fcntl is not None:
+            self.lock_file = open(self.lock_path, 'w')
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.lock_file is not None:
+            self.lock_file.close()
+            self.lock_file = None
+        self.thread_lock.release()
+        return False
+
+
+def _copy_stream(stream, fd, max_length=None):
+    length = 0
+    checksum = 0
+    while True:
+        block = stream.read(COPY_BUFFER_SIZE)
+        if not block:
+            break
+        if max_length is not None and length + len(block) > max_length:
+            raise ChunkTooLarge(f'Chunk is larger than {max_length} bytes')
+        checksum = zlib.crc32(block, checksum)
+        view = memoryview(block)
+        while view:
+            written = os.write(fd, view)
+            view = view[written:]
+        length += len(block)
+    return length, checksum
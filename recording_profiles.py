@@ -0,0 +1,122 @@
+"""
+Server-negotiated recording settings for Voxiscribe proctoring.
+Browsers ask the server for their MediaRecorder settings instead of
+hardcoding them, and the server steps everyone down a quality tier when
+chunk ingest approaches capacity or the disk fills up, and back up once
+there is room again.
+"""
+import threading
+import time
+from collections import deque
+
+# Ordered from best to cheapest; each tier roughly halves the upload volume
+RECORDING_PROFILES = [
+    {'name': 'high', 'timeslice_ms': 5000, 'video_bits_per_second': 600000, 'width': 640, 'height': 480, 'frame_rate': 15},
+    {'name': 'medium', 'timeslice_ms': 10000, 'video_bits_per_second': 300000, 'width': 480, 'height': 360, 'frame_rate': 10},
+    {'name': 'low', 'timeslice_ms': 15000, 'video_bits_per_second': 150000, 'width': 320, 'height': 240, 'frame_rate': 8},
+    {'name': 'minimal', 'timeslice_ms': 30000, 'video_bits_per_second': 64000, 'width': 320, 'height': 240, 'frame_rate': 5},
+]
+PROFILE_NAMES = [profile['name'] for profile in RECORDING_PROFILES]
+
+# Highest share of capacity we plan to use, leaving headroom for bursts
+TARGET_UTILISATION = 0.8
+
+
+class IngestMonitor:
+    """Sliding window of chunk bytes received by this process."""
+
+    def __init__(self, window_seconds=60):
+        self.window = window_seconds
+        self._samples = deque()  # (monotonic time, attempt_id, bytes)
+        self._total = 0
+        self._lock = threading.Lock()
+
+    def record(self, attempt_id, nbytes):
+        now = time.monotonic()
+        with self._lock:
+            self._samples.append((now, attempt_id, nbytes))
+            self._total += nbytes
+            self._expire(now)
+
+    def _expire(self, now):
+        cutoff = now - self.window
+        while self._samples and self._samples[0][0] < cutoff:
+            self._total -= self._samples.popleft()[2]
+
+    def snapshot(self):
+        with self._lock:
+            self._expire(time.monotonic())
+            return {
+                'bytes_per_second': self._total / self.window,
+                'active_uploaders': len({sample[1] for sample in self._samples})
+            }
+
+
+class RecordingProfileController:
+    """
+    Picks the recording tier handed to clients.
+    A running MediaRecorder keeps the bitrate it was started with (only its
+    resolution and slice length follow a tier change), so a new tier only
+    lowers the load added by sessions that start recording afterwards. The
+    best tier whose bitrate still fits on top of the current ingest within
+    TARGET_UTILISATION of capacity wins; above the soft disk watermark
+    nothing better than 'low' is offered. The choice is cached for
+    `refresh_seconds` so clients are not flipped back and forth.
+    """
+
+    def __init__(self, monitor, capacity_bps, disk_usage, disk_soft_watermark=0.75,
+                 max_profile='high', min_profile='minimal', refresh_seconds=15):
+        self.monitor = monitor
+        self.capacity_bps = capacity_bps
+        self.disk_usage = disk_usage
+        self.disk_soft_watermark = disk_soft_watermark
+        self.best_level = _profile_level(max_profile, 0)
+        self.worst_level = max(_profile_level(min_profile, len(RECORDING_PROFILES) - 1), self.best_level)
+        self.refresh_seconds = refresh_seconds
+        self.level = self.best_level
+        self.reason = 'default'
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def current(self):
+        """Return the settings dict handed to recorders."""
+        now = time.monotonic()
+        with self._lock:
+            if self._checked_at is None or now - self._checked_at >= self.refresh_seconds:
+                self.level, self.reason = self._choose_level()
+                self._checked_at = now
+            return dict(RECORDING_PROFILES[self.level], refresh_after_ms=self.refresh_seconds * 1000)
+
+    def status(self):
+        settings = self.current()
+        return {
+            'profile': settings['name'],
+            'reason': self.reason,
+            'capacity_bps': self.capacity_bps,
+            'ingest': self.monitor.snapshot()
+        }
+
+    def _choose_level(self):
+        ingest_bps = self.monitor.snapshot()['bytes_per_second']
+        level, reason = self.worst_level, 'ingest'
+        for candidate in range(self.best_level, self.worst_level + 1):
+            # Running recorders keep their bitrate; only a new session adds this tier's
+            new_session_bps = RECORDING_PROFILES[candidate]['video_bits_per_second'] / 8
+            if self.capacity_bps <= 0 or ingest_bps + new_session_bps <= self.capacity_bps * TARGET_UTILISATION:
+                level, reason = candidate, 'normal' if candidate == self.best_level else 'ingest'
+                break
+        try:
+            disk_fraction = self.disk_usage()
+        except OSError:
+            disk_fraction = 0.0
+        disk_level = PROFILE_NAMES.index('low')
+        if disk_fraction >= self.disk_soft_watermark and level < disk_level:
+            level, reason = min(disk_level, self.worst_level), 'disk'
+        return level, reason
+
+
+def _profile_level(name, default):
+    try:
+        return PROFILE_NAMES.index(name)
+    except ValueError:
+        return default
@@ -0,0 +1,261 @@
+"""
+Disk retention and garbage collection for Voxiscribe upload directories.
+Finds orphaned and expired proctoring uploads, chunk dumps, auth samples and
+unreferenced media, and removes them in rate-limited batches. Also reports
+usage per category and whether the disk is above its high watermark.
+"""
+import os
+import shutil
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows development servers
+    fcntl = None
+
+DAY_SECONDS = 24 * 60 * 60
+
+# Directories under uploads/ that are not per-attempt staging directories
+RESERVED_UPLOAD_DIRS = {'auth_data', 'submissions', 'assignments', 'media', 'tmp'}
+
+
+class RetentionPolicy:
+    """max_age_days=0 keeps data forever; remove_orphans drops data with no owning row."""
+
+    def __init__(self, max_age_days=0, remove_orphans=True):
+        self.max_age_days = max_age_days
+        self.remove_orphans = remove_orphans
+
+    def expired(self, mtime, now):
+        return self.max_age_days > 0 and now - mtime > self.max_age_days * DAY_SECONDS
+
+
+class Candidate:
+    __slots__ = ('category', 'path', 'reason', 'size', 'remove')
+
+    def __init__(self, category, path, reason, size, remove):
+        self.category = category
+        self.path = path
+        self.reason = reason
+        self.size = size
+        self.remove = remove
+
+
+def tree_stats(path):
+    """Return (bytes, files, newest mtime) for a file or directory tree."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return 0, 0, 0
+    if not os.path.isdir(path):
+        return st.st_size, 1, st.st_mtime
+    total, files, newest = 0, 0, st.st_mtime
+    for dirpath, _dirnames, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                fst = os.stat(os.path.join(dirpath, name))
+            except FileNotFoundError:
+                continue
+            total += fst.st_size
+            files += 1
+            newest = max(newest, fst.st_mtime)
+    return total, files, newest
+
+
+def disk_usage_fraction(path):
+    usage = shutil.disk_usage(path)
+    return usage.used / usage.total if usage.total else 0.0
+
+
+class RetentionManager:
+    """
+    Scans the upload categories and removes what the policies allow.
+
+    lookups must provide:
+      attempt_ids()   -> set of existing exam_attempts ids (as strings)
+      attempt_keys()  -> set of (exam_id, student_id) string pairs
+      usernames()     -> set of existing usernames
+    """
+
+    def __init__(self, uploads_root, proctor_chunks_root, media_store, policies, lookups,
+                 batch_size=50, batch_pause_ms=200, orphan_grace_seconds=3600):
+        self.uploads_root = uploads_root
+        self.proctor_chunks_root = proctor_chunks_root
+        self.media_store = media_store
+        self.policies = policies
+        self.lookups = lookups
+        self.batch_size = max(1, batch_size)
+        self.batch_pause = batch_pause_ms / 1000.0
+        self.orphan_grace = orphan_grace_seconds
+
+    # ---- scanning ----
+
+    def _policy(self, category):
+        return self.policies.get(category) or RetentionPolicy(0, False)
+
+    def _judge(self, category, path, owned, now):
+        size, _files, newest = tree_stats(path)
+        policy = self._policy(category)
+        if not owned and policy.remove_orphans and now - newest > self.orphan_grace:
+            return Candidate(category, path, 'orphan', size, True)
+        if policy.expired(newest, now):
+            return Candidate(category, path, 'expired', size, True)
+        return Candidate(category, path, 'kept', size, False)
+
+    def _scan_attempt_uploads(self, now):
+        attempt_ids = self.lookups['attempt_ids']()
+        try:
+            entries = list(os.scandir(self.uploads_root))
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            if not entry.is_dir() or entry.name in RESERVED_UPLOAD_DIRS or not entry.name.isdigit():
+                continue
+            yield self._judge('attempt_uploads', entry.path, entry.name in attempt_ids, now)
+
+    def _scan_proctor_chunks(self, now):
+        attempt_keys = self.lookups['attempt_keys']()
+        try:
+            exam_dirs = list(os.scandir(self.proctor_chunks_root))
+        except FileNotFoundError:
+            return
+        for exam_dir in exam_dirs:
+            if not exam_dir.is_dir() or not exam_dir.name.startswith('exam_'):
+                continue
+            exam_id = exam_dir.name[len('exam_'):]
+            for student_dir in os.scandir(exam_dir.path):
+                if not student_dir.is_dir() or not student_dir.name.startswith('student_'):
+                    continue
+                student_id = student_dir.name[len('student_'):]
+                yield self._judge('proctor_chunks', student_dir.path, (exam_id, student_id) in attempt_keys, now)
+
+    def _scan_auth_data(self, now):
+        usernames = self.lookups['usernames']()
+        auth_root = os.path.join(self.uploads_root, 'auth_data')
+        try:
+            entries = list(os.scandir(auth_root))
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            if entry.is_dir():
+                yield self._judge('auth_data', entry.path, entry.name in usernames, now)
+
+    def _manifest_references(self, attempt_id):
+        manifest = self.media_store.read_manifest(attempt_id) or {}
+        references = {manifest[key] for key in ('index', 'timeline', 'frame_index', 'voice_check', 'face_check')
+                      if manifest.get(key)}
+        references.update(manifest[key]['digest'] for key in ('video', 'frames') if manifest.get(key))
+        return references
+
+    def _scan_media(self, now):
+        # Manifests of deleted or expired attempts go first; objects nothing references are garbage
+        attempt_ids = self.lookups['attempt_ids']()
+        policy = self._policy('media')
+        referenced = set()
+        started = time.time()
+        for attempt_id, mtime in list(self.media_store.iter_manifests()):
+            if attempt_id not in attempt_ids and policy.remove_orphans:
+                yield Candidate('media', f'manifest:{attempt_id}', 'orphan', 0, True)
+                continue
+            if policy.expired(mtime, now):
+                yield Candidate('media', f'manifest:{attempt_id}', 'expired', 0, True)
+                continue
+            referenced |= self._manifest_references(attempt_id)
+        objects = list(self.media_store.iter_objects())
+        # Objects are put before the manifest that names them; pick up manifests written during the scan
+        for attempt_id, mtime in list(self.media_store.iter_manifests()):
+            if mtime >= started:
+                referenced |= self._manifest_references(attempt_id)
+        for digest, size, mtime in objects:
+            if digest in referenced:
+                yield Candidate('media', f'object:{digest}', 'kept', size, False)
+            elif policy.remove_orphans and now - mtime > self.orphan_grace:
+                yield Candidate('media', f'object:{digest}', 'unreferenced', size, True)
+            else:
+                yield Candidate('media', f'object:{digest}', 'kept', size, False)
+
+    def scan(self, now=None):
+        now = now or time.time()
+        for scanner in (self._scan_attempt_uploads, self._scan_proctor_chunks, self._scan_auth_data, self._scan_media):
+            yield from scanner(now)
+
+    # ---- reporting ----
+
+    def usage(self):
+        """Bytes and entry counts per category, plus reclaimable bytes and disk totals."""
+        stats = {}
+        for candidate in self.scan():
+            cat = stats.setdefault(candidate.category, {'bytes': 0, 'entries': 0, 'reclaimable_bytes': 0, 'orphans': 0})
+            cat['bytes'] += candidate.size
+            cat['entries'] += 1
+            if candidate.remove:
+                cat['reclaimable_bytes'] += candidate.size
+                cat['orphans'] += candidate.reason in ('orphan', 'unreferenced')
+        disk = shutil.disk_usage(self.uploads_root if os.path.isdir(self.uploads_root) else '.')
+        return {
+            'categories': stats,
+            'disk': {'total': disk.total, 'used': disk.used, 'free': disk.free,
+                     'used_fraction': round(disk.used / disk.total, 4) if disk.total else 0}
+        }
+
+    # ---- collection ----
+
+    def _remove(self, candidate):
+        """Remove a candidate; returns False if it turned out to be in use after all."""
+        if candidate.path.startswith('manifest:'):
+            self.media_store.delete_manifest(candidate.path[len('manifest:'):])
+        elif candidate.path.startswith('object:'):
+            digest = candidate.path[len('object:'):]
+            # Re-check just before deleting: a dedup hit since the scan refreshes the mtime
+            mtime = self.media_store.mtime(digest)
+            if mtime is None or time.time() - mtime <= self.orphan_grace:
+                return False
+            self.media_store.delete(digest)
+        elif os.path.isdir(candidate.path):
+            shutil.rmtree(candidate.path, ignore_errors=True)
+        else:
+            os.remove(candidate.path)
+
+    def run(self, dry_run=False):
+        """Remove everything the policies allow, pausing between batches. Returns a summary."""
+        lock_file = self._acquire_run_lock()
+        if lock_file is False:
+            return {'skipped': 'another process is collecting'}
+        summary = {'removed': 0, 'bytes': 0, 'errors': 0, 'by_category': {}}
+        try:
+            in_batch = 0
+            for candidate in self.scan():
+                if not candidate.remove:
+                    continue
+                if not dry_run:
+                    try:
+                        if self._remove(candidate) is False:
+                            continue
+                    except OSError as e:
+                        print(f"Retention failed to remove {candidate.path}: {e}")
+                        summary['errors'] += 1
+                        continue
+                summary['removed'] += 1
+                summary['bytes'] += candidate.size
+                by_cat = summary['by_category'].setdefault(candidate.category, {'removed': 0, 'bytes': 0})
+                by_cat['removed'] += 1
+                by_cat['bytes'] += candidate.size
+                in_batch += 1
+                if in_batch >= self.batch_size:
+                    in_batch = 0
+                    time.sleep(self.batch_pause)
+        finally:
+            if lock_file:
+                lock_file.close()
+        return summary
+
+    def _acquire_run_lock(self):
+        if fcntl is None or not os.path.isdir(self.uploads_root):
+            return None
+        lock_file = open(os.path.join(self.uploads_root, '.retention.lock'), 'w')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        return lock_file
@@ -0,0 +1,247 @@
+"""
+Speaker verification for Voxiscribe.
+A voice sample is reduced to a fixed-size float32 voiceprint: statistics of
+its MFCCs over the speech frames, computed with NumPy. Voiceprints are
+enrolled from the voice sample saved at registration and kept beside it
+under uploads/auth_data/<username>/; enrolling also rewrites a generation
+marker there, so other processes notice the change with a single stat.
+New samples are scored against the enrolled prints after normalising by
+the statistics of the whole cohort, so checking one student and checking
+every student are the same single matrix product.
+"""
+import io
+import os
+import tempfile
+import threading
+import time
+from functools import lru_cache
+
+import numpy as np
+
+from voice_activity import detect_speech
+
+SAMPLE_RATE = 16000
+FRAME_LENGTH = 400  # 25 ms
+HOP_LENGTH = 160  # 10 ms
+N_FFT = 512
+N_MELS = 40
+N_MFCC = 20
+# Mean and standard deviation of c1..c19 plus the standard deviation of their deltas
+VOICEPRINT_SIZE = 3 * (N_MFCC - 1)
+VOICEPRINT_FILE = 'voiceprint.npy'
+GENERATION_FILE = '.voiceprints.generation'
+MIN_SPEECH_SECONDS = 1.0
+# Below this many enrolled voices there is no cohort to normalise against
+MIN_COHORT = 5
+
+
+class NotEnoughSpeech(ValueError):
+    """Raised when a sample has too little speech to characterise a voice."""
+
+
+@lru_cache(maxsize=1)
+def _mel_filterbank():
+    def hz_to_mel(hz):
+        return 2595.0 * np.log10(1.0 + hz / 700.0)
+
+    def mel_to_hz(mel):
+        return 700.0 * (10 ** (mel / 2595.0) - 1.0)
+
+    edges = mel_to_hz(np.linspace(hz_to_mel(20.0), hz_to_mel(SAMPLE_RATE / 2), N_MELS + 2))
+    bins = np.fft.rfftfreq(N_FFT, 1.0 / SAMPLE_RATE)
+    lower, centre, upper = edges[:-2, None], edges[1:-1, None], edges[2:, None]
+    rising = (bins - lower) / (centre - lower)
+    falling = (upper - bins) / (upper - centre)
+    return np.maximum(0.0, np.minimum(rising, falling)).astype(np.float32)  # (N_MELS, N_FFT // 2 + 1)
+
+
+@lru_cache(maxsize=1)
+def _dct_matrix():
+    # Orthonormal DCT-II, first N_MFCC rows
+    n = np.arange(N_MELS)
+    basis = np.cos(np.pi / N_MELS * (n + 0.5)[None, :] * np.arange(N_MFCC)[:, None]) * np.sqrt(2.0 / N_MELS)
+    basis[0] /= np.sqrt(2.0)
+    return basis.astype(np.float32)  # (N_MFCC, N_MELS)
+
+
+def mfcc(pcm):
+    """MFCCs of 16 kHz PCM as a (frames, N_MFCC) array."""
+    pcm = np.asarray(pcm, dtype=np.float32)
+    if len(pcm) < FRAME_LENGTH:
+        return np.empty((0, N_MFCC), dtype=np.float32)
+    emphasized = np.append(pcm[0], pcm[1:] - 0.97 * pcm[:-1])
+    frames = np.lib.stride_tricks.sliding_window_view(emphasized, FRAME_LENGTH)[::HOP_LENGTH]
+    power = np.abs(np.fft.rfft(frames * np.hamming(FRAME_LENGTH).astype(np.float32), N_FFT)) ** 2 / N_FFT
+    return np.log(power @ _mel_filterbank().T + 1e-10) @ _dct_matrix().T
+
+
+def voiceprint(pcm):
+    """Return the float32 voiceprint of 16 kHz PCM; raises NotEnoughSpeech for silent samples."""
+    speech = [pcm[start:end] for start, end in detect_speech(pcm, SAMPLE_RATE, pad_ms=50)]
+    speech = np.concatenate(speech) if speech else np.empty(0, dtype=np.float32)
+    if len(speech) < MIN_SPEECH_SECONDS * SAMPLE_RATE:
+        raise NotEnoughSpeech(f'Need at least {MIN_SPEECH_SECONDS:g}s of speech')
+    coefficients = mfcc(speech)[:, 1:]  # c0 is loudness, not voice
+    deltas = np.diff(coefficients, axis=0)
+    return np.concatenate([coefficients.mean(axis=0), coefficients.std(axis=0), deltas.std(axis=0)]).astype(np.float32)
+
+
+def save_vector(path, vector):
+    """Atomically write a float32 vector as .npy."""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.npy')
+    with os.fdopen(fd, 'wb') as f:
+        np.save(f, np.asarray(vector, dtype=np.float32))
+    os.replace(tmp_path, path)
+
+
+def load_vector(path, size=VOICEPRINT_SIZE):
+    """Return the stored vector at `path`, or None if missing or not `size` long."""
+    try:
+        vector = np.load(path)
+    except (OSError, ValueError):
+        return None
+    return vector if vector.shape == (size,) else None
+
+
+def vector_bytes(vector):
+    """Serialise a float32 vector as .npy bytes, e.g. for the media store."""
+    buffer = io.BytesIO()
+    np.save(buffer, np.asarray(vector, dtype=np.float32))
+    return buffer.getvalue()
+
+
+def vector_from_bytes(data, size=VOICEPRINT_SIZE):
+    """Inverse of vector_bytes(); None if `data` is missing or not a `size` long vector."""
+    if not data:
+        return None
+    try:
+        vector = np.load(io.BytesIO(data))
+    except (OSError, ValueError):
+        return None
+    return vector if vector.shape == (size,) else None
+
+
+class VoiceprintIndex:
+    """
+    Enrolled voiceprints, one .npy file per user directory under `root`.
+    The stacked matrix and its cohort normalisation are cached and rebuilt
+    when the generation marker changes; enroll() and changed() rewrite it,
+    so checking for changes costs one stat rather than one per user.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self._signature = ()  # never a real signature, so the first call builds
+        self._usernames = []
+        self._matrix = np.empty((0, VOICEPRINT_SIZE), dtype=np.float32)
+        self._centre = np.zeros(VOICEPRINT_SIZE, dtype=np.float32)
+        self._scale = np.ones(VOICEPRINT_SIZE, dtype=np.float32)
+        self._lock = threading.Lock()
+
+    def path(self, username):
+        return os.path.join(self.root, username, VOICEPRINT_FILE)
+
+    def enroll(self, username, vector):
+        save_vector(self.path(username), vector)
+        self.changed()
+
+    def enrolled(self, username):
+        return os.path.exists(self.path(username))
+
+    def changed(self):
+        """Tell every process to reload, e.g. after user directories were deleted."""
+        os.makedirs(self.root, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            f.write(str(time.time_ns()))
+        os.replace(tmp_path, os.path.join(self.root, GENERATION_FILE))
+
+    def _generation(self):
+        try:
+            st = os.stat(os.path.join(self.root, GENERATION_FILE))
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    def _usernames_on_disk(self):
+        try:
+            user_dirs = list(os.scandir(self.root))
+        except FileNotFoundError:
+            return []
+        return sorted(user_dir.name for user_dir in user_dirs if user_dir.is_dir())
+
+    def cohort(self):
+        """Return (usernames, normalised matrix, calibrated) for every enrolled voice."""
+        signature = self._generation()
+        with self._lock:
+            if signature != self._signature:
+                usernames, rows = [], []
+                for username in self._usernames_on_disk():
+                    vector = load_vector(self.path(username))
+                    if vector is not None:
+                        usernames.append(username)
+                        rows.append(vector)
+                matrix = np.vstack(rows) if rows else np.empty((0, VOICEPRINT_SIZE), dtype=np.float32)
+                if len(rows) >= MIN_COHORT:
+                    self._centre = matrix.mean(axis=0)
+                    self._scale = matrix.std(axis=0) + 1e-6
+                else:
+                    self._centre = np.zeros(VOICEPRINT_SIZE, dtype=np.float32)
+                    self._scale = np.ones(VOICEPRINT_SIZE, dtype=np.float32)
+                self._usernames = usernames
+                self._matrix = self._normalise(matrix)
+                self._signature = signature
+            return self._usernames, self._matrix, len(self._usernames) >= MIN_COHORT
+
+    def _normalise(self, vectors):
+        centred = (np.atleast_2d(vectors) - self._centre) / self._scale
+        norms = np.linalg.norm(centred, axis=1, keepdims=True)
+        return (centred / np.maximum(norms, 1e-9)).astype(np.float32)
+
+    def scores(self, vectors):
+        """
+        Cosine similarity of each row of `vectors` against every enrolled voice
+        in one matrix product. Returns (usernames, (len(vectors), cohort) scores, calibrated).
+        """
+        self.cohort()
+        with self._lock:
+            return self._usernames, self._normalise(vectors) @ self._matrix.T, len(self._usernames) >= MIN_COHORT
+
+    def verify(self, username, vector):
+        """Return (score, calibrated) of `vector` against `username`'s voiceprint, or (None, calibrated)."""
+        usernames, scores, calibrated = self.scores(vector)
+        if username not in usernames:
+            return None, calibrated
+        return float(scores[0, usernames.index(username)]), calibrated
+
+    def audit(self, checks, threshold):
+        """
+        Score many samples against the whole cohort at once.
+        `checks` is [(key, username, vector), ...]; each result gives the score
+        against the claimed user and the best-matching enrolled voice.
+        Returns (results, calibrated, elapsed_ms).
+        """
+        started = time.perf_counter()
+        if not checks:
+            return [], len(self.cohort()[0]) >= MIN_COHORT, 0.0
+        usernames, scores, calibrated = self.scores(np.vstack([vector for _key, _username, vector in checks]))
+        columns = {username: index for index, username in enumerate(usernames)}
+        best = scores.argmax(axis=1) if usernames else None
+        results = []
+        for row, (key, username, _vector) in enumerate(checks):
+            own = float(scores[row, columns[username]]) if username in columns else None
+            best_match = usernames[best[row]] if usernames else None
+            best_score = float(scores[row, best[row]]) if usernames else None
+            results.append({
+                'key': key,
+                'username': username,
+                'score': round(own, 3) if own is not None else None,
+                'verified': (own >= threshold) if calibrated and own is not None else None,
+                'best_match': best_match,
+                'best_score': round(best_score, 3) if best_score is not None else None,
+                # Someone else's voice matches the sample better than the student's own
+                'flagged': bool(calibrated and best_match != username and best_score >= threshold)
+            })
+        return results, calibrated, round((time.perf_counter() - started) * 1000, 2)
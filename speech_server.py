@@ -1,21 +1,402 @@
 """
 Speech transcription module for Voxiscribe
-This is a placeholder implementation for voice-to-text functionality
+Transcription runs on a pluggable local engine chosen by SPEECH_ENGINE.
+The model is loaded once per transcription pool process (warmed from
+gunicorn's post_worker_init hook, or lazily on the first job) and reused
+for every request.
+Audio may be a path, raw bytes or a file-like object; it is decoded in
+memory into a float32 NumPy PCM array. Silence is then trimmed by the
+voice-activity stage and long clips are split at pauses, so the engine only
+sees speech and the pieces can be transcribed concurrently. Several requests
+can be transcribed together with transcribe_batch_with_stats(), which hands
+the speech of all of them to the engine in one batch.
 """
+import io
+import os
+import threading
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
 
-def transcribe_audio(audio_path, language='en'):
+import numpy as np
+
+import config
+from voice_activity import speech_segments
+
+SAMPLE_RATE = 16000
+
+
+class SpeechEngine:
+    """Base class for transcription backends."""
+
+    name = 'base'
+    # Whether decoded audio goes through voice-activity trimming first
+    trims_silence = True
+    # Whether transcribe_batch() runs the model once for the whole batch
+    batched = False
+
+    def __init__(self, model_size=None):
+        self.model_size = model_size
+
+    @classmethod
+    def version(cls, model_size=None):
+        """Identify everything that changes this engine's output, without loading it."""
+        return cls.name
+
+    def load(self):
+        """Load model weights; called once per process."""
+
+    def decode_audio(self, source):
+        """Decode a compressed recording (path or file-like) to mono float32 at SAMPLE_RATE."""
+        raise NotImplementedError
+
+    def transcribe_segments(self, audio, language='en', prompt=None):
+        """
+        Transcribe PCM samples; `prompt` is preceding text used as context.
+        Returns [(start_seconds, end_seconds, text), ...] relative to `audio`.
+        """
+        raise NotImplementedError
+
+    def transcribe(self, audio, language='en'):
+        return ' '.join(text for _start, _end, text in self.transcribe_segments(audio, language) if text)
+
+    def transcribe_batch(self, audios, language='en'):
+        """Transcribe a list of PCM arrays in one language; returns one text per array."""
+        return [self.transcribe(audio, language) for audio in audios]
+
+
+class PlaceholderEngine(SpeechEngine):
+    """Returns a fixed string; for development without a model installed."""
+
+    name = 'placeholder'
+    # Its decoded "audio" is pure silence, which trimming would discard
+    trims_silence = False
+
+    def __init__(self, model_size=None):
+        super().__init__(None)
+
+    def decode_audio(self, source):
+        # Silence of roughly the right length, assuming ~32 kbit/s opus
+        if isinstance(source, str):
+            size = os.path.getsize(source)
+        else:
+            size = source.seek(0, io.SEEK_END)
+        return np.zeros(int(size / 4000 * SAMPLE_RATE), dtype=np.float32)
+
+    def transcribe_segments(self, audio, language='en', prompt=None):
+        if not len(audio):
+            return []
+        return [(0.0, len(audio) / SAMPLE_RATE, "This is a placeholder transcription.")]
+
+
+class WhisperEngine(SpeechEngine):
+    """
+    Offline Whisper on the CPU through faster-whisper (CTranslate2).
+    Needs `pip install faster-whisper` (1.0 or later); model weights are
+    downloaded to SPEECH_MODEL_DIR on first load. Compressed audio is decoded
+    in-process with PyAV, so browser webm/opus recordings can be passed as
+    they are. Batches of speech segments up to 30 seconds long are encoded
+    and decoded by a single CTranslate2 generate() call; longer audio would
+    not fit one mel window and goes through the long-form transcribe()
+    instead. The batched path uses faster-whisper internals, so if they
+    change it falls back to transcribing one segment at a time.
+    """
+
+    name = 'whisper'
+    batched = True
+    # Segments per generate() call; each one is a 30 second mel window
+    MAX_BATCH = 16
+    WINDOW_SAMPLES = 30 * SAMPLE_RATE
+
+    def __init__(self, model_size=None):
+        super().__init__(model_size or 'base')
+        self.model = None
+
+    @classmethod
+    def version(cls, model_size=None):
+        try:
+            from importlib.metadata import version
+            package = version('faster-whisper')
+        except Exception:
+            package = 'unknown'
+        return (f"{cls.name}-{package}:{model_size or 'base'}:{config.SPEECH_COMPUTE_TYPE}"
+                f":beam{config.SPEECH_BEAM_SIZE}")
+
+    def load(self):
+        try:
+            from faster_whisper import WhisperModel
+        except ImportError as e:
+            raise RuntimeError("SPEECH_ENGINE=whisper requires the faster-whisper package") from e
+        self.model = WhisperModel(
+            self.model_size,
+            device='cpu',
+            compute_type=config.SPEECH_COMPUTE_TYPE,
+            cpu_threads=config.SPEECH_CPU_THREADS,
+            num_workers=config.SPEECH_SEGMENT_WORKERS,
+            download_root=config.SPEECH_MODEL_DIR
+        )
+
+    def decode_audio(self, source):
+        from faster_whisper import decode_audio
+        return decode_audio(source, sampling_rate=SAMPLE_RATE)
+
+    def transcribe_segments(self, audio, language='en', prompt=None):
+        segments, _info = self.model.transcribe(
+            audio, language=language or None, beam_size=config.SPEECH_BEAM_SIZE, initial_prompt=prompt or None
+        )
+        return [(segment.start, segment.end, segment.text.strip()) for segment in segments]
+
+    def transcribe_batch(self, audios, language='en'):
+        texts = [None] * len(audios)
+        short = [index for index, audio in enumerate(audios) if len(audio) <= self.WINDOW_SAMPLES]
+        if short:
+            try:
+                batched = self._generate_batch([audios[index] for index in short], language)
+            except (ImportError, AttributeError, TypeError) as e:
+                print(f"Batched Whisper decoding unavailable, transcribing one segment at a time: {e}")
+                batched = [self.transcribe(audios[index], language) for index in short]
+            for index, text in zip(short, batched):
+                texts[index] = text
+        for index, audio in enumerate(audios):
+            if texts[index] is None:
+                texts[index] = self.transcribe(audio, language)
+        return texts
+
+    def _generate_batch(self, audios, language):
+        import ctranslate2
+        from faster_whisper.audio import pad_or_trim
+        from faster_whisper.tokenizer import Tokenizer
+        tokenizer = Tokenizer(self.model.hf_tokenizer, self.model.model.is_multilingual,
+                              task='transcribe', language=language or 'en')
+        prompt = list(tokenizer.sot_sequence) + [tokenizer.no_timestamps]
+        texts = []
+        for offset in range(0, len(audios), self.MAX_BATCH):
+            batch = audios[offset:offset + self.MAX_BATCH]
+            features = np.stack([pad_or_trim(self.model.feature_extractor(audio)[..., :-1]) for audio in batch])
+            results = self.model.model.generate(
+                ctranslate2.StorageView.from_array(np.ascontiguousarray(features, dtype=np.float32)),
+                [prompt] * len(batch),
+                beam_size=config.SPEECH_BEAM_SIZE
+            )
+            texts.extend(tokenizer.decode(result.sequences_ids[0]).strip() for result in results)
+        return texts
+
+
+ENGINES = {
+    PlaceholderEngine.name: PlaceholderEngine,
+    WhisperEngine.name: WhisperEngine,
+}
+
+_engine = None
+_engine_load_ms = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
     """
-    Placeholder function for audio transcription
-    In production, this would integrate with services like:
-    - Google Speech-to-Text API
-    - Azure Speech Services
-    - AWS Transcribe
-    - OpenAI Whisper
+    Return the process-wide engine, loading it on first use.
+    Returns (engine, load_ms) where load_ms is set only for the call that loaded it.
     """
+    global _engine, _engine_load_ms
+    if _engine is not None:
+        return _engine, None
+    with _engine_lock:
+        if _engine is not None:
+            return _engine, None
+        engine = engine_class()(config.SPEECH_MODEL_SIZE)
+        started = time.perf_counter()
+        engine.load()
+        _engine_load_ms = round((time.perf_counter() - started) * 1000, 1)
+        _engine = engine
+        return _engine, _engine_load_ms
+
+
+def engine_class():
+    """The configured engine class, available without loading a model."""
+    engine_cls = ENGINES.get(config.SPEECH_ENGINE)
+    if engine_cls is None:
+        raise ValueError(f"Unknown speech engine: {config.SPEECH_ENGINE}")
+    return engine_cls
+
+
+def engine_version():
+    """Version string of the configured engine, used to key cached transcriptions."""
+    engine_cls = engine_class()
+    version = engine_cls.version(config.SPEECH_MODEL_SIZE)
+    if config.VAD_ENABLED and engine_cls.trims_silence:
+        version += f':vad{config.VAD_MIN_SILENCE_MS}-{config.VAD_PAD_MS}-{config.VAD_MAX_SEGMENT_SECONDS}'
+    return version
+
+
+def preload_engine():
+    """Warm the model before a transcription pool process takes jobs."""
+    try:
+        engine, load_ms = get_engine()
+        print(f"Speech engine '{engine.name}' ({engine.model_size or 'default'}) loaded in {load_ms} ms")
+    except Exception as e:
+        # Requests will retry the load and report the error themselves
+        print(f"Speech engine preload failed: {e}")
+
+
+# -------------------- In-memory decoding --------------------
+
+def _resample(samples, rate):
+    if rate == SAMPLE_RATE or not len(samples):
+        return samples
+    # Linear interpolation is plenty for speech going into a 16 kHz model
+    target_times = np.arange(int(len(samples) * SAMPLE_RATE / rate)) / SAMPLE_RATE
+    return np.interp(target_times, np.arange(len(samples)) / rate, samples).astype(np.float32)
+
+
+def decode_wav(data):
+    """Decode integer PCM WAV bytes without touching disk; returns None for other formats."""
+    if data[:4] != b'RIFF' or data[8:12] != b'WAVE':
+        return None
+    try:
+        with wave.open(io.BytesIO(data)) as wav:
+            channels, width, rate = wav.getnchannels(), wav.getsampwidth(), wav.getframerate()
+            frames = wav.readframes(wav.getnframes())
+    except (wave.Error, EOFError):
+        return None
+    if width == 1:
+        samples = (np.frombuffer(frames, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    elif width == 2:
+        samples = np.frombuffer(frames, dtype='<i2').astype(np.float32) / 32768.0
+    elif width == 4:
+        samples = np.frombuffer(frames, dtype='<i4').astype(np.float32) / 2147483648.0
+    else:
+        return None
+    if channels > 1:
+        samples = samples[:len(samples) - len(samples) % channels].reshape(-1, channels).mean(axis=1)
+    return _resample(samples, rate)
+
+
+def decode_compressed(source):
+    """Decode webm/ogg/mp3... (path or file-like) with PyAV, independently of the speech engine."""
+    try:
+        import av
+    except ImportError as e:
+        raise RuntimeError("Decoding compressed audio requires the av package") from e
+    resampler = av.audio.resampler.AudioResampler(format='s16', layout='mono', rate=SAMPLE_RATE)
+    chunks = []
+    with av.open(source, mode='r', metadata_errors='ignore') as container:
+        for frame in container.decode(audio=0):
+            chunks.extend(out.to_ndarray().reshape(-1) for out in resampler.resample(frame))
+        chunks.extend(out.to_ndarray().reshape(-1) for out in resampler.resample(None))
+    if not chunks:
+        return np.zeros(0, dtype=np.float32)
+    return np.concatenate(chunks).astype(np.float32) / 32768.0
+
+
+def to_pcm(audio, engine=None):
+    """
+    Return mono float32 PCM at SAMPLE_RATE for a path, bytes-like object,
+    file-like object or an existing NumPy array. Compressed audio is decoded
+    by `engine`, or by PyAV when no engine is given.
+    """
+    if isinstance(audio, np.ndarray):
+        return audio.astype(np.float32, copy=False)
+    if isinstance(audio, str):
+        # WAV files are read and decoded here; anything else goes to the decoder by path
+        with open(audio, 'rb') as f:
+            header = f.read(12)
+            if header[:4] == b'RIFF' and header[8:12] == b'WAVE':
+                audio = header + f.read()
+    if isinstance(audio, (bytes, bytearray, memoryview)):
+        data = bytes(audio)
+        pcm = decode_wav(data)
+        if pcm is not None:
+            return pcm
+        audio = io.BytesIO(data)
+    return engine.decode_audio(audio) if engine is not None else decode_compressed(audio)
+
+
+_segment_pool = None
+
+
+def _speech_only(pcm, engine):
+    if not (config.VAD_ENABLED and engine.trims_silence):
+        return [pcm]
+    return speech_segments(
+        pcm, SAMPLE_RATE,
+        max_segment_seconds=config.VAD_MAX_SEGMENT_SECONDS,
+        min_silence_ms=config.VAD_MIN_SILENCE_MS,
+        pad_ms=config.VAD_PAD_MS
+    )
+
+
+def _transcribe_segments_concurrently(engine, segments, language):
+    global _segment_pool
+    if engine.batched or len(segments) < 2 or config.SPEECH_SEGMENT_WORKERS < 2:
+        return engine.transcribe_batch(segments, language)
+    with _engine_lock:
+        if _segment_pool is None:
+            _segment_pool = ThreadPoolExecutor(max_workers=config.SPEECH_SEGMENT_WORKERS)
+    return list(_segment_pool.map(lambda segment: engine.transcribe(segment, language=language), segments))
+
+
+def transcribe_batch_with_stats(requests):
+    """
+    Transcribe [(audio, language), ...] together and return one entry per
+    request: (text, stats), or the exception that request's audio raised.
+    The speech segments of all requests in a language go to the engine as
+    one batch; transcribe_ms is that batch's wall time.
+    """
+    engine, load_ms = get_engine()
+    results = [None] * len(requests)
+    by_language = {}
+    for index, (audio, language) in enumerate(requests):
+        started = time.perf_counter()
+        try:
+            pcm = to_pcm(audio, engine)
+        except Exception as e:
+            results[index] = e
+            continue
+        decoded = time.perf_counter()
+        segments = _speech_only(pcm, engine)
+        trimmed = time.perf_counter()
+        results[index] = ('', {
+            'engine': engine.name,
+            'model': engine.model_size,
+            'cold_start': load_ms is not None,
+            'model_load_ms': _engine_load_ms,
+            'audio_seconds': round(len(pcm) / SAMPLE_RATE, 2),
+            'speech_seconds': round(sum(len(segment) for segment in segments) / SAMPLE_RATE, 2),
+            'segments': len(segments),
+            'batch_size': len(requests),
+            'decode_ms': round((decoded - started) * 1000, 1),
+            'vad_ms': round((trimmed - decoded) * 1000, 1)
+        })
+        by_language.setdefault(language, []).append((index, segments))
+
+    for language, items in by_language.items():
+        flat = [segment for _index, segments in items for segment in segments]
+        started = time.perf_counter()
+        texts = _transcribe_segments_concurrently(engine, flat, language) if flat else []
+        transcribe_ms = round((time.perf_counter() - started) * 1000, 1)
+        position = 0
+        for index, segments in items:
+            parts = texts[position:position + len(segments)]
+            position += len(segments)
+            stats = results[index][1]
+            stats['transcribe_ms'] = transcribe_ms
+            results[index] = (' '.join(part.strip() for part in parts if part and part.strip()), stats)
+    return results
+
+
+def transcribe_with_stats(audio, language='en'):
+    """Transcribe and return (text, stats) with the engine name and latencies."""
+    result = transcribe_batch_with_stats([(audio, language)])[0]
+    if isinstance(result, Exception):
+        raise result
+    return result
+
+
+def transcribe_audio(audio, language='en'):
+    """Return the transcription of `audio` (path, bytes or file-like), or None if the engine fails."""
     try:
-        # Placeholder implementation
-        # Return a sample transcription for demo purposes
-        return "This is a placeholder transcription. Audio file received at: " + audio_path
+        text, _stats = transcribe_with_stats(audio, language)
+        return text
     except Exception as e:
         print(f"Transcription error: {e}")
-        return None
\ No newline at end of file
+        return None
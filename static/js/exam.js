@@ -205,6 +205,7 @@
     console.log('submitExam called.');
     collectCurrentAnswer();
     await autosave();
+    if (window.Proctoring) await window.Proctoring.flushEvents();
     try{
       const res = await fetch(`/submit_exam/${exam.id}`, { method: 'POST' });
       const data = await res.json();
@@ -12,6 +12,44 @@ document.addEventListener('DOMContentLoaded', function() {
     let startTime;
     let timerInterval;
     let chunkOrder = 0;
+    let sliceStartedAt = 0; // wall-clock start of the current recorder slice
+    let sliceTimer;
+    let frameOrder = 0;
+    let snapshotTimer;
+    let lastEventFrameAt = 0;
+    const snapshotCanvas = document.createElement('canvas');
+    const faceCanvas = document.createElement('canvas');
+    const FACE_CHECK_WIDTH = 320;
+
+    // Video chunks are kept until the server acknowledges them and re-sent with backoff
+    const RETRY_BASE_DELAY = 1000;
+    const RETRY_MAX_DELAY = 60000;
+    const RECONCILE_INTERVAL = 30000;
+    const MAX_UNACKED_CHUNKS = 120;
+    const unackedChunks = new Map(); // chunk order -> { chunk, startedAt, checksum, attempts, inFlight, retryTimer, conflict }
+    // Snapshot frames get the same treatment, so a failed upload does not leave a gap
+    const MAX_UNACKED_FRAMES = 60;
+    const unackedFrames = new Map(); // frame order -> { frame, capturedAt, attempts, inFlight, retryTimer }
+
+    const CRC_TABLE = (() => {
+        const table = new Uint32Array(256);
+        for (let n = 0; n < 256; n++) {
+            let c = n;
+            for (let k = 0; k < 8; k++) c = c & 1 ? 0xEDB88320 ^ (c >>> 1) : c >>> 1;
+            table[n] = c >>> 0;
+        }
+        return table;
+    })();
+
+    // Recording settings come from the server, which lowers them under load
+    const DEFAULT_RECORDING_SETTINGS = { name: 'default', timeslice_ms: 5000 };
+    let recordingSettings = DEFAULT_RECORDING_SETTINGS;
+
+    // Proctoring events are buffered and sent in batches
+    const EVENT_FLUSH_INTERVAL = 15000;
+    const EVENT_FLUSH_SIZE = 25;
+    const MAX_BUFFERED_EVENTS = 500; // matches the server's per-request limit
+    let eventBuffer = [];
 
     const examDataEl = document.getElementById('exam-data');
     const exam = JSON.parse(examDataEl.textContent);
@@ -21,22 +59,41 @@ document.addEventListener('DOMContentLoaded', function() {
         videoBox.style.display = 'flex';
 
         try {
-            const stream = await navigator.mediaDevices.getUserMedia({ video: true });
+            recordingSettings = await fetchRecordingSettings();
+            if (!await resumeUploadOrder()) {
+                recordingClosed();
+                return;
+            }
+            const stream = await navigator.mediaDevices.getUserMedia({ video: videoConstraints(recordingSettings) });
             videoEl.srcObject = stream;
 
-            // Face detection setup (using a placeholder, replace with a real library if desired)
-            setInterval(() => detectFaces(videoEl), 2000);
+            startTime = Date.now();
+            timerInterval = setInterval(updateTimer, 1000);
+            scheduleVoiceChecks(recordingSettings);
+            scheduleFaceChecks(recordingSettings);
+
+            if (recordingSettings.mode === 'snapshot') {
+                // Low-bandwidth mode: periodic JPEG stills instead of a video stream
+                scheduleSnapshots(recordingSettings.snapshot_interval_ms);
+                return;
+            }
 
-            mediaRecorder = new MediaRecorder(stream, { mimeType: 'video/webm' });
+            const recorderOptions = { mimeType: 'video/webm' };
+            if (recordingSettings.video_bits_per_second) {
+                recorderOptions.videoBitsPerSecond = recordingSettings.video_bits_per_second;
+            }
+            mediaRecorder = new MediaRecorder(stream, recorderOptions);
             mediaRecorder.ondataavailable = (event) => {
+                const startedAt = sliceStartedAt;
+                sliceStartedAt = Date.now();
                 if (event.data.size > 0) {
-                    uploadChunk(event.data);
+                    queueChunk(event.data, startedAt);
                 }
             };
-            mediaRecorder.start(5000); // New chunk every 5 seconds
-
-            startTime = Date.now();
-            timerInterval = setInterval(updateTimer, 1000);
+            sliceStartedAt = Date.now();
+            // Slices are cut with requestData() so their length can change mid-recording
+            mediaRecorder.start();
+            scheduleSlices(recordingSettings.timeslice_ms);
         } catch (err) {
             console.error("Proctoring setup failed:", err);
             alert("Webcam access is required for this exam.");
@@ -44,6 +101,147 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
 
+    async function fetchRecordingSettings() {
+        try {
+            const res = await fetch(`/proctoring/settings?exam_id=${exam.id}`);
+            const data = await res.json();
+            if (data.success && data.settings) return data.settings;
+        } catch (err) {
+            console.error('Failed to fetch recording settings:', err);
+        }
+        return DEFAULT_RECORDING_SETTINGS;
+    }
+
+    // After a page reload the server may already hold chunks or frames for this
+    // attempt; numbering carries on after the highest one instead of restarting at 0
+    async function resumeUploadOrder() {
+        const snapshot = recordingSettings.mode === 'snapshot';
+        try {
+            const res = await fetch(`/proctoring/chunks/status?exam_id=${exam.id}${snapshot ? '&stream=frames' : ''}`);
+            const status = await res.json();
+            if (!status.success) return true;
+            if (status.finalized) return false;
+            const next = Math.max(status.committed_through, ...status.buffered, ...status.missing) + 1;
+            if (snapshot) frameOrder = next;
+            else chunkOrder = next;
+        } catch (err) {
+            console.error('Failed to check chunk upload status:', err);
+        }
+        return true;
+    }
+
+    function videoConstraints(settings) {
+        if (settings.mode === 'snapshot') {
+            return { width: { ideal: settings.snapshot_width } };
+        }
+        if (!settings.width) return true;
+        return {
+            width: { ideal: settings.width },
+            height: { ideal: settings.height },
+            frameRate: { ideal: settings.frame_rate }
+        };
+    }
+
+    function scheduleSlices(timeslice) {
+        clearInterval(sliceTimer);
+        sliceTimer = setInterval(() => {
+            if (mediaRecorder && mediaRecorder.state === 'recording') mediaRecorder.requestData();
+        }, timeslice);
+    }
+
+    function scheduleSnapshots(interval) {
+        clearInterval(snapshotTimer);
+        snapshotTimer = setInterval(() => captureFrame(Date.now()), interval);
+        captureFrame(Date.now());
+    }
+
+    function captureFrame(capturedAt) {
+        if (!videoEl.videoWidth) return;
+        const width = Math.min(recordingSettings.snapshot_width, videoEl.videoWidth);
+        snapshotCanvas.width = width;
+        snapshotCanvas.height = Math.round(videoEl.videoHeight * width / videoEl.videoWidth);
+        snapshotCanvas.getContext('2d').drawImage(videoEl, 0, 0, snapshotCanvas.width, snapshotCanvas.height);
+        // The order is only taken once there is a frame to send, so a failed encode leaves no gap
+        snapshotCanvas.toBlob((blob) => {
+            if (blob) queueFrame(blob, capturedAt);
+        }, 'image/jpeg', recordingSettings.snapshot_quality);
+    }
+
+    function queueFrame(frame, capturedAt) {
+        const order = frameOrder++;
+        unackedFrames.set(order, { frame, capturedAt, attempts: 0, inFlight: false, retryTimer: null });
+        if (unackedFrames.size > MAX_UNACKED_FRAMES) {
+            const oldest = Math.min(...unackedFrames.keys());
+            clearTimeout(unackedFrames.get(oldest).retryTimer);
+            unackedFrames.delete(oldest);
+            console.error(`Dropped unacknowledged snapshot frame ${oldest}`);
+        }
+        uploadFrame(order);
+    }
+
+    async function uploadFrame(order) {
+        const pending = unackedFrames.get(order);
+        if (!pending || pending.inFlight) return;
+        clearTimeout(pending.retryTimer);
+        pending.retryTimer = null;
+        pending.inFlight = true;
+
+        const formData = new FormData();
+        formData.append('exam_id', exam.id);
+        formData.append('frame_order', order);
+        formData.append('captured_at', pending.capturedAt);
+        formData.append('frame', pending.frame, 'frame.jpg');
+
+        try {
+            const res = await fetch('/proctoring/frame', {
+                method: 'POST',
+                body: formData
+            });
+            if (res.status === 410) {
+                recordingClosed();
+                return;
+            }
+            const data = await res.json();
+            if (data.settings) applyRecordingSettings(data.settings);
+            if (res.ok) {
+                unackedFrames.delete(order);
+                return;
+            }
+            throw new Error(data.message || 'HTTP ' + res.status);
+        } catch (err) {
+            console.error(`Failed to upload snapshot frame ${order}:`, err);
+            scheduleRetry(unackedFrames, order, uploadFrame);
+        } finally {
+            pending.inFlight = false;
+        }
+    }
+
+    function applyRecordingSettings(settings) {
+        if (!settings) return;
+        if (recordingSettings.mode === 'snapshot') {
+            if (settings.snapshot_interval_ms && settings.snapshot_interval_ms !== recordingSettings.snapshot_interval_ms) {
+                recordingSettings = settings;
+                scheduleSnapshots(settings.snapshot_interval_ms);
+            }
+            return;
+        }
+        if (settings.name === recordingSettings.name) return;
+        // The bitrate is fixed for the life of the recorder (restarting it would
+        // split the recording), so a new tier changes resolution, frame rate and
+        // slice length on the fly; the server only counts on the lower bitrate
+        // for sessions that start after the change
+        const track = videoEl.srcObject && videoEl.srcObject.getVideoTracks()[0];
+        if (track && settings.width) {
+            track.applyConstraints(videoConstraints(settings)).catch(err => {
+                console.error('Failed to apply recording settings:', err);
+            });
+        }
+        if (settings.timeslice_ms !== recordingSettings.timeslice_ms) {
+            scheduleSlices(settings.timeslice_ms);
+        }
+        recordingSettings = settings;
+    }
+
     function updateTimer() {
         const elapsed = Math.floor((Date.now() - startTime) / 1000);
         const minutes = String(Math.floor(elapsed / 60)).padStart(2, '0');
@@ -51,50 +249,243 @@ document.addEventListener('DOMContentLoaded', function() {
         if (elapsedEl) elapsedEl.textContent = `${minutes}:${seconds}`;
     }
 
-    async function uploadChunk(chunk) {
-        const formData = new FormData();
-        formData.append('exam_id', exam.id);
-        formData.append('chunk_order', chunkOrder++);
-        formData.append('video_chunk', chunk);
+    function crc32(bytes) {
+        let crc = 0xFFFFFFFF;
+        for (let i = 0; i < bytes.length; i++) {
+            crc = CRC_TABLE[(crc ^ bytes[i]) & 0xFF] ^ (crc >>> 8);
+        }
+        return ((crc ^ 0xFFFFFFFF) >>> 0).toString(16).padStart(8, '0');
+    }
+
+    async function queueChunk(chunk, startedAt) {
+        const order = chunkOrder++;
+        const checksum = crc32(new Uint8Array(await chunk.arrayBuffer()));
+        unackedChunks.set(order, { chunk, startedAt, checksum, attempts: 0, inFlight: false, retryTimer: null, conflict: false });
+        if (unackedChunks.size > MAX_UNACKED_CHUNKS) {
+            // Bound memory on a long outage; the oldest chunk is given up
+            const oldest = Math.min(...unackedChunks.keys());
+            clearTimeout(unackedChunks.get(oldest).retryTimer);
+            unackedChunks.delete(oldest);
+            console.error(`Dropped unacknowledged video chunk ${oldest}`);
+        }
+        uploadChunk(order);
+    }
+
+    async function uploadChunk(order) {
+        const pending = unackedChunks.get(order);
+        if (!pending || pending.inFlight) return;
+        clearTimeout(pending.retryTimer);
+        pending.retryTimer = null;
+        pending.inFlight = true;
+
+        // Raw body with metadata in the query string, so the server can stream it to disk
+        const params = new URLSearchParams({
+            exam_id: exam.id,
+            chunk_order: order,
+            started_at: pending.startedAt,
+            checksum: pending.checksum
+        });
 
         try {
-            await fetch('/proctoring/chunk', {
+            const res = await fetch(`/proctoring/chunk/raw?${params}`, {
                 method: 'POST',
-                body: formData
+                headers: { 'Content-Type': 'application/octet-stream' },
+                body: pending.chunk
             });
+            const data = await res.json();
+            if (data.settings) applyRecordingSettings(data.settings);
+            if (res.ok) {
+                unackedChunks.delete(order);
+                return;
+            }
+            if (res.status === 409) {
+                // The server already holds different bytes for this order and re-sending cannot
+                // help; the chunk is kept rather than thrown away and the clash is reported
+                pending.conflict = true;
+                console.error(`Video chunk ${order} conflicts with the copy already stored by the server`);
+                logProctoringEvent('video_chunk_conflict');
+                return;
+            }
+            if (res.status === 410) {
+                recordingClosed();
+                return;
+            }
+            throw new Error(data.message || 'HTTP ' + res.status);
         } catch (err) {
-            console.error('Failed to upload video chunk:', err);
+            console.error(`Failed to upload video chunk ${order}:`, err);
+            scheduleRetry(unackedChunks, order, uploadChunk);
+        } finally {
+            pending.inFlight = false;
+        }
+    }
+
+    // The server already assembled this attempt's recording; nothing more can be added to it
+    function recordingClosed() {
+        if (mediaRecorder && mediaRecorder.state !== 'inactive') mediaRecorder.stop();
+        clearInterval(sliceTimer);
+        clearInterval(snapshotTimer);
+        for (const unacked of [unackedChunks, unackedFrames]) {
+            for (const pending of unacked.values()) clearTimeout(pending.retryTimer);
+            unacked.clear();
         }
+        console.error('The recording for this attempt was already closed by the server; recording stopped.');
+    }
+
+    function scheduleRetry(unacked, order, upload) {
+        const pending = unacked.get(order);
+        if (!pending || pending.retryTimer) return;
+        const delay = Math.min(RETRY_BASE_DELAY * 2 ** pending.attempts, RETRY_MAX_DELAY);
+        pending.attempts++;
+        pending.retryTimer = setTimeout(() => upload(order), delay * (0.5 + Math.random() / 2));
     }
 
-    async function logProctoringEvent(eventType) {
+    async function reconcileChunks() {
+        if (chunkOrder === 0 || unackedChunks.size === 0) return;
         try {
-            await fetch('/proctoring/log', {
+            const res = await fetch(`/proctoring/chunks/status?exam_id=${exam.id}&last_order=${chunkOrder - 1}`);
+            const status = await res.json();
+            if (!status.success) return;
+            const missing = new Set(status.missing);
+            for (const [order, pending] of [...unackedChunks]) {
+                if (pending.conflict) continue;
+                if (missing.has(order)) {
+                    scheduleRetry(unackedChunks, order, uploadChunk);
+                } else if (order <= status.committed_through || status.buffered.includes(order)) {
+                    // Stored even though the acknowledgement never reached us
+                    clearTimeout(unackedChunks.get(order).retryTimer);
+                    unackedChunks.delete(order);
+                }
+            }
+        } catch (err) {
+            console.error('Failed to check chunk upload status:', err);
+        }
+    }
+
+    setInterval(reconcileChunks, RECONCILE_INTERVAL);
+    window.addEventListener('online', reconcileChunks);
+    window.addEventListener('online', () => {
+        for (const order of unackedFrames.keys()) uploadFrame(order);
+    });
+
+    function logProctoringEvent(eventType) {
+        const now = Date.now();
+        eventBuffer.push({ event_type: eventType, timestamp: now });
+        // In snapshot mode every event also gets a frame, at most one per second
+        if (recordingSettings.mode === 'snapshot' && now - lastEventFrameAt >= 1000) {
+            lastEventFrameAt = now;
+            captureFrame(now);
+        }
+        if (eventBuffer.length >= EVENT_FLUSH_SIZE) {
+            flushProctoringEvents();
+        }
+    }
+
+    async function flushProctoringEvents() {
+        if (eventBuffer.length === 0) return;
+        const events = eventBuffer;
+        eventBuffer = [];
+        try {
+            const res = await fetch('/proctoring/log', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({
-                    exam_id: exam.id,
-                    event_type: eventType
-                })
+                body: JSON.stringify({ exam_id: exam.id, events: events })
             });
+            if (!res.ok) throw new Error('HTTP ' + res.status);
         } catch (err) {
-            console.error('Failed to log proctoring event:', err);
+            console.error('Failed to log proctoring events:', err);
+            // Keep them for the next flush
+            eventBuffer = events.concat(eventBuffer).slice(-MAX_BUFFERED_EVENTS);
         }
     }
 
-    function detectFaces(video) {
-        // This is a placeholder for actual face detection logic.
-        // In a real implementation, you would use a library like face-api.js.
-        const isFacePresent = Math.random() > 0.1; // Simulate face presence
+    function flushProctoringEventsOnExit() {
+        if (eventBuffer.length === 0 || !navigator.sendBeacon) return;
+        const body = new Blob(
+            [JSON.stringify({ exam_id: exam.id, events: eventBuffer })],
+            { type: 'application/json' }
+        );
+        if (navigator.sendBeacon('/proctoring/log', body)) {
+            eventBuffer = [];
+        }
+    }
 
-        if (!isFacePresent) {
-            logProctoringEvent('student_left_frame');
-            videoBox.style.borderColor = 'red';
-        } else {
-            videoBox.style.borderColor = '#e53935';
+    setInterval(flushProctoringEvents, EVENT_FLUSH_INTERVAL);
+    // exam.js flushes before submitting, so the last events reach the timeline built at submit
+    window.Proctoring = { flushEvents: flushProctoringEvents };
+    window.addEventListener('pagehide', flushProctoringEventsOnExit);
+    document.addEventListener('visibilitychange', () => {
+        if (document.visibilityState === 'hidden') flushProctoringEventsOnExit();
+    });
+
+    // Voice checks: a short microphone sample is compared with the enrolled voice.
+    // The server records a mismatch as a proctoring event.
+    async function checkVoice(seconds) {
+        let stream;
+        try {
+            stream = await navigator.mediaDevices.getUserMedia({ audio: true });
+            const recorder = new MediaRecorder(stream);
+            const parts = [];
+            recorder.ondataavailable = (event) => {
+                if (event.data.size > 0) parts.push(event.data);
+            };
+            const stopped = new Promise(resolve => { recorder.onstop = resolve; });
+            recorder.start();
+            setTimeout(() => recorder.stop(), seconds * 1000);
+            await stopped;
+            await fetch(`/voice/verify?exam_id=${exam.id}`, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/octet-stream' },
+                body: new Blob(parts, { type: recorder.mimeType })
+            });
+        } catch (err) {
+            console.error('Voice check failed:', err);
+        } finally {
+            if (stream) stream.getTracks().forEach(track => track.stop());
+        }
+    }
+
+    function scheduleVoiceChecks(settings) {
+        if (!settings.voice_check_seconds) return;
+        checkVoice(settings.voice_check_seconds);
+        if (settings.voice_check_interval_ms) {
+            setInterval(() => checkVoice(settings.voice_check_seconds), settings.voice_check_interval_ms);
         }
     }
 
+    // Face checks: a webcam still is matched against the enrolled face on the server,
+    // which logs frames with no face or someone else's
+    function detectFaces(video) {
+        if (!video.videoWidth) return;
+        const width = Math.min(FACE_CHECK_WIDTH, video.videoWidth);
+        faceCanvas.width = width;
+        faceCanvas.height = Math.round(video.videoHeight * width / video.videoWidth);
+        faceCanvas.getContext('2d').drawImage(video, 0, 0, faceCanvas.width, faceCanvas.height);
+        faceCanvas.toBlob(async (blob) => {
+            if (!blob) return;
+            try {
+                const res = await fetch(`/face/verify?exam_id=${exam.id}`, {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'image/jpeg' },
+                    body: blob
+                });
+                const data = await res.json();
+                if (!data.success) return;
+                const matched = data.face_found && data.verified !== false;
+                videoBox.style.borderColor = matched ? '#e53935' : 'red';
+                // In snapshot mode the recording keeps a frame of what the check saw
+                if (!matched && recordingSettings.mode === 'snapshot') captureFrame(Date.now());
+            } catch (err) {
+                console.error('Face check failed:', err);
+            }
+        }, 'image/jpeg', 0.8);
+    }
+
+    function scheduleFaceChecks(settings) {
+        if (!settings.face_check_interval_ms) return;
+        videoEl.addEventListener('loadeddata', () => detectFaces(videoEl), { once: true });
+        setInterval(() => detectFaces(videoEl), settings.face_check_interval_ms);
+    }
+
     if (consentButton) {
         consentButton.addEventListener('click', initProctoring);
     } else {
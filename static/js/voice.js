@@ -6,6 +6,8 @@
   let wakewordRecognition = null;
   let isRecording = false;
   let autoCommandMode = true; // interpret command phrases
+  let dictation = null; // server-side dictation session when SpeechRecognition is missing
+  const DICTATION_CHUNK_MS = 2000;
 
   // --- Core Functions ---
 
@@ -28,7 +30,8 @@
   // --- Wakeword Listener (Stage 1) ---
 
   function startWakewordListener() {
-    if (!supportsSpeechRecognition() || wakewordRecognition) return;
+    // Without SpeechRecognition dictation still works from the buttons, through the server
+    if (!SpeechRecognition || wakewordRecognition) return;
 
     wakewordRecognition = new SpeechRecognition();
     wakewordRecognition.continuous = true;
@@ -79,6 +82,7 @@
 
   function startMainRecognition(){
     if (isRecording) return;
+    if (!SpeechRecognition) { startServerDictation(); return; }
     if (!supportsSpeechRecognition()) return;
 
     stopWakewordListener(); // Ensure wakeword listener is off
@@ -160,6 +164,10 @@
         mainRecognition.stop();
     }
     mainRecognition = null;
+    if (dictation) {
+        dictation.recorder.stop(); // onstop sends the last chunk and finishes the session
+        dictation = null;
+    }
 
     const qid = window.getCurrentQuestionId && window.getCurrentQuestionId();
     let active = document.getElementById(`answer-input-${qid}`);
@@ -168,6 +176,84 @@
     }
   }
 
+  // --- Server Dictation (browsers without SpeechRecognition) ---
+
+  async function startServerDictation() {
+    try {
+      const stream = await navigator.mediaDevices.getUserMedia({ audio: true });
+      const res = await fetch('/transcribe/stream', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ language: 'en' })
+      });
+      const data = await res.json();
+      if (!data.success) throw new Error(data.message);
+
+      const session = { id: data.session_id, stream, order: 0, sending: Promise.resolve() };
+      session.recorder = new MediaRecorder(stream, { mimeType: 'audio/webm' });
+      session.recorder.ondataavailable = (event) => {
+        if (event.data.size > 0) sendDictationChunk(session, event.data);
+      };
+      session.recorder.onstop = () => finishServerDictation(session);
+      session.recorder.start(DICTATION_CHUNK_MS);
+
+      dictation = session;
+      isRecording = true;
+      setMicActive(true);
+      toast('Listening…');
+      const qid = window.getCurrentQuestionId && window.getCurrentQuestionId();
+      const active = document.getElementById(`answer-input-${qid}`);
+      if (active) active.classList.add('recording-active');
+    } catch (err) {
+      toast('Dictation unavailable: ' + err.message, true);
+    }
+  }
+
+  function sendDictationChunk(session, chunk) {
+    const order = session.order++;
+    // One request at a time, so partial text never goes backwards
+    session.sending = session.sending.then(async () => {
+      try {
+        const res = await fetch(`/transcribe/stream/${session.id}/chunk?order=${order}`, {
+          method: 'POST',
+          headers: { 'Content-Type': 'application/octet-stream' },
+          body: chunk
+        });
+        const data = await res.json();
+        if (data.success) showDictationText(data.text);
+      } catch (err) {
+        console.error('Failed to send dictation chunk:', err);
+      }
+    });
+  }
+
+  async function finishServerDictation(session) {
+    await session.sending;
+    session.stream.getTracks().forEach(track => track.stop());
+    try {
+      const res = await fetch(`/transcribe/stream/${session.id}/finish`, { method: 'POST' });
+      const data = await res.json();
+      if (data.text !== undefined) showDictationText(data.text);
+    } catch (err) {
+      console.error('Failed to finish dictation:', err);
+    }
+    setMicActive(false);
+    toast('Stopped listening');
+  }
+
+  function showDictationText(text) {
+    showLiveTranscript(text);
+    const qid = window.getCurrentQuestionId && window.getCurrentQuestionId();
+    const active = document.getElementById(`answer-input-${qid}`);
+    if (active) {
+      active.value = text.trim();
+      active.dispatchEvent(new Event('input', { bubbles: true }));
+      if (window.collectCurrentAnswer) {
+        window.collectCurrentAnswer();
+      }
+    }
+  }
+
   // --- Transcript and Command Handling ---
 
   function showLiveTranscript(text){
@@ -0,0 +1,255 @@
+"""
+Incremental dictation transcription for Voxiscribe.
+The browser posts short MediaRecorder chunks to a session; they are
+appended in order to one growing recording. Each step decodes only the
+WebM clusters that arrived since the last step (the decoded PCM is kept next
+to the recording), transcribes only the audio after the last committed
+point, with the committed text as context, and commits segments that end
+well before the newest audio. A tail longer than `max_tail_seconds` is cut
+and committed so every step stays short. Text that may still change is
+returned as a partial hypothesis.
+"""
+import json
+import os
+import shutil
+import tempfile
+import time
+import uuid
+
+import numpy as np
+
+from recording import AttemptRecording
+
+try:
+    import fcntl
+except ImportError:  # Windows development servers
+    fcntl = None
+
+AUDIO_FILE = 'audio.webm'
+AUDIO_INDEX_FILE = 'audio.idx'
+PCM_FILE = 'audio.pcm'  # float32 samples decoded from complete clusters
+STATE_FILE = 'state.json'
+LOCK_FILE = '.transcribe.lock'
+
+# Segments ending this close to the newest audio may still change
+STABLE_MARGIN_SECONDS = 1.5
+# Characters of committed text handed to the engine as context
+PROMPT_CHARS = 200
+
+# A MediaRecorder WebM stream is a header followed by clusters; each cluster
+# can be decoded on its own once the header is put in front of it
+EBML_MAGIC = b'\x1a\x45\xdf\xa3'
+CLUSTER_ID = b'\x1f\x43\xb6\x75'
+TIMECODE_ID = 0xE7
+
+
+class StreamingSession:
+    """One dictation session stored in its own directory."""
+
+    def __init__(self, sessions_dir, session_id):
+        self.session_id = session_id
+        self.directory = os.path.join(sessions_dir, session_id)
+        self.recording = AttemptRecording(self.directory, AUDIO_FILE, AUDIO_INDEX_FILE)
+        self.state_path = os.path.join(self.directory, STATE_FILE)
+        self.pcm_path = os.path.join(self.directory, PCM_FILE)
+
+    @classmethod
+    def create(cls, sessions_dir, owner_id, language='en'):
+        session = cls(sessions_dir, uuid.uuid4().hex)
+        os.makedirs(session.directory)
+        session.save_state({
+            'session_id': session.session_id,
+            'owner_id': owner_id,
+            'language': language,
+            'created_at': time.time(),
+            'committed_text': '',
+            'committed_seconds': 0.0,
+            'partial': '',
+            'transcribed_bytes': 0,
+            'header_bytes': None,
+            'decoded_bytes': 0,
+            'decoded_samples': 0,
+            'finished': False
+        })
+        return session
+
+    @classmethod
+    def open(cls, sessions_dir, session_id):
+        if not session_id.isalnum():
+            return None
+        session = cls(sessions_dir, session_id)
+        return session if os.path.exists(session.state_path) else None
+
+    def state(self):
+        with open(self.state_path) as f:
+            return json.load(f)
+
+    def save_state(self, state):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.state_path)
+
+    def append(self, chunk_order, stream, max_length=None):
+        status, _entry = self.recording.append_chunk(chunk_order, stream, max_length=max_length)
+        return status
+
+    def audio_since(self, state, size, engine, final=False):
+        """
+        Return the PCM after state['committed_seconds'], decoding only the
+        bytes that arrived since the last call. Complete clusters are decoded
+        once and appended to PCM_FILE; the cluster still being written is
+        decoded on every call until the next one starts. Updates `state`.
+        """
+        from speech_server import SAMPLE_RATE, to_pcm
+        with open(self.recording.data_path, 'rb') as f:
+            if state.get('header_bytes') is None:
+                start = f.read(size)
+                if start[:4] != EBML_MAGIC:
+                    # Not a WebM stream, so there are no clusters to resume from
+                    pcm = to_pcm(self.recording.data_path, engine)
+                    return pcm[int(round(state['committed_seconds'] * SAMPLE_RATE)):]
+                first = _next_cluster(start, 0)
+                if first < 0:
+                    return np.zeros(0, dtype=np.float32)  # header not complete yet
+                state['header_bytes'] = state['decoded_bytes'] = first
+                state['decoded_samples'] = 0
+            f.seek(0)
+            header = f.read(state['header_bytes'])
+            f.seek(state['decoded_bytes'])
+            new = f.read(size - state['decoded_bytes'])
+
+        # Every cluster before the last one to start is complete
+        complete = len(new) if final else _last_cluster(new)
+        if complete > 0:
+            pcm = to_pcm(header + new[:complete], engine).astype('<f4')
+            with open(self.pcm_path, 'ab') as f:
+                # Drop samples a step that died before saving its state appended
+                f.truncate(state['decoded_samples'] * 4)
+                pcm.tofile(f)
+            state['decoded_bytes'] += complete
+            state['decoded_samples'] += len(pcm)
+        open_cluster = np.zeros(0, dtype=np.float32)
+        if complete < len(new):
+            open_cluster = to_pcm(header + new[complete:], engine)
+
+        # The committed point may already lie inside the open cluster
+        skip = int(round(state['committed_seconds'] * SAMPLE_RATE))
+        cached = state['decoded_samples']
+        decoded = np.zeros(0, dtype=np.float32)
+        if skip < cached:
+            decoded = np.fromfile(self.pcm_path, dtype='<f4', count=cached - skip, offset=skip * 4)
+        return np.concatenate([decoded, open_cluster[max(skip - cached, 0):]])
+
+    def delete(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def session_text(state):
+    return ' '.join(part for part in (state['committed_text'], state['partial']) if part)
+
+
+def advance_session(sessions_dir, session_id, final=False, max_tail_seconds=20):
+    """
+    Transcribe whatever arrived since the last step; runs in a pool process.
+    With `final`, everything left is committed and the session is closed.
+    """
+    from speech_server import SAMPLE_RATE, get_engine
+    session = StreamingSession(sessions_dir, session_id)
+    with _SessionLock(session.directory):
+        state = session.state()
+        size = session.recording.committed_size()
+        if size == state['transcribed_bytes'] and not final:
+            return state
+        segments, tail_seconds = [], 0.0
+        if size:
+            engine, _load_ms = get_engine()
+            tail = session.audio_since(state, size, engine, final)
+            # Forced cut: audio that never paused long enough to commit is
+            # committed in windows of max_tail_seconds
+            window = int(max_tail_seconds * SAMPLE_RATE)
+            while not final and window > 0 and len(tail) > window:
+                _commit(state, engine.transcribe_segments(
+                    tail[:window], state['language'], state['committed_text'][-PROMPT_CHARS:]))
+                state['committed_seconds'] += window / SAMPLE_RATE
+                tail = tail[window:]
+            tail_seconds = len(tail) / SAMPLE_RATE
+            if len(tail):
+                segments = engine.transcribe_segments(tail, state['language'], state['committed_text'][-PROMPT_CHARS:])
+
+        # Commit stable segments
+        if final:
+            stable = len(segments)
+        else:
+            stable = sum(1 for _start, end, _text in segments if end <= tail_seconds - STABLE_MARGIN_SECONDS)
+        _commit(state, segments[:stable])
+        if stable:
+            state['committed_seconds'] += segments[stable - 1][1]
+        state['partial'] = ' '.join(text for _start, _end, text in segments[stable:] if text)
+        state['transcribed_bytes'] = size
+        state['finished'] = final
+        session.save_state(state)
+        return state
+
+
+def _commit(state, segments):
+    committed = [text for _start, _end, text in segments if text]
+    if committed:
+        state['committed_text'] = ' '.join([state['committed_text']] + committed).strip()
+
+
+def _cluster_at(data, position):
+    # The ID alone can occur inside audio data; a real cluster starts with its timecode
+    if data[position:position + 4] != CLUSTER_ID or position + 4 >= len(data):
+        return False
+    first = data[position + 4]
+    size_length = 9 - first.bit_length() if first else 9
+    timecode = position + 4 + size_length
+    return size_length <= 8 and timecode < len(data) and data[timecode] == TIMECODE_ID
+
+
+def _next_cluster(data, start):
+    position = data.find(CLUSTER_ID, start)
+    while position >= 0 and not _cluster_at(data, position):
+        position = data.find(CLUSTER_ID, position + 1)
+    return position
+
+
+def _last_cluster(data):
+    position = data.rfind(CLUSTER_ID)
+    while position >= 0 and not _cluster_at(data, position):
+        position = data.rfind(CLUSTER_ID, 0, position)
+    return max(position, 0)
+
+
+class _SessionLock:
+    # One step per session at a time, across pool processes
+    def __init__(self, directory):
+        self.path = os.path.join(directory, LOCK_FILE)
+        self.lock_file = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            self.lock_file = open(self.path, 'w')
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.lock_file is not None:
+            self.lock_file.close()
+        return False
+
+
+def prune_sessions(sessions_dir, ttl_seconds):
+    """Delete sessions untouched for longer than `ttl_seconds`."""
+    now = time.time()
+    try:
+        entries = list(os.scandir(sessions_dir))
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        try:
+            if entry.is_dir() and now - os.stat(os.path.join(entry.path, STATE_FILE)).st_mtime > ttl_seconds:
+                shutil.rmtree(entry.path, ignore_errors=True)
+        except OSError:
+            continue
@@ -0,0 +1,91 @@
+"""
+Deterministic synthetic audio for Voxiscribe benchmarks.
+Builds tones, noise and speech-like signals (harmonic voices shaped into
+syllables and phrases with pauses) from a seed, so every run and every
+machine transcribes byte-identical clips without downloading anything.
+"""
+import hashlib
+import io
+import wave
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+DEFAULT_LENGTHS = (2, 5, 15, 30, 60)
+
+
+def _times(seconds):
+    return np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+
+
+def tone(seconds, frequency=440.0, amplitude=0.3):
+    return (amplitude * np.sin(2 * np.pi * frequency * _times(seconds))).astype(np.float32)
+
+
+def noise(seconds, amplitude=0.05, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.normal(0, amplitude, int(seconds * SAMPLE_RATE)).astype(np.float32)
+
+
+def speech_like(seconds, seed=0, pause_fraction=0.3):
+    """
+    A voice-like harmonic signal with a wandering pitch, cut into syllables
+    of 150-350 ms and phrases separated by pauses, over faint room noise.
+    `pause_fraction` is roughly the share of the clip that is silence.
+    """
+    rng = np.random.default_rng(seed)
+    t = _times(seconds)
+    pitch = rng.uniform(100, 220) * (1 + 0.08 * np.sin(2 * np.pi * rng.uniform(0.2, 0.6) * t))
+    phase = 2 * np.pi * np.cumsum(pitch) / SAMPLE_RATE
+    voice = sum(np.sin(k * phase) / k for k in range(1, 8))
+
+    # Syllable and phrase envelopes built from random-length runs
+    envelope = np.zeros(len(t))
+    position = 0
+    while position < len(t):
+        if rng.random() < pause_fraction:
+            position += int(rng.uniform(0.3, 1.2) * SAMPLE_RATE)
+            continue
+        length = int(rng.uniform(0.15, 0.35) * SAMPLE_RATE)
+        end = min(len(t), position + length)
+        envelope[position:end] = np.hanning(length)[:end - position] * rng.uniform(0.5, 1.0)
+        position = end
+    audio = 0.25 * voice * envelope + rng.normal(0, 0.002, len(t))
+    return np.clip(audio, -1, 1).astype(np.float32)
+
+
+def to_wav(pcm):
+    """16-bit mono WAV bytes for float PCM at SAMPLE_RATE."""
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes((np.clip(pcm, -1, 1) * 32767).astype('<i2').tobytes())
+    return buffer.getvalue()
+
+
+def build_corpus(lengths=DEFAULT_LENGTHS, seed=0):
+    """
+    Return the benchmark clips as dicts with name, kind, seconds and wav bytes:
+    a tone, noise and a speech-like clip of every length.
+    """
+    corpus = []
+    for index, seconds in enumerate(lengths):
+        clip_seed = seed * 1000 + index
+        for kind, pcm in (
+            ('tone', tone(seconds, frequency=220.0 + 40 * index)),
+            ('noise', noise(seconds, seed=clip_seed)),
+            ('speech', speech_like(seconds, seed=clip_seed)),
+        ):
+            corpus.append({'name': f'{kind}-{seconds}s', 'kind': kind, 'seconds': seconds, 'wav': to_wav(pcm)})
+    return corpus
+
+
+def corpus_digest(corpus):
+    """SHA-256 over every clip, so results are only compared on the same audio."""
+    sha = hashlib.sha256()
+    for clip in corpus:
+        sha.update(clip['name'].encode())
+        sha.update(clip['wav'])
+    return sha.hexdigest()
@@ -0,0 +1,74 @@
+"""
+Proctoring timeline index for Voxiscribe.
+Built when a recording is finalised (and again if proctoring logs arrive
+after that) so the results page can draw an event heatmap and seek the
+video to any event without re-reading the recording.
+"""
+from bisect import bisect_right
+from datetime import datetime, timezone
+
+TIMELINE_VERSION = 1
+
+
+def to_epoch_ms(value):
+    """Convert a DB timestamp (datetime or ISO string, UTC) to epoch milliseconds."""
+    if value is None:
+        return None
+    if not isinstance(value, datetime):
+        try:
+            value = datetime.fromisoformat(str(value))
+        except ValueError:
+            return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp() * 1000)
+
+
+def build_timeline(chunks, events, bucket_seconds=10, start_ms=None):
+    """
+    Build a compact timeline.
+
+    chunks: iterable of (chunk_order, started_ms, byte_offset, length) in recording order.
+    events: iterable of (epoch_ms, event_type), any order.
+
+    The result stores times relative to the recording start:
+      chunks  -> [[chunk_order, video_ms, byte_offset, length], ...]
+      events  -> [[video_ms, event_type_index, chunk_index], ...]
+      buckets -> event totals per `bucket_seconds` slot
+    """
+    chunks = [c for c in chunks if c[1]]
+    if start_ms is None:
+        start_ms = chunks[0][1] if chunks else None
+    events = sorted((ms, kind) for ms, kind in events if ms is not None)
+    if start_ms is None:
+        start_ms = events[0][0] if events else 0
+
+    chunk_rows = [[order, max(started - start_ms, 0), offset, length] for order, started, offset, length in chunks]
+    chunk_starts = [row[1] for row in chunk_rows]
+
+    event_types = []
+    type_index = {}
+    event_rows = []
+    bucket_ms = bucket_seconds * 1000
+    buckets = []
+    for ms, kind in events:
+        video_ms = max(ms - start_ms, 0)
+        if kind not in type_index:
+            type_index[kind] = len(event_types)
+            event_types.append(kind)
+        chunk_index = bisect_right(chunk_starts, video_ms) - 1 if chunk_starts else -1
+        event_rows.append([video_ms, type_index[kind], chunk_index])
+        slot = video_ms // bucket_ms
+        if slot >= len(buckets):
+            buckets.extend([0] * (slot + 1 - len(buckets)))
+        buckets[slot] += 1
+
+    return {
+        'version': TIMELINE_VERSION,
+        'start_ms': start_ms,
+        'bucket_seconds': bucket_seconds,
+        'event_types': event_types,
+        'buckets': buckets,
+        'chunks': chunk_rows,
+        'events': event_rows
+    }
@@ -0,0 +1,177 @@
+"""
+Transcription result cache for Voxiscribe.
+Results are keyed by the SHA-256 of the audio bytes together with the
+language and the speech engine version, so identical audio (a retried
+upload, a voice-auth sample read again) is answered without running the
+engine. Entries live in a size-bounded in-memory LRU and, optionally, in a
+directory shared by all workers that is pruned oldest-first.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+HASH_BUFFER_SIZE = 256 * 1024
+# Rescan the disk cache at most this often while it is over its limit
+DISK_PRUNE_INTERVAL = 60
+
+
+def audio_digest(audio):
+    """SHA-256 of bytes-like audio or of a file's contents given its path."""
+    sha = hashlib.sha256()
+    if isinstance(audio, str):
+        with open(audio, 'rb') as f:
+            for block in iter(lambda: f.read(HASH_BUFFER_SIZE), b''):
+                sha.update(block)
+    else:
+        sha.update(audio)
+    return sha.hexdigest()
+
+
+class TranscriptionCache:
+    """
+    LRU of transcription results bounded by entry count and by the encoded
+    size of the results. With `directory` set, results are also written there
+    as JSON and looked up on a memory miss; `disk_max_bytes` caps that
+    directory (0 means unbounded).
+    """
+
+    def __init__(self, version, max_entries=1000, max_bytes=8 * 1024 * 1024,
+                 directory=None, disk_max_bytes=64 * 1024 * 1024):
+        self.version = version
+        self.max_entries = max(1, max_entries)
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.disk_max_bytes = disk_max_bytes
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (result, encoded size)
+        self._bytes = 0
+        self._disk_bytes = None  # unknown until the first scan
+        self._pruned_at = 0.0
+        self._lock = threading.Lock()
+
+    def key(self, audio, language):
+        return hashlib.sha256(f'{audio_digest(audio)}:{language}:{self.version}'.encode()).hexdigest()
+
+    def get(self, key):
+        """Return the cached result dict for `key`, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return dict(entry[0])
+        result = self._disk_get(key)
+        with self._lock:
+            if result is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+            self._remember(key, result, len(json.dumps(result)))
+        return dict(result)
+
+    def put(self, key, result):
+        encoded = json.dumps(result)
+        with self._lock:
+            self._remember(key, result, len(encoded))
+        if self.directory:
+            self._disk_put(key, encoded)
+
+    def _remember(self, key, result, size):
+        if size > self.max_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._bytes -= previous[1]
+        self._entries[key] = (result, size)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _key, (_result, evicted_size) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+            self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+                'persistent': bool(self.directory)
+            }
+
+    # ---- disk persistence ----
+
+    def _disk_path(self, key):
+        return os.path.join(self.directory, key[:2], f'{key}.json')
+
+    def _disk_get(self, key):
+        if not self.directory:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path) as f:
+                result = json.load(f)
+            # mtime doubles as the last-used time for pruning
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return result
+
+    def _disk_put(self, key, encoded):
+        path = self._disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                f.write(encoded)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Transcription cache write failed: {e}")
+            return
+        with self._lock:
+            if self._disk_bytes is not None:
+                self._disk_bytes += len(encoded)
+        self._prune_disk()
+
+    def _prune_disk(self):
+        if self.disk_max_bytes <= 0:
+            return
+        now = time.time()
+        with self._lock:
+            over = self._disk_bytes is None or self._disk_bytes > self.disk_max_bytes
+            if not over or now - self._pruned_at < DISK_PRUNE_INTERVAL:
+                return
+            self._pruned_at = now
+        files = []
+        for dirpath, _dirnames, filenames in os.walk(self.directory):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _mtime, size, _path in files)
+        # Least recently used first, down to 90% of the limit so this does not rerun at once
+        for _mtime, size, path in sorted(files):
+            if total <= self.disk_max_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+        with self._lock:
+            self._disk_bytes = total
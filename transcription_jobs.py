@@ -0,0 +1,383 @@
+"""
+Asynchronous transcription jobs for Voxiscribe.
+/transcribe hands the audio to a pool of worker processes, each holding a
+warm speech engine, and returns a job id at once. Job state lives in small
+JSON files so any web worker can answer a status poll, whichever one
+accepted the upload. With a TranscriptionCache, audio that was already
+transcribed, or is being transcribed right now, never reaches the pool.
+With batching enabled, jobs arriving close together are collected for a
+few milliseconds and run through the engine as one batch.
+"""
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+PRUNE_INTERVAL = 60
+
+
+class QueueFull(Exception):
+    """Raised when accepting another job would exceed the queue limit."""
+
+
+def _state_path(jobs_dir, job_id):
+    return os.path.join(jobs_dir, f'{job_id}.json')
+
+
+def _write_state(jobs_dir, job_id, state):
+    fd, tmp_path = tempfile.mkstemp(dir=jobs_dir, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, _state_path(jobs_dir, job_id))
+
+
+def _run_batch(jobs_dir, jobs):
+    """
+    Runs in a pool process: transcribe [(job_id, audio, language, enqueued_at), ...]
+    in one engine pass, record each job's result and delete audio that was
+    spooled to a file. Small uploads arrive as bytes.
+    """
+    from speech_server import transcribe_batch_with_stats
+    started_at = time.time()
+    states = []
+    for job_id, _audio, _language, enqueued_at in jobs:
+        state = {'job_id': job_id, 'state': 'running', 'enqueued_at': enqueued_at, 'started_at': started_at,
+                 'wait_ms': round((started_at - enqueued_at) * 1000, 1)}
+        _write_state(jobs_dir, job_id, state)
+        states.append(state)
+    try:
+        results = transcribe_batch_with_stats([(audio, language) for _job_id, audio, language, _enqueued_at in jobs])
+    except Exception as e:
+        results = [e] * len(jobs)
+    finally:
+        for _job_id, audio, _language, _enqueued_at in jobs:
+            if isinstance(audio, str):
+                try:
+                    os.remove(audio)
+                except OSError:
+                    pass
+    finished_at = time.time()
+    for state, result in zip(states, results):
+        if isinstance(result, Exception):
+            state.update({'state': 'failed', 'error': str(result)})
+        else:
+            text, stats = result
+            state.update({'state': 'done', 'text': (text or '').strip(), 'latency': stats})
+        state['finished_at'] = finished_at
+        state['run_ms'] = round((finished_at - started_at) * 1000, 1)
+        _write_state(jobs_dir, state['job_id'], state)
+    return states
+
+
+def _run_job(jobs_dir, job_id, audio, language, enqueued_at):
+    """Runs in a pool process: transcribe a single job."""
+    return _run_batch(jobs_dir, [(job_id, audio, language, enqueued_at)])[0]
+
+
+class TranscriptionJobQueue:
+    """
+    Bounded job queue in front of a ProcessPoolExecutor.
+    At most `workers + max_queue` jobs are outstanding per web process;
+    beyond that submit() raises QueueFull so the caller can answer 429.
+
+    With batch_size > 1, jobs wait in a local buffer instead of the pool's
+    queue. A batch is dispatched once a pool process is free and either
+    `batch_size` jobs are waiting or the oldest has waited `batch_wait_ms`,
+    so batches grow by themselves while the pool is busy.
+    """
+
+    def __init__(self, jobs_dir, workers=2, max_queue=16, job_ttl_seconds=3600, start_method='spawn', cache=None,
+                 batch_size=1, batch_wait_ms=0):
+        self.jobs_dir = jobs_dir
+        self.workers = max(1, workers)
+        self.max_queue = max_queue
+        self.job_ttl = job_ttl_seconds
+        self.start_method = start_method
+        self.outstanding = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.coalesced = 0
+        self.cache = cache
+        self._inflight = {}  # cache key -> job id of the pending job for that audio
+        self._waits = deque(maxlen=200)
+        self._runs = deque(maxlen=200)
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pruned_at = 0.0
+        self.batch_size = max(1, batch_size)
+        self.batch_wait = batch_wait_ms / 1000.0
+        self._pending = deque()  # (job_id, audio, language, enqueued_at, cache_key, monotonic arrival)
+        self._batches_running = 0
+        self._batch_sizes = deque(maxlen=200)
+        self._batch_ready = threading.Condition(self._lock)
+        self._batcher = None
+
+    def _get_executor(self):
+        # Created lazily so every gunicorn worker builds its own pool after fork
+        if self._executor is None:
+            from speech_server import preload_engine
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context(self.start_method),
+                initializer=preload_engine
+            )
+        return self._executor
+
+    def warm(self):
+        """
+        Start the pool processes now so they load the speech engine before the
+        first request; does not wait for them. The calling process never loads it.
+        """
+        with self._lock:
+            executor = self._get_executor()
+        # Each submit that finds no idle process starts a new one, up to `workers`
+        for _ in range(self.workers):
+            executor.submit(os.getpid)
+
+    def new_audio_path(self, suffix=''):
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        fd, path = tempfile.mkstemp(dir=self.jobs_dir, suffix=suffix)
+        os.close(fd)
+        return path
+
+    def submit(self, audio, language='en'):
+        """
+        Queue a transcription and return its id. `audio` is bytes, or the path
+        of a spooled file which the job deletes.
+        """
+        self._prune()
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self.cache.key(audio, language)
+            job_id = self._answer_from_cache(cache_key, audio)
+            if job_id is not None:
+                return job_id
+        self._reserve()
+        job_id = uuid.uuid4().hex
+        enqueued_at = time.time()
+        try:
+            _write_state(self.jobs_dir, job_id, {'job_id': job_id, 'state': 'queued', 'enqueued_at': enqueued_at})
+            if cache_key is not None:
+                # Registered before dispatch so a fast job cannot finish first
+                with self._lock:
+                    self._inflight[cache_key] = job_id
+            if self.batch_size > 1:
+                self._add_to_batch(job_id, audio, language, enqueued_at, cache_key)
+            else:
+                future = self._submit_to_pool(_run_job, (self.jobs_dir, job_id, audio, language, enqueued_at))
+                future.add_done_callback(lambda f: self._job_finished(job_id, audio, enqueued_at, f, cache_key))
+        except Exception:
+            with self._lock:
+                self._inflight.pop(cache_key, None)
+            self._release()
+            raise
+        return job_id
+
+    def _answer_from_cache(self, cache_key, audio):
+        # A retry of audio still in flight shares the pending job; known audio gets a finished one
+        with self._lock:
+            job_id = self._inflight.get(cache_key)
+            if job_id is not None:
+                self.coalesced += 1
+        if job_id is None:
+            result = self.cache.get(cache_key)
+            if result is None:
+                return None
+            job_id = uuid.uuid4().hex
+            now = time.time()
+            _write_state(self.jobs_dir, job_id, {
+                'job_id': job_id, 'state': 'done', 'cached': True, 'enqueued_at': now, 'finished_at': now,
+                'text': result['text'], 'latency': dict(result.get('latency') or {}, cached=True)
+            })
+        if isinstance(audio, str):
+            os.remove(audio)
+        return job_id
+
+    def call(self, fn, *args, timeout=None):
+        """
+        Run a module-level fn(*args) on the pool and wait for its result.
+        Shares the queue limit with submit(); raises QueueFull when saturated
+        and concurrent.futures.TimeoutError if `timeout` runs out first.
+        """
+        return self.call_async(fn, *args).result(timeout)
+
+    def call_async(self, fn, *args):
+        """Like call(), but return the future instead of waiting for it."""
+        self._reserve()
+        try:
+            future = self._submit_to_pool(fn, args)
+        except Exception:
+            self._release()
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    def _reserve(self):
+        with self._lock:
+            if self.outstanding >= self.workers + self.max_queue:
+                self.rejected += 1
+                raise QueueFull(f'{self.outstanding} transcription jobs already queued')
+            self.outstanding += 1
+
+    def _release(self, _future=None):
+        with self._lock:
+            self.outstanding -= 1
+
+    def _submit_to_pool(self, fn, args):
+        try:
+            with self._lock:
+                executor = self._get_executor()
+            return executor.submit(fn, *args)
+        except BrokenProcessPool:
+            # A pool process died; start a fresh pool and retry once
+            with self._lock:
+                self._executor = None
+                executor = self._get_executor()
+            return executor.submit(fn, *args)
+
+    # ---- batching ----
+
+    def _add_to_batch(self, job_id, audio, language, enqueued_at, cache_key):
+        with self._batch_ready:
+            self._pending.append((job_id, audio, language, enqueued_at, cache_key, time.monotonic()))
+            if self._batcher is None:
+                # Started lazily so it belongs to the forked web worker, like the pool
+                self._batcher = threading.Thread(target=self._batch_loop, name='transcription-batcher', daemon=True)
+                self._batcher.start()
+            self._batch_ready.notify()
+
+    def _next_batch(self):
+        with self._batch_ready:
+            while True:
+                if self._pending and self._batches_running < self.workers:
+                    wait = self._pending[0][5] + self.batch_wait - time.monotonic()
+                    if len(self._pending) >= self.batch_size or wait <= 0:
+                        break
+                    self._batch_ready.wait(wait)
+                else:
+                    self._batch_ready.wait()
+            batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+            self._batches_running += 1
+            self._batch_sizes.append(len(batch))
+            return batch
+
+    def _batch_loop(self):
+        while True:
+            batch = self._next_batch()
+            jobs = [(job_id, audio, language, enqueued_at) for job_id, audio, language, enqueued_at, _key, _t in batch]
+            try:
+                future = self._submit_to_pool(_run_batch, (self.jobs_dir, jobs))
+            except Exception as e:
+                self._batch_finished(batch, None, e)
+                continue
+            future.add_done_callback(lambda f, batch=batch: self._batch_finished(batch, f))
+
+    def _batch_finished(self, batch, future, error=None):
+        with self._batch_ready:
+            self._batches_running -= 1
+            self._batch_ready.notify()
+        states = None
+        if future is not None:
+            try:
+                states = future.result()
+            except Exception as e:
+                error = e
+        for index, (job_id, audio, _language, enqueued_at, cache_key, _t) in enumerate(batch):
+            self._record_result(job_id, audio, enqueued_at, cache_key, states[index] if states else None, error)
+
+    # ---- results ----
+
+    def _job_finished(self, job_id, audio, enqueued_at, future, cache_key=None):
+        try:
+            state, error = future.result(), None
+        except Exception as e:
+            state, error = None, e
+        self._record_result(job_id, audio, enqueued_at, cache_key, state, error)
+
+    def _record_result(self, job_id, audio, enqueued_at, cache_key, state, error):
+        self._release()
+        if state is None:
+            # The pool process died before it could record anything
+            state = {'job_id': job_id, 'state': 'failed', 'enqueued_at': enqueued_at, 'error': str(error)}
+            _write_state(self.jobs_dir, job_id, state)
+            if isinstance(audio, str) and os.path.exists(audio):
+                os.remove(audio)
+            if isinstance(error, BrokenProcessPool):
+                with self._lock:
+                    self._executor = None
+        if cache_key is not None:
+            if state['state'] == 'done':
+                self.cache.put(cache_key, {
+                    'text': state['text'],
+                    'latency': {'audio_seconds': state.get('latency', {}).get('audio_seconds')}
+                })
+            with self._lock:
+                self._inflight.pop(cache_key, None)
+        with self._lock:
+            if state['state'] == 'done':
+                self.completed += 1
+            else:
+                self.failed += 1
+            if 'wait_ms' in state:
+                self._waits.append(state['wait_ms'])
+                self._runs.append(state['run_ms'])
+
+    def close(self):
+        """Shut the pool down; used by scripts, the web app keeps its pool for life."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def get(self, job_id):
+        """Return the job's state dict, or None for unknown or expired ids."""
+        if not job_id.isalnum():
+            return None
+        try:
+            with open(_state_path(self.jobs_dir, job_id)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def stats(self):
+        cache = self.cache.stats() if self.cache is not None else None
+        with self._lock:
+            waits, runs, batches = list(self._waits), list(self._runs), list(self._batch_sizes)
+            return {
+                'workers': self.workers,
+                'queue_limit': self.max_queue,
+                'outstanding': self.outstanding,
+                'queue_depth': max(self.outstanding - self.workers, 0),
+                'completed': self.completed,
+                'failed': self.failed,
+                'rejected': self.rejected,
+                'coalesced': self.coalesced,
+                'batch_size': self.batch_size,
+                'batch_wait_ms': round(self.batch_wait * 1000, 1),
+                'batching': len(self._pending),
+                'avg_batch': round(sum(batches) / len(batches), 2) if batches else None,
+                'cache': cache,
+                'avg_wait_ms': round(sum(waits) / len(waits), 1) if waits else None,
+                'max_wait_ms': max(waits) if waits else None,
+                'avg_run_ms': round(sum(runs) / len(runs), 1) if runs else None
+            }
+
+    def _prune(self):
+        now = time.time()
+        if now - self._pruned_at < PRUNE_INTERVAL:
+            return
+        self._pruned_at = now
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        for entry in os.scandir(self.jobs_dir):
+            try:
+                if now - entry.stat().st_mtime > self.job_ttl:
+                    os.remove(entry.path)
+            except OSError:
+                continue
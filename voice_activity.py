@@ -0,0 +1,110 @@
+"""
+Voice-activity detection for Voxiscribe transcription.
+Audio is cut into short frames and each frame's energy and zero-crossing
+rate are computed with NumPy. Frames well above the clip's own noise floor,
+or moderately loud and noisy ones like fricatives, count as speech. Leading,
+trailing and long internal silences are removed, and long clips are split at
+pauses into segments the engine can transcribe independently.
+"""
+import numpy as np
+
+FRAME_MS = 30
+# Speech must rise this far above the quietest frames of the clip
+ENERGY_MARGIN_DB = 10.0
+# Clips with less dynamic range than this have no silence worth cutting
+MIN_DYNAMIC_RANGE_DB = 6.0
+# Frames at or below this level are silence whatever the noise floor
+ABSOLUTE_FLOOR_DB = -60.0
+# Fricatives are quiet but cross zero often
+FRICATIVE_ZCR = 0.25
+FRICATIVE_MARGIN_DB = 4.0
+
+
+def frame_features(pcm, sample_rate, frame_ms=FRAME_MS):
+    """Return (energy_db, zero_crossing_rate, frame_length) for consecutive frames."""
+    frame_len = max(1, int(sample_rate * frame_ms / 1000))
+    count = len(pcm) // frame_len
+    if count == 0:
+        return np.empty(0), np.empty(0), frame_len
+    frames = np.asarray(pcm[:count * frame_len], dtype=np.float32).reshape(count, frame_len)
+    energy_db = 10.0 * np.log10(np.mean(frames * frames, axis=1) + 1e-10)
+    signs = np.signbit(frames)
+    zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / frame_len
+    return energy_db, zcr, frame_len
+
+
+def _runs(mask):
+    """Start and end (exclusive) indices of the True runs in a boolean array."""
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+def detect_speech(pcm, sample_rate, min_speech_ms=90, min_silence_ms=500, pad_ms=200):
+    """
+    Return [(start_sample, end_sample), ...] of speech in `pcm`.
+    Pauses shorter than `min_silence_ms` stay inside a region, bursts shorter
+    than `min_speech_ms` are dropped and every region is widened by `pad_ms`
+    so word onsets and endings are not clipped.
+    """
+    energy_db, zcr, frame_len = frame_features(pcm, sample_rate)
+    if not len(energy_db):
+        return []
+    energy_db = np.maximum(energy_db, ABSOLUTE_FLOOR_DB)
+    # Noise floor from the quietest frames; a short pause in a long clip still counts
+    floor = min(np.percentile(energy_db, 5), energy_db.min() + ENERGY_MARGIN_DB)
+    if energy_db.max() - floor < MIN_DYNAMIC_RANGE_DB:
+        # Uniform clip: all speech or all silence
+        return [(0, len(pcm))] if floor > ABSOLUTE_FLOOR_DB else []
+    threshold = max(floor + ENERGY_MARGIN_DB, ABSOLUTE_FLOOR_DB)
+    speech = energy_db > threshold
+    speech |= (energy_db > max(floor + FRICATIVE_MARGIN_DB, ABSOLUTE_FLOOR_DB)) & (zcr > FRICATIVE_ZCR)
+
+    starts, ends = _runs(speech)
+    keep = ends - starts >= max(1, min_speech_ms // FRAME_MS)
+    starts, ends = starts[keep], ends[keep]
+    if not len(starts):
+        return []
+    # Bridge short pauses, and any gap the padding below would close anyway
+    gap_frames = max(1, min_silence_ms // FRAME_MS, 2 * pad_ms // FRAME_MS + 1)
+    bridged = np.flatnonzero(starts[1:] - ends[:-1] >= gap_frames)
+    starts = np.concatenate(([starts[0]], starts[bridged + 1]))
+    ends = np.concatenate((ends[bridged], [ends[-1]]))
+
+    pad = int(sample_rate * pad_ms / 1000)
+    return [(max(0, int(start) * frame_len - pad), min(len(pcm), int(end) * frame_len + pad))
+            for start, end in zip(starts, ends)]
+
+
+def _split_region(pcm, start, end, max_len, sample_rate):
+    # Cut an unbroken region at its quietest frame near the end of each window
+    pieces = []
+    while end - start > max_len:
+        window_start = start + max_len * 2 // 3
+        energy_db, _zcr, frame_len = frame_features(pcm[window_start:start + max_len], sample_rate)
+        cut = window_start + (int(np.argmin(energy_db)) * frame_len if len(energy_db) else 0)
+        pieces.append((start, cut))
+        start = cut
+    pieces.append((start, end))
+    return pieces
+
+
+def speech_segments(pcm, sample_rate, max_segment_seconds=30, **detect_options):
+    """
+    Return the speech in `pcm` as a list of arrays of at most
+    `max_segment_seconds`, each made of consecutive speech regions with the
+    silence between them removed. An empty list means the clip is silent.
+    """
+    max_len = int(max_segment_seconds * sample_rate)
+    regions = []
+    for start, end in detect_speech(pcm, sample_rate, **detect_options):
+        regions.extend(_split_region(pcm, start, end, max_len, sample_rate))
+    segments, current, current_len = [], [], 0
+    for start, end in regions:
+        if current and current_len + end - start > max_len:
+            segments.append(np.concatenate(current))
+            current, current_len = [], 0
+        current.append(pcm[start:end])
+        current_len += end - start
+    if current:
+        segments.append(np.concatenate(current))
+    return segments